@@ -1,5 +1,6 @@
 from .lcd import CharLCD
 from .lcd import Alignment, CursorMode, ShiftMode
-from .contextmanagers import cursor, cleared
+from .contextmanagers import cursor, cleared, batched
 from .lcd import BacklightMode
-
+from .lcd import ParallelBus, I2CBus, WaveBus
+from .multi import SharedBus, LCDGroup
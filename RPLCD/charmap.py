@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Unicode to HD44780 character ROM.
+
+HD44780 controllers come with one of two character ROMs: A00 (japanese,
+katakana and greek letters in the upper half) or A02 (european, close to
+ISO-8859-1). A :class:`Charmap` turns a string into the bytes to send for
+one of them in a single ``bytes.translate`` call (``str.translate`` for
+strings outside ISO-8859-1):
+
+- characters of the ROM map to their code,
+- custom glyphs map to their CGRAM location (0-7),
+- other characters fall back to their base letter (``é`` => ``e``) when
+  the ROM has it, else to ``?``.
+
+The tables are built once per ROM and set of glyphs; fallbacks outside
+ISO-8859-1 are worked out the first time a character is met and kept in
+the table.
+
+Example:
+
+>>> charmap = Charmap('A00', FRENCH_GLYPHS)
+>>> charmap.encode('Durée 5°')
+b'Dur\\x02e 5\\xdf'
+
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import re
+import unicodedata
+
+# Characters of the A00 ROM outside ASCII, the backslash and the tilde
+# are replaced by the yen sign and the arrows
+A00_EXTRA = {
+    '¥': 0x5C, '→': 0x7E, '←': 0x7F, '°': 0xDF,
+    'α': 0xE0, 'ä': 0xE1, 'β': 0xE2, 'ε': 0xE3, 'μ': 0xE4, 'σ': 0xE5, 'ρ': 0xE6,
+    '√': 0xE8, '¢': 0xEC, 'ñ': 0xEE, 'ö': 0xEF, 'θ': 0xF2, '∞': 0xF3, 'Ω': 0xF4,
+    'ü': 0xF5, 'Σ': 0xF6, 'π': 0xF7, '÷': 0xFD, '█': 0xFF
+}
+
+# Typographic characters written with ASCII
+PUNCTUATION = {
+    '‘': "'", '’': "'", '“': '"', '”': '"', '«': '"', '»': '"',
+    '–': '-', '—': '-', '…': '.', ' ': ' '
+}
+
+# CGRAM glyphs for the french menu text on an A00 ROM
+FRENCH_GLYPHS = {
+    'é': (0b00010, 0b00100, 0b01110, 0b10001, 0b11111, 0b10000, 0b01110, 0b00000),
+    'è': (0b01000, 0b00100, 0b01110, 0b10001, 0b11111, 0b10000, 0b01110, 0b00000),
+    'à': (0b01000, 0b00100, 0b01110, 0b00001, 0b01111, 0b10001, 0b01111, 0b00000)
+}
+
+# Splits device bytes around the line breaks, keeping them
+LINEBREAKS = re.compile(b'([\n\r])')
+
+
+def rom_table(rom):
+    """Character => code of the ``rom`` ('A00' or 'A02') character ROM."""
+    if rom == 'A00':
+        table = dict((chr(code), code) for code in range(0x20, 0x7E) if code != 0x5C)
+        table.update(A00_EXTRA)
+    elif rom == 'A02':
+        table = dict((chr(code), code) for code in range(0x20, 0x7F))
+        table.update((chr(code), code) for code in range(0xA0, 0x100))
+    else:
+        raise ValueError('Unknown character ROM: {!r}, use A00 or A02'.format(rom))
+    return table
+
+
+class _Table(dict):
+    """Code point => device character, filled with the fallbacks as they are met."""
+
+    def __init__(self, codes):
+        super(_Table, self).__init__()
+        self.codes = codes  # Character => device code
+        self.update((ord(char), chr(code)) for char, code in codes.items())
+
+    def __missing__(self, point):
+        char = chr(point)
+        fallback = PUNCTUATION.get(char)
+        if fallback is None:
+            base = unicodedata.normalize('NFKD', char)[:1]
+            fallback = base if base != char and base in self.codes else '?'
+        value = self[point] = chr(self.codes.get(fallback, 0x3F))
+        return value
+
+
+class Charmap(object):
+    """Encodes strings for one character ROM and set of custom glyphs.
+
+    Args:
+        rom:
+            The character ROM of the controller, 'A00' or 'A02'.
+        glyphs:
+            Character => 5x8 bitmap, at most 8. They take the CGRAM
+            locations 0-7 in the order of their characters, see
+            :attr:`glyphs`. Default: None.
+
+    """
+
+    def __init__(self, rom='A00', glyphs=None):
+        glyphs = glyphs or {}
+        if len(glyphs) > 8:
+            raise ValueError('The HD44780 only has 8 custom characters.')
+
+        codes = rom_table(rom)
+        # Line breaks are handled by CharLCD, the CGRAM can be written to directly
+        codes.update((chr(code), code) for code in range(0x08))
+        codes.update({'\n': 0x0A, '\r': 0x0D})
+        self.glyphs = []  # (location, bitmap) to upload
+        for location, char in enumerate(sorted(glyphs)):
+            codes[char] = location
+            self.glyphs.append((location, glyphs[char]))
+
+        self.rom = rom
+        self.table = _Table(codes)
+        # The same for ISO-8859-1 strings, the usual case, through bytes.translate
+        self.latin1 = bytes(bytearray(ord(self.table[point]) for point in range(0x100)))
+
+    def encode(self, value):
+        """The device bytes of ``value``."""
+        try:
+            return value.encode('latin-1').translate(self.latin1)
+        except UnicodeEncodeError:
+            return value.translate(self.table).encode('latin-1')
+
+
+_charmaps = {}  # (rom, glyphs) => Charmap
+
+
+def get_charmap(rom='A00', glyphs=None):
+    """The shared :class:`Charmap` of ``rom`` and ``glyphs``."""
+    key = (rom, tuple(sorted((glyphs or {}).items())))
+    charmap = _charmaps.get(key)
+    if charmap is None:
+        charmap = _charmaps[key] = Charmap(rom, glyphs)
+    return charmap
@@ -38,3 +38,26 @@ def cleared(lcd):
     """
     lcd.clear()
     yield
+
+
+@contextmanager
+def batched(lcd):
+    """Context manager to send everything written inside as one batch.
+
+    Buses that can transfer several bytes at once (I2C block writes, pigpio
+    waves) then get a whole frame in a single call.
+
+    Example:
+
+    >>> with batched(lcd):
+        lcd.cursor_pos = (0, 0)
+        lcd.write_string('First row')
+        lcd.cursor_pos = (1, 0)
+        lcd.write_string('Second row')
+
+    """
+    lcd._begin_batch()
+    try:
+        yield
+    finally:
+        lcd._end_batch()
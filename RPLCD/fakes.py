@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+Stand-in devices to exercise the LCD buses without the hardware.
+
+:class:`HD44780` models just enough of the controller to decode what a bus
+sends back into DDRAM contents, the other classes feed it.
+
+Example:
+
+>>> from RPLCD.fakes import FakeSMBus
+>>> smbus = FakeSMBus()
+>>> lcd = CharLCD(bus=I2CBus(bus=smbus))
+>>> lcd.write_string('Hello')
+>>> smbus.lcd.lines()[0]
+'Hello               '
+
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import sys
+import time
+import types
+
+from . import lcd as _lcd
+from .lcd import (LCD_CLEARDISPLAY, LCD_RETURNHOME, LCD_ENTRYMODESET, LCD_DISPLAYCONTROL,
+                  LCD_CURSORSHIFT, LCD_FUNCTIONSET, LCD_SETCGRAMADDR, LCD_SETDDRAMADDR,
+                  LCD_ENTRYLEFT, LCD_8BITMODE, LCD_DISPLAYON, PCF_RS, PCF_E, PCF_BACKLIGHT)
+
+
+class HD44780(object):
+    """Minimal HD44780 model fed with nibbles or bytes as latched on E."""
+
+    def __init__(self, rows=4, cols=20):
+        self.rows = rows
+        self.cols = cols
+        self.ddram = bytearray(b' ' * 0x68)
+        self.cgram = bytearray(64)
+        self.address = 0
+        self.cgram_mode = False
+        self.increment = True
+        self.display_on = False
+        self.four_bit = False
+        self._high = None  # First nibble of a byte in 4 bit mode
+        self.commands = 0
+        self.data = 0
+
+    def nibble(self, rs, value):
+        """Latch a nibble on D4-D7."""
+        value &= 0x0F
+        if not self.four_bit:
+            # Still in 8 bit mode, the lower data lines are not wired
+            self.byte(rs, value << 4)
+        elif self._high is None:
+            self._high = value
+        else:
+            high, self._high = self._high, None
+            self.byte(rs, high << 4 | value)
+
+    def byte(self, rs, value):
+        """Latch a full byte."""
+        if rs:
+            self.data += 1
+            if self.cgram_mode:
+                self.cgram[self.address & 0x3F] = value
+                self.address = (self.address + 1) & 0x3F
+            else:
+                self.ddram[self.address] = value
+                self._move(1 if self.increment else -1)
+            return
+
+        self.commands += 1
+        if value & LCD_SETDDRAMADDR:
+            self.cgram_mode = False
+            self.address = value & 0x7F
+        elif value & LCD_SETCGRAMADDR:
+            self.cgram_mode = True
+            self.address = value & 0x3F
+        elif value & LCD_FUNCTIONSET:
+            self.four_bit = not value & LCD_8BITMODE
+            self._high = None
+        elif value & LCD_CURSORSHIFT:
+            pass
+        elif value & LCD_DISPLAYCONTROL:
+            self.display_on = bool(value & LCD_DISPLAYON)
+        elif value & LCD_ENTRYMODESET:
+            self.increment = bool(value & LCD_ENTRYLEFT)
+        elif value & LCD_RETURNHOME:
+            self.cgram_mode = False
+            self.address = 0
+        elif value & LCD_CLEARDISPLAY:
+            self.ddram[:] = b' ' * len(self.ddram)
+            self.cgram_mode = False
+            self.address = 0
+            self.increment = True
+
+    def _move(self, step):
+        # In 2 line mode DDRAM is 0x00-0x27 and 0x40-0x67
+        address = self.address + step
+        if address == 0x28:
+            address = 0x40
+        elif address == 0x68:
+            address = 0x00
+        elif address == -1:
+            address = 0x67
+        elif address == 0x3F:
+            address = 0x27
+        self.address = address
+
+    def row_offsets(self):
+        return [0x00, 0x40, self.cols, 0x40 + self.cols][:self.rows]
+
+    def rows_bytes(self):
+        """DDRAM contents as one bytes object per visible row."""
+        return [bytes(self.ddram[o:o + self.cols]) for o in self.row_offsets()]
+
+    def lines(self):
+        """DDRAM contents as one string per visible row."""
+        return [row.decode('latin-1') for row in self.rows_bytes()]
+
+
+class FakeSMBus(object):
+    """``smbus.SMBus`` stand-in with a PCF8574 backpack and HD44780 behind it.
+
+    Every transfer is recorded in ``transactions`` as ``(address, bytes)``.
+
+    """
+
+    def __init__(self, rows=4, cols=20, address=0x27):
+        self.address = address
+        self.lcd = HD44780(rows=rows, cols=cols)
+        self.transactions = []
+        self.backlight = False
+        self._port = 0
+
+    def write_byte(self, addr, value):
+        self._write(addr, [value])
+
+    def write_i2c_block_data(self, addr, cmd, vals):
+        self._write(addr, [cmd] + list(vals))
+
+    def close(self):
+        pass
+
+    def _write(self, addr, data):
+        if addr != self.address:
+            raise IOError('No device at address 0x{:02x}'.format(addr))
+        self.transactions.append((addr, bytes(bytearray(data))))
+        for port in data:
+            # The controller latches the data lines on the falling edge of E
+            if self._port & PCF_E and not port & PCF_E:
+                self.lcd.nibble(self._port & PCF_RS, self._port >> 4)
+            self._port = port
+            self.backlight = bool(port & PCF_BACKLIGHT)
+
+    @property
+    def bytes_sent(self):
+        return sum(len(data) for _, data in self.transactions)
+
+
+class FakePigpio(object):
+    """``pigpio.pi`` stand-in playing waves into an :class:`HD44780`.
+
+    Waves are decoded as soon as they are sent. ``wave_tx_busy`` stays true
+    for the summed pulse delays so callers see realistic transfer times.
+
+    Args:
+        pin_rs, pin_e, pins_data:
+            BCM pins wired to the controller, as given to ``WaveBus``.
+
+    """
+
+    def __init__(self, pin_rs=22, pin_e=23, pins_data=[9, 25, 11, 8], rows=4, cols=20):
+        self.lcd = HD44780(rows=rows, cols=cols)
+        self.pin_rs = pin_rs
+        self.pin_e = pin_e
+        self.pins_data = list(pins_data)
+        self.levels = 0
+        self.modes = {}
+        self.waves_sent = 0
+        self.pulses_sent = 0
+        self.wave_time_us = 0
+        self.connected = True
+        self._pending = []
+        self._waves = {}
+        self._next_id = 0
+        self._busy_until = 0
+
+    def set_mode(self, gpio, mode):
+        self.modes[gpio] = mode
+
+    def write(self, gpio, level):
+        self._apply(1 << gpio if level else 0, 0 if level else 1 << gpio)
+
+    def read(self, gpio):
+        return (self.levels >> gpio) & 0x01
+
+    def wave_clear(self):
+        self._pending = []
+        self._waves = {}
+
+    def wave_add_generic(self, pulses):
+        self._pending.extend(pulses)
+        return len(self._pending)
+
+    def wave_create(self):
+        wave_id, self._next_id = self._next_id, self._next_id + 1
+        self._waves[wave_id], self._pending = self._pending, []
+        return wave_id
+
+    def wave_send_once(self, wave_id):
+        pulses = self._waves[wave_id]
+        duration = 0
+        for pulse in pulses:
+            self._apply(pulse.gpio_on, pulse.gpio_off)
+            duration += pulse.delay
+        self.waves_sent += 1
+        self.pulses_sent += len(pulses)
+        self.wave_time_us += duration
+        self._busy_until = time.time() + duration / 1000000.0
+        return len(pulses)
+
+    def wave_tx_busy(self):
+        return int(time.time() < self._busy_until)
+
+    def wave_delete(self, wave_id):
+        del self._waves[wave_id]
+
+    def stop(self):
+        self.connected = False
+
+    def _apply(self, on, off):
+        before = self.levels
+        self.levels = (before | on) & ~off
+        e_mask = 1 << self.pin_e
+        if before & e_mask and not self.levels & e_mask:
+            _latch(self.lcd, before, self.pin_rs, self.pins_data)
+
+
+def _latch(controller, levels, pin_rs, pins_data):
+    rs = (levels >> pin_rs) & 0x01
+    value = 0
+    for i, pin in enumerate(pins_data):
+        value |= ((levels >> pin) & 0x01) << i
+    if len(pins_data) == 8:
+        controller.byte(rs, value)
+    else:
+        controller.nibble(rs, value)
+
+
+class FakeGPIO(types.ModuleType):
+    """``RPi.GPIO`` stand-in counting calls and keeping pin levels.
+
+    Use :func:`install_fake_gpio` to make it importable as ``RPi.GPIO``.
+    Call :meth:`attach_lcd` to decode the parallel bus into an
+    :class:`HD44780`.
+
+    """
+
+    BOARD = 10
+    BCM = 11
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        super(FakeGPIO, self).__init__(str('RPi.GPIO'))
+        self.reset()
+
+    def reset(self):
+        self.mode = None
+        self.levels = {}
+        self.directions = {}
+        self.callbacks = {}
+        self.calls = 0
+        self.lcd = None  # The first attached controller
+        self._lcds = {}  # E pin => (controller, pin_rs, pins_data)
+
+    def attach_lcd(self, pin_rs=15, pin_e=16, pins_data=[21, 22, 23, 24], rows=4, cols=20):
+        """Decode what is latched on ``pin_e`` into a new :class:`HD44780`.
+        Several controllers can share RS and the data lines."""
+        controller = HD44780(rows=rows, cols=cols)
+        self._lcds[pin_e] = (controller, pin_rs, list(pins_data))
+        if self.lcd is None:
+            self.lcd = controller
+        return controller
+
+    def setwarnings(self, flag):
+        self.calls += 1
+
+    def setmode(self, mode):
+        self.calls += 1
+        self.mode = mode
+
+    def setup(self, channel, direction, pull_up_down=None, initial=None):
+        self.calls += 1
+        self.directions[channel] = direction
+        if direction == self.IN:
+            self.levels[channel] = self.LOW if pull_up_down == self.PUD_DOWN else self.HIGH
+        elif initial is not None:
+            self.levels[channel] = initial
+        else:
+            self.levels.setdefault(channel, self.LOW)
+
+    def output(self, channel, value):
+        self.calls += 1
+        value = 1 if value else 0
+        # Like RPi.GPIO, a list of channels is set with one call
+        for channel in channel if isinstance(channel, (list, tuple)) else [channel]:
+            attached = self._lcds.get(channel)
+            if attached is not None and self.levels.get(channel) and not value:
+                levels = 0
+                for pin, level in self.levels.items():
+                    levels |= (1 if level else 0) << pin
+                _latch(attached[0], levels, attached[1], attached[2])
+            self.levels[channel] = value
+
+    def input(self, channel):
+        self.calls += 1
+        return self.levels.get(channel, self.LOW)
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        self.calls += 1
+        self.callbacks[channel] = callback
+
+    def remove_event_detect(self, channel):
+        self.calls += 1
+        self.callbacks.pop(channel, None)
+
+    def trigger(self, channel):
+        """Fire the edge callback registered on ``channel``."""
+        self.callbacks[channel](channel)
+
+    def cleanup(self, channel=None):
+        self.calls += 1
+        self.levels = {}
+        self.directions = {}
+        self.callbacks = {}
+
+
+def install_fake_gpio():
+    """Register a :class:`FakeGPIO` as ``RPi.GPIO`` and return it."""
+    gpio = FakeGPIO()
+    package = types.ModuleType(str('RPi'))
+    package.GPIO = gpio
+    sys.modules['RPi'] = package
+    sys.modules['RPi.GPIO'] = gpio
+    _lcd.GPIO = gpio
+    return gpio
@@ -25,9 +25,14 @@ from __future__ import print_function, division, absolute_import, unicode_litera
 import time
 from collections import namedtuple
 
-import RPi.GPIO as GPIO
+try:
+    import RPi.GPIO as GPIO
+except ImportError:  # Only needed by the parallel bus, I2C setups can do without
+    GPIO = None
 
 from . import enum
+from .charmap import get_charmap, LINEBREAKS
+from .timing import DELAY
 
 
 # # # PYTHON 3 COMPAT # # #
@@ -86,10 +91,28 @@ LCD_5x8DOTS = 0x00
 RS_INSTRUCTION = 0x00
 RS_DATA = 0x01
 
+# PCF8574 backpack port bits (P0-P7)
+PCF_RS = 0x01
+PCF_RW = 0x02
+PCF_E = 0x04
+PCF_BACKLIGHT = 0x08
+
+# Max number of bytes in one SMBus block transfer (command byte included)
+I2C_BLOCK_SIZE = 32
+
+# pigpio wave timings in microseconds
+WAVE_SETUP_US = 1  # Data and RS setup before E rises
+WAVE_PULSE_US = 1  # E high
+WAVE_NIBBLE_US = 1  # Between the two nibbles of a byte
+WAVE_SETTLE_US = 40  # Commands and writes need > 37us
+WAVE_HOME_US = 1600  # Clear display and return home need 1.52ms
+WAVE_MAX_PULSES = 2000  # Stay well below the daemon limits per wave
+
 
 # # # NAMEDTUPLES # # #
 
 PinConfig = namedtuple('PinConfig', 'rs rw e d0 d1 d2 d3 d4 d5 d6 d7 backlight mode')
+Pulse = namedtuple('Pulse', 'gpio_on gpio_off delay')  # Same fields as ``pigpio.pulse``
 LCDConfig = namedtuple('LCDConfig', 'rows cols dotsize')
 
 
@@ -120,26 +143,343 @@ class BacklightMode(enum.Enum):
 
 def msleep(milliseconds):
     """Sleep the specified amount of milliseconds."""
-    time.sleep(milliseconds / 1000.0)
+    DELAY.wait_ns(int(milliseconds * 1000000))
 
 
 def usleep(microseconds):
-    """Sleep the specified amount of microseconds."""
-    time.sleep(microseconds / 1000000.0)
+    """Sleep the specified amount of microseconds, see :mod:`RPLCD.timing`."""
+    DELAY.wait_ns(int(microseconds * 1000))
+
+
+# # # BUSES # # #
+
+class ParallelBus(object):
+    """HD44780 bus driven pin by pin through ``RPi.GPIO`` in 4 or 8 bit mode.
+
+    A bus only moves bytes to the controller, all the display logic lives in
+    :class:`CharLCD`. Every bus implements ``setup``, ``write4bits``,
+    ``write8bits``, ``send``, ``send_many``, ``set_backlight`` and ``close``.
+
+    """
+
+    def __init__(self, pin_rs=15, pin_rw=18, pin_e=16, pins_data=[21, 22, 23, 24],
+                       pin_backlight=None, backlight_mode=BacklightMode.active_low,
+                       numbering_mode=None):
+        if GPIO is None:
+            raise ImportError('The parallel bus needs the RPi.GPIO module.')
+        if numbering_mode is None:
+            numbering_mode = GPIO.BOARD
+        self.numbering_mode = numbering_mode
+        if len(pins_data) == 4:  # 4 bit mode
+            self.data_bus_mode = LCD_4BITMODE
+            block1 = [None] * 4
+        elif len(pins_data) == 8:  # 8 bit mode
+            self.data_bus_mode = LCD_8BITMODE
+            block1 = pins_data[:4]
+        else:
+            raise ValueError('There should be exactly 4 or 8 data pins.')
+        block2 = pins_data[-4:]
+        self.pins = PinConfig(rs=pin_rs, rw=pin_rw, e=pin_e,
+                              d0=block1[0], d1=block1[1], d2=block1[2], d3=block1[3],
+                              d4=block2[0], d5=block2[1], d6=block2[2], d7=block2[3],
+                              backlight=pin_backlight,
+                              mode=numbering_mode)
+        self.backlight_mode = backlight_mode
+
+    @property
+    def has_backlight(self):
+        return self.pins.backlight is not None
+
+    def setup(self):
+        GPIO.setmode(self.numbering_mode)
+        for pin in list(filter(None, self.pins))[:-1]:
+            GPIO.setup(pin, GPIO.OUT)
+        GPIO.output(self.pins.rs, 0)
+        GPIO.output(self.pins.e, 0)
+        if self.pins.rw is not None:
+            GPIO.output(self.pins.rw, 0)
+
+    def set_backlight(self, value):
+        GPIO.output(self.pins.backlight, value ^ (self.backlight_mode is BacklightMode.active_low))
+
+    def close(self):
+        GPIO.cleanup()
+
+    def send(self, value, mode):
+        """Send the specified value to the display with automatic 4bit / 8bit
+        selection. The rs_mode is either ``RS_DATA`` or ``RS_INSTRUCTION``."""
+
+        # Choose instruction or data mode
+        GPIO.output(self.pins.rs, mode)
+
+        # If the RW pin is used, set it to low in order to write.
+        if self.pins.rw is not None:
+            GPIO.output(self.pins.rw, 0)
+
+        # Write data out in chunks of 4 or 8 bit
+        if self.data_bus_mode == LCD_8BITMODE:
+            self.write8bits(value)
+        else:
+            self.write4bits(value >> 4)
+            self.write4bits(value)
+
+    def send_many(self, items):
+        """Send a sequence of ``(value, mode)`` pairs."""
+        for value, mode in items:
+            self.send(value, mode)
+
+    def write4bits(self, value):
+        """Write 4 bits of data into the data bus."""
+        for i in range(4):
+            bit = (value >> i) & 0x01
+            GPIO.output(self.pins[i + 7], bit)
+        self._pulse_enable()
+
+    def write8bits(self, value):
+        """Write 8 bits of data into the data bus."""
+        for i in range(8):
+            bit = (value >> i) & 0x01
+            GPIO.output(self.pins[i + 3], bit)
+        self._pulse_enable()
+
+    def _pulse_enable(self):
+        """Pulse the `enable` flag to process data."""
+        GPIO.output(self.pins.e, 0)
+        usleep(1)
+        GPIO.output(self.pins.e, 1)
+        usleep(1)
+        GPIO.output(self.pins.e, 0)
+        usleep(100)  # commands need > 37us to settle
+
+
+class I2CBus(object):
+    """HD44780 behind a PCF8574 I2C backpack (4 bit mode only).
+
+    Each nibble becomes two port writes (E high then E low) carrying RS and
+    the backlight bit, and consecutive nibbles are packed into SMBus block
+    transfers. At 100 kHz one port write takes ~90us, which covers both the
+    enable pulse width and the 37us settle time, so no sleeps are needed
+    between bytes.
+
+    Port mapping: P0=RS, P1=RW, P2=E, P3=backlight, P4-P7=D4-D7.
+
+    """
+
+    data_bus_mode = LCD_4BITMODE
+    has_backlight = True
+
+    def __init__(self, address=0x27, port=1, bus=None, backlight_enabled=True):
+        """
+        Args:
+            address:
+                I2C address of the PCF8574. Default: 0x27 (0x3F for PCF8574A).
+            port:
+                I2C bus number, ignored when ``bus`` is given. Default: 1.
+            bus:
+                An ``smbus.SMBus`` compatible object. Default: a new
+                ``smbus.SMBus(port)``.
+            backlight_enabled:
+                Initial backlight state. Default: True.
+
+        """
+        if bus is None:
+            import smbus
+            bus = smbus.SMBus(port)
+        self.address = address
+        self.bus = bus
+        self._backlight = PCF_BACKLIGHT if backlight_enabled else 0
+
+    def setup(self):
+        self.bus.write_byte(self.address, self._backlight)
+
+    def set_backlight(self, value):
+        self._backlight = PCF_BACKLIGHT if value else 0
+        self.bus.write_byte(self.address, self._backlight)
+
+    def close(self):
+        if hasattr(self.bus, 'close'):
+            self.bus.close()
+
+    def _nibble(self, buf, value, rs):
+        port = (value & 0x0F) << 4 | self._backlight | rs
+        buf.append(port | PCF_E)
+        buf.append(port)
+
+    def _encode(self, items):
+        buf = []
+        for value, mode in items:
+            rs = PCF_RS if mode == RS_DATA else 0
+            self._nibble(buf, value >> 4, rs)
+            self._nibble(buf, value, rs)
+        return buf
+
+    def _transfer(self, buf):
+        for i in range(0, len(buf), I2C_BLOCK_SIZE):
+            chunk = buf[i:i + I2C_BLOCK_SIZE]
+            self.bus.write_i2c_block_data(self.address, chunk[0], chunk[1:])
+
+    def send(self, value, mode):
+        self._transfer(self._encode([(value, mode)]))
+
+    def send_many(self, items):
+        """Send a sequence of ``(value, mode)`` pairs in block transfers."""
+        self._transfer(self._encode(items))
+
+    def write4bits(self, value):
+        buf = []
+        self._nibble(buf, value, 0)
+        self._transfer(buf)
+
+    def write8bits(self, value):
+        raise ValueError('The PCF8574 backpack only supports 4 bit mode.')
+
+
+class WaveBus(object):
+    """HD44780 parallel bus driven by pigpio waveforms.
+
+    Instead of toggling the pins from Python and sleeping between edges,
+    every RS, data and E transition of a batch is laid out as a pre-timed
+    pulse train and handed to the pigpio daemon, which plays it through DMA
+    with 1us resolution. A byte takes ~45us on the wire so a full 20x4
+    repaint fits in about 4ms.
+
+    Pins use the BCM numbering, as pigpio does.
+
+    """
+
+    def __init__(self, pin_rs=22, pin_rw=None, pin_e=23, pins_data=[9, 25, 11, 8],
+                       pin_backlight=None, backlight_mode=BacklightMode.active_low,
+                       pi=None, host='localhost', port=8888):
+        """
+        Args:
+            pin_rs, pin_rw, pin_e, pins_data, pin_backlight, backlight_mode:
+                Same as :class:`ParallelBus` but BCM numbered. The defaults
+                are the BCM equivalents of the :class:`ParallelBus` ones.
+            pi:
+                A connected ``pigpio.pi`` compatible object. Default: a new
+                ``pigpio.pi(host, port)``.
+
+        """
+        if len(pins_data) == 4:
+            self.data_bus_mode = LCD_4BITMODE
+        elif len(pins_data) == 8:
+            self.data_bus_mode = LCD_8BITMODE
+        else:
+            raise ValueError('There should be exactly 4 or 8 data pins.')
+        self._own_pi = pi is None
+        if pi is None:
+            import pigpio
+            pi = pigpio.pi(host, port)
+        self.pi = pi
+        self.pin_rs = pin_rs
+        self.pin_rw = pin_rw
+        self.pin_e = pin_e
+        self.pins_data = list(pins_data)
+        self.pin_backlight = pin_backlight
+        self.backlight_mode = backlight_mode
+
+        self._rs_mask = 1 << pin_rs
+        self._e_mask = 1 << pin_e
+        self._data_masks = [1 << pin for pin in pins_data]
+        self._all_data_mask = sum(self._data_masks)
+
+    @property
+    def has_backlight(self):
+        return self.pin_backlight is not None
+
+    def setup(self):
+        pins = [self.pin_rs, self.pin_rw, self.pin_e, self.pin_backlight] + self.pins_data
+        for pin in pins:
+            if pin is not None:
+                self.pi.set_mode(pin, 1)  # pigpio.OUTPUT
+        for pin in (self.pin_rs, self.pin_rw, self.pin_e):
+            if pin is not None:
+                self.pi.write(pin, 0)
+        self.pi.wave_clear()
+
+    def set_backlight(self, value):
+        self.pi.write(self.pin_backlight, value ^ (self.backlight_mode is BacklightMode.active_low))
+
+    def close(self):
+        self.pi.wave_clear()
+        if self._own_pi:
+            self.pi.stop()
+
+    def _chunk(self, pulses, value, rs_mask, settle):
+        """Append the pulses putting ``value`` on the data pins and latching it."""
+        on = rs_mask
+        for i, mask in enumerate(self._data_masks):
+            if (value >> i) & 0x01:
+                on |= mask
+        off = (self._all_data_mask | self._rs_mask | self._e_mask) & ~on
+        pulses.append(Pulse(on, off, WAVE_SETUP_US))
+        pulses.append(Pulse(self._e_mask, 0, WAVE_PULSE_US))
+        pulses.append(Pulse(0, self._e_mask, settle))
+
+    def _encode(self, pulses, value, mode):
+        rs_mask = self._rs_mask if mode == RS_DATA else 0
+        if mode == RS_INSTRUCTION and value in (LCD_CLEARDISPLAY, LCD_RETURNHOME):
+            settle = WAVE_HOME_US
+        else:
+            settle = WAVE_SETTLE_US
+        if self.data_bus_mode == LCD_8BITMODE:
+            self._chunk(pulses, value, rs_mask, settle)
+        else:
+            self._chunk(pulses, value >> 4, rs_mask, WAVE_NIBBLE_US)
+            self._chunk(pulses, value, rs_mask, settle)
+
+    def _transmit(self, pulses):
+        """Play the pulses as one wave and wait until it is done."""
+        for i in range(0, len(pulses), WAVE_MAX_PULSES):
+            chunk = pulses[i:i + WAVE_MAX_PULSES]
+            self.pi.wave_add_generic(chunk)
+            wave_id = self.pi.wave_create()
+            self.pi.wave_send_once(wave_id)
+            time.sleep(sum(p.delay for p in chunk) / 1000000.0)
+            while self.pi.wave_tx_busy():
+                time.sleep(0.0001)
+            self.pi.wave_delete(wave_id)
+
+    def send(self, value, mode):
+        self.send_many([(value, mode)])
+
+    def send_many(self, items):
+        """Send a sequence of ``(value, mode)`` pairs as a single wave."""
+        pulses = []
+        for value, mode in items:
+            self._encode(pulses, value, mode)
+        self._transmit(pulses)
+
+    def write4bits(self, value):
+        pulses = []
+        self._chunk(pulses, value, 0, WAVE_SETTLE_US)
+        self._transmit(pulses)
+
+    def write8bits(self, value):
+        pulses = []
+        self._chunk(pulses, value, 0, WAVE_SETTLE_US)
+        self._transmit(pulses)
 
 
 # # # MAIN # # #
 
 class CharLCD(object):
 
+    __slots__ = ('bus', 'data_bus_mode', 'lcd', '_pending', '_batch_depth', 'bytes_sent',
+                 '_backlight_enabled', '_content', '_blank', '_row_offsets', '_address',
+                 'auto_linebreaks', 'recent_auto_linebreak', '_display_mode', '_cursor_mode',
+                 '_text_align_mode', '_display_shift_mode', '_cursor_pos', 'charmap')
+
     # Init, setup, teardown
 
     def __init__(self, pin_rs=15, pin_rw=18, pin_e=16, pins_data=[21, 22, 23, 24],
                        pin_backlight=None, backlight_mode=BacklightMode.active_low,
                        backlight_enabled=True,
-                       numbering_mode=GPIO.BOARD,
+                       numbering_mode=None,
                        cols=20, rows=4, dotsize=8,
-                       auto_linebreaks=True):
+                       auto_linebreaks=True,
+                       bus=None, initialised=False, content=None,
+                       charmap='A00', glyphs=None):
         """
         Character LCD controller.
 
@@ -181,6 +521,25 @@ class CharLCD(object):
             auto_linebreaks:
                 Whether or not to automatically insert line breaks.
                 Default: True.
+            bus:
+                The bus used to talk to the controller, e.g. an
+                :class:`I2CBus`. When set, all the pin arguments are ignored.
+                Default: a :class:`ParallelBus` built from the pin arguments.
+            initialised:
+                Set this to True when the controller has already been
+                initialised by a previous process, to skip the reset sequence
+                and the clear. The display keeps what it shows. Default: False.
+            content:
+                What the display currently shows, one bytes object per row as
+                returned by :attr:`content`. Only used with ``initialised``.
+                Default: None (blank).
+            charmap:
+                The character ROM of the controller, 'A00' or 'A02', see
+                :mod:`RPLCD.charmap`. Default: 'A00'.
+            glyphs:
+                Custom characters, character => 5x8 bitmap, e.g.
+                :data:`RPLCD.charmap.FRENCH_GLYPHS`. They are written to the
+                CGRAM on init. Default: None.
 
         Returns:
             A :class:`CharLCD` instance.
@@ -188,32 +547,31 @@ class CharLCD(object):
         """
         assert dotsize in [8, 10], 'The ``dotsize`` argument should be either 8 or 10.'
 
+        # Once per process, before the first bus delay
+        if not DELAY.calibrated:
+            DELAY.calibrate()
+
         # Set attributes
-        self.numbering_mode = numbering_mode
-        if len(pins_data) == 4:  # 4 bit mode
-            self.data_bus_mode = LCD_4BITMODE
-            block1 = [None] * 4
-        elif len(pins_data) == 8:  # 8 bit mode
-            self.data_bus_mode = LCD_8BITMODE
-            block1 = pins_data[:4]
-        else:
-            raise ValueError('There should be exactly 4 or 8 data pins.')
-        block2 = pins_data[-4:]
-        self.pins = PinConfig(rs=pin_rs, rw=pin_rw, e=pin_e,
-                              d0=block1[0], d1=block1[1], d2=block1[2], d3=block1[3],
-                              d4=block2[0], d5=block2[1], d6=block2[2], d7=block2[3],
-                              backlight=pin_backlight,
-                              mode=numbering_mode)
-        self.backlight_mode = backlight_mode
+        if bus is None:
+            bus = ParallelBus(pin_rs=pin_rs, pin_rw=pin_rw, pin_e=pin_e, pins_data=pins_data,
+                              pin_backlight=pin_backlight, backlight_mode=backlight_mode,
+                              numbering_mode=numbering_mode)
+        self.bus = bus
+        self.data_bus_mode = bus.data_bus_mode
         self.lcd = LCDConfig(rows=rows, cols=cols, dotsize=dotsize)
+        self.charmap = get_charmap(charmap, glyphs)
 
-        # Setup GPIO
-        GPIO.setmode(self.numbering_mode)
-        for pin in list(filter(None, self.pins))[:-1]:
-            GPIO.setup(pin, GPIO.OUT)
-        if pin_backlight is not None:
-            GPIO.setup(pin_backlight, GPIO.OUT)
-            # must enable the backlight AFTER setting up GPIO
+        # Pending (value, mode) pairs while batching, see _begin_batch()
+        self._pending = None
+        self._batch_depth = 0
+
+        # Bytes sent to the controller (commands and data), for monitoring
+        self.bytes_sent = 0
+
+        # Setup the bus
+        self.bus.setup()
+        if self.bus.has_backlight:
+            # must enable the backlight AFTER setting up the bus
             self.backlight_enabled = backlight_enabled
 
         # Setup initial display configuration
@@ -227,39 +585,47 @@ class CharLCD(object):
             # For some 1 line displays you can select a 10px font.
             displayfunction |= LCD_5x10DOTS
 
-        # Create content cache
-        self._content = [[0x20] * cols for _ in range(rows)]
+        # Create content cache, rows * cols bytes, row after row
+        self._blank = b' ' * (rows * cols)
+        self._content = bytearray(self._blank)
+        if initialised and content is not None:
+            if len(content) != rows or any(len(row) != cols for row in content):
+                raise ValueError('The content should be {} rows of {} bytes.'.format(rows, cols))
+            self._content[:] = b''.join(bytes(row) for row in content)
+
+        # DDRAM address of each row, and the position the controller's
+        # address counter is at (None when unknown)
+        self._row_offsets = [0x00, 0x40, cols, 0x40 + cols]
+        self._address = None
 
         # Set up auto linebreaks
         self.auto_linebreaks = auto_linebreaks
         self.recent_auto_linebreak = False
 
-        # Initialization
-        msleep(50)
-        GPIO.output(self.pins.rs, 0)
-        GPIO.output(self.pins.e, 0)
-        if self.pins.rw is not None:
-            GPIO.output(self.pins.rw, 0)
-
-        # Choose 4 or 8 bit mode
-        if self.data_bus_mode == LCD_4BITMODE:
-            # Hitachi manual page 46
-            self._write4bits(0x03)
-            msleep(4.5)
-            self._write4bits(0x03)
-            msleep(4.5)
-            self._write4bits(0x03)
-            usleep(100)
-            self._write4bits(0x02)
-        elif self.data_bus_mode == LCD_8BITMODE:
-            # Hitachi manual page 45
-            self._write8bits(0x30)
-            msleep(4.5)
-            self._write8bits(0x30)
-            usleep(100)
-            self._write8bits(0x30)
-        else:
-            raise ValueError('Invalid data bus mode: {}'.format(self.data_bus_mode))
+        # Initialization, the controller is already in the right bus mode
+        # when initialised
+        if not initialised:
+            msleep(50)
+
+            # Choose 4 or 8 bit mode
+            if self.data_bus_mode == LCD_4BITMODE:
+                # Hitachi manual page 46
+                self.bus.write4bits(0x03)
+                msleep(4.5)
+                self.bus.write4bits(0x03)
+                msleep(4.5)
+                self.bus.write4bits(0x03)
+                usleep(100)
+                self.bus.write4bits(0x02)
+            elif self.data_bus_mode == LCD_8BITMODE:
+                # Hitachi manual page 45
+                self.bus.write8bits(0x30)
+                msleep(4.5)
+                self.bus.write8bits(0x30)
+                usleep(100)
+                self.bus.write8bits(0x30)
+            else:
+                raise ValueError('Invalid data bus mode: {}'.format(self.data_bus_mode))
 
         # Write configuration to display
         self.command(LCD_FUNCTIONSET | displayfunction)
@@ -272,7 +638,8 @@ class CharLCD(object):
         usleep(50)
 
         # Clear display
-        self.clear()
+        if not initialised:
+            self.clear()
 
         # Configure entry mode
         self._text_align_mode = int(Alignment.left)
@@ -281,10 +648,17 @@ class CharLCD(object):
         self.command(LCD_ENTRYMODESET | self._text_align_mode | self._display_shift_mode)
         usleep(50)
 
+        # The address counter is unknown after a warm start
+        if initialised:
+            self.cursor_pos = (0, 0)
+
+        for location, bitmap in self.charmap.glyphs:
+            self.create_char(location, bitmap)
+
     def close(self, clear=False):
         if clear:
             self.clear()
-        GPIO.cleanup()
+        self.bus.close()
 
     # Properties
 
@@ -297,10 +671,9 @@ class CharLCD(object):
         if value[0] not in range(self.lcd.rows) or value[1] not in range(self.lcd.cols):
             msg = 'Cursor position {pos!r} invalid on a {lcd.rows}x{lcd.cols} LCD.'
             raise ValueError(msg.format(pos=value, lcd=self.lcd))
-        row_offsets = [0x00, 0x40, self.lcd.cols, 0x40 + self.lcd.cols]
-        self._cursor_pos = value
-        self.command(LCD_SETDDRAMADDR | row_offsets[value[0]] + value[1])
-        usleep(50)
+        self._cursor_pos = tuple(value)
+        # The address counter is moved by the next write, right away when the cursor shows
+        self._show_cursor()
 
     cursor_pos = property(_get_cursor_pos, _set_cursor_pos,
             doc='The cursor position as a 2-tuple (row, col).')
@@ -360,6 +733,7 @@ class CharLCD(object):
         self._cursor_mode = int(value)
         self.command(LCD_DISPLAYCONTROL | self._display_mode | self._cursor_mode)
         usleep(50)
+        self._show_cursor()
 
     cursor_mode = property(_get_cursor_mode, _set_cursor_mode,
             doc='How the cursor should behave (``CursorMode.hide``, ' +
@@ -368,21 +742,30 @@ class CharLCD(object):
     def _get_backlight_enabled(self):
         # We could probably read the current GPIO output state via sysfs, but
         # for now let's just store the state in the class
-        if self.pins.backlight is None:
+        if not self.bus.has_backlight:
             raise ValueError('You did not configure a GPIO pin for backlight control!')
         return bool(self._backlight_enabled)
 
     def _set_backlight_enabled(self, value):
-        if self.pins.backlight is None:
+        if not self.bus.has_backlight:
             raise ValueError('You did not configure a GPIO pin for backlight control!')
         if not isinstance(value, bool):
             raise ValueError('backlight_enabled must be set to ``True`` or ``False``.')
         self._backlight_enabled = value
-        GPIO.output(self.pins.backlight, value ^ (self.backlight_mode is BacklightMode.active_low))
+        self._flush()
+        self.bus.set_backlight(value)
 
     backlight_enabled = property(_get_backlight_enabled, _set_backlight_enabled,
             doc='Whether or not to turn on the backlight.')
 
+    def _get_content(self):
+        cols = self.lcd.cols
+        view = memoryview(self._content)
+        return [view[i:i + cols].tobytes() for i in range(0, len(self._content), cols)]
+
+    content = property(_get_content,
+            doc='What the display shows according to the cache, one bytes object per row.')
+
     # High level commands
 
     def write_string(self, value):
@@ -407,17 +790,31 @@ class CharLCD(object):
             >>> bstring.decode('utf-8')
             u'Temperature: 30\xb0C'
 
-        Only characters with an ``ord()`` value between 0 and 255 are currently
-        supported.
+        The string is translated to the character ROM set by ``charmap``,
+        characters it does not have fall back to the closest one, see
+        :mod:`RPLCD.charmap`.
+
+        The whole string is handed to the bus in one batch.
 
         """
+        self._begin_batch()
+        try:
+            self._write_string(self.charmap.encode(value))
+        finally:
+            self._end_batch()
+
+    def _write_string(self, data):
         ignored = None  # Used for ignoring manual linebreaks after auto linebreaks
-        for char in value:
+        # Runs of regular chars, each followed by a line break
+        parts = LINEBREAKS.split(data)
+        for i in range(0, len(parts), 2):
             # Write regular chars
-            if char not in '\n\r':
-                self.write(ord(char))
+            if parts[i]:
+                self._write_bytes(parts[i])
                 ignored = None
-                continue
+            if i + 1 == len(parts):
+                break
+            char = parts[i + 1]
             # If an auto linebreak happened recently, ignore this write.
             if self.recent_auto_linebreak is True:
                 # No newline chars have been ignored yet. Do it this time.
@@ -432,12 +829,12 @@ class CharLCD(object):
                     continue
             # Handle newlines and carriage returns
             row, col = self.cursor_pos
-            if char == '\n':
+            if char == b'\n':
                 if row < self.lcd.rows - 1:
                     self.cursor_pos = (row + 1, col)
                 else:
                     self.cursor_pos = (0, col)
-            elif char == '\r':
+            elif char == b'\r':
                 if self.text_align_mode is Alignment.left:
                     self.cursor_pos = (row, 0)
                 else:
@@ -445,15 +842,21 @@ class CharLCD(object):
 
     def clear(self):
         """Overwrite display with blank characters and reset cursor position."""
+        self._flush()
         self.command(LCD_CLEARDISPLAY)
+        self._flush()
         self._cursor_pos = (0, 0)
-        self._content = [[0x20] * self.lcd.cols for _ in range(self.lcd.rows)]
+        self._address = (0, 0)
+        self._content[:] = self._blank
         msleep(2)
 
     def home(self):
         """Set cursor to initial position and reset any shifting."""
+        self._flush()
         self.command(LCD_RETURNHOME)
+        self._flush()
         self._cursor_pos = (0, 0)
+        self._address = (0, 0)
         msleep(2)
 
     def shift_display(self, amount):
@@ -507,6 +910,7 @@ class CharLCD(object):
 
         # Write character to CGRAM
         self.command(LCD_SETCGRAMADDR | location << 3)
+        self._address = None
         for row in bitmap:
             self._send(row, RS_DATA)
 
@@ -524,24 +928,26 @@ class CharLCD(object):
 
         # Get current position
         row, col = self._cursor_pos
+        cols = self.lcd.cols
+        left = self._text_align_mode == LCD_ENTRYLEFT
 
         # Write byte if changed
-        if self._content[row][col] != value:
+        index = row * cols + col
+        if self._content[index] != value:
+            self._locate(row, col)
             self._send(value, RS_DATA)
-            self._content[row][col] = value  # Update content cache
-            unchanged = False
-        else:
-            unchanged = True
+            self._content[index] = value  # Update content cache
+            # The address counter follows, except from one row to the next
+            if left:
+                self._address = (row, col + 1) if col < cols - 1 else None
+            else:
+                self._address = (row, col - 1) if col > 0 else None
 
         # Update cursor position.
-        if self.text_align_mode is Alignment.left:
-            if self.auto_linebreaks is False or col < self.lcd.cols - 1:
+        if left:
+            if self.auto_linebreaks is False or col < cols - 1:
                 # No newline, update internal pointer
-                newpos = (row, col + 1)
-                if unchanged:
-                    self.cursor_pos = newpos
-                else:
-                    self._cursor_pos = newpos
+                self._cursor_pos = (row, col + 1)
                 self.recent_auto_linebreak = False
             else:
                 # Newline, reset pointer
@@ -553,59 +959,93 @@ class CharLCD(object):
         else:
             if self.auto_linebreaks is False or col > 0:
                 # No newline, update internal pointer
-                newpos = (row, col - 1)
-                if unchanged:
-                    self.cursor_pos = newpos
-                else:
-                    self._cursor_pos = newpos
+                self._cursor_pos = (row, col - 1)
                 self.recent_auto_linebreak = False
             else:
                 # Newline, reset pointer
                 if row < self.lcd.rows - 1:
-                    self.cursor_pos = (row + 1, self.lcd.cols - 1)
+                    self.cursor_pos = (row + 1, cols - 1)
                 else:
-                    self.cursor_pos = (0, self.lcd.cols - 1)
+                    self.cursor_pos = (0, cols - 1)
                 self.recent_auto_linebreak = True
+        self._show_cursor()
+
+    def _write_bytes(self, data):
+        """Write raw bytes (no newline) from the cursor position, only
+        sending the runs of cells that changed."""
+        cols = self.lcd.cols
+        while data:
+            row, col = self._cursor_pos
+            # Up to the cell before the end of the row, the last one may break the line
+            count = min(len(data), cols - 1 - col)
+            if count <= 0 or self._text_align_mode != LCD_ENTRYLEFT:
+                self.write(data[0])
+                data = data[1:]
+                continue
 
-    # Low level commands
-
-    def _send(self, value, mode):
-        """Send the specified value to the display with automatic 4bit / 8bit
-        selection. The rs_mode is either ``RS_DATA`` or ``RS_INSTRUCTION``."""
+            start = row * cols + col
+            new = memoryview(data)[:count]
+            cache = memoryview(self._content)[start:start + count]
+            if cache != new:
+                i = 0
+                while i < count:
+                    if cache[i] == new[i]:
+                        i += 1
+                        continue
+                    end = i + 1
+                    while end < count and cache[end] != new[end]:
+                        end += 1
+                    self._locate(row, col + i)
+                    for value in new[i:end]:
+                        self._send(value, RS_DATA)
+                    cache[i:end] = new[i:end]
+                    self._address = (row, col + end)
+                    i = end
+            self._cursor_pos = (row, col + count)
+            self.recent_auto_linebreak = False
+            data = data[count:]
+        self._show_cursor()
 
-        # Choose instruction or data mode
-        GPIO.output(self.pins.rs, mode)
+    # Low level commands
 
-        # If the RW pin is used, set it to low in order to write.
-        if self.pins.rw is not None:
-            GPIO.output(self.pins.rw, 0)
+    def _locate(self, row, col):
+        """Move the address counter of the controller to (row, col)."""
+        if self._address != (row, col):
+            self.command(LCD_SETDDRAMADDR | self._row_offsets[row] + col)
+            self._address = (row, col)
+            # While batching the command is only queued, the bus settles it when sent
+            if self._pending is None:
+                usleep(50)
+
+    def _show_cursor(self):
+        """Keep the address counter on the cursor position while the cursor shows."""
+        if self._cursor_mode != LCD_CURSOROFF | LCD_BLINKOFF:
+            self._locate(*self._cursor_pos)
+
+    def _begin_batch(self):
+        """Queue everything sent until the matching :meth:`_end_batch` so the
+        bus can transfer it in one go. Batches can be nested."""
+        if self._batch_depth == 0:
+            self._pending = []
+        self._batch_depth += 1
+
+    def _end_batch(self):
+        self._batch_depth -= 1
+        if self._batch_depth == 0:
+            self._flush()
+            self._pending = None
+
+    def _flush(self):
+        """Hand the queued bytes over to the bus."""
+        if self._pending:
+            pending, self._pending = self._pending, []
+            self.bus.send_many(pending)
 
-        # Write data out in chunks of 4 or 8 bit
-        if self.data_bus_mode == LCD_8BITMODE:
-            self._write8bits(value)
+    def _send(self, value, mode):
+        """Send the specified value to the display, or queue it while a batch
+        is open. The rs_mode is either ``RS_DATA`` or ``RS_INSTRUCTION``."""
+        self.bytes_sent += 1
+        if self._pending is not None:
+            self._pending.append((value, mode))
         else:
-            self._write4bits(value >> 4)
-            self._write4bits(value)
-
-    def _write4bits(self, value):
-        """Write 4 bits of data into the data bus."""
-        for i in range(4):
-            bit = (value >> i) & 0x01
-            GPIO.output(self.pins[i + 7], bit)
-        self._pulse_enable()
-
-    def _write8bits(self, value):
-        """Write 8 bits of data into the data bus."""
-        for i in range(8):
-            bit = (value >> i) & 0x01
-            GPIO.output(self.pins[i + 3], bit)
-        self._pulse_enable()
-
-    def _pulse_enable(self):
-        """Pulse the `enable` flag to process data."""
-        GPIO.output(self.pins.e, 0)
-        usleep(1)
-        GPIO.output(self.pins.e, 1)
-        usleep(1)
-        GPIO.output(self.pins.e, 0)
-        usleep(100)  # commands need > 37us to settle
+            self.bus.send(value, mode)
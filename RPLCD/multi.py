@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Several displays driven as one.
+
+:class:`SharedBus` wires N controllers to the same RS, RW and data lines,
+each with its own E pin. :class:`LCDGroup` mirrors writes to N
+:class:`~RPLCD.lcd.CharLCD` and sends what they queued in one interleaved
+pass: at each step the bytes that are the same for several displays are put
+on the data lines once and latched by strobing all their E pins together,
+and the settle time is waited once for all displays.
+
+Each display keeps its own content cache, so a panel only gets the cells
+that changed on it.
+
+Example:
+
+>>> shared = SharedBus(pins_e=[16, 26], pin_rs=15, pins_data=[21, 22, 23, 24])
+>>> group = LCDGroup([CharLCD(bus=shared.port(0)), CharLCD(bus=shared.port(1))])
+>>> with batched(group):
+...     group.cursor_pos = (0, 0)
+...     group.write_string('On both displays')
+
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from . import lcd as _lcd
+from .lcd import ParallelBus, BacklightMode, LCD_8BITMODE, usleep
+
+
+class SharedBus(ParallelBus):
+    """Parallel bus through ``RPi.GPIO`` with one E pin per display.
+
+    Use :meth:`port` to get the bus of each display. The data and RS lines
+    are only written when their level changes.
+
+    """
+
+    def __init__(self, pins_e, pin_rs=15, pin_rw=None, pins_data=[21, 22, 23, 24],
+                 pin_backlight=None, backlight_mode=BacklightMode.active_low, numbering_mode=None):
+        super(SharedBus, self).__init__(pin_rs=pin_rs, pin_rw=pin_rw, pin_e=pins_e[0],
+                                        pins_data=pins_data, pin_backlight=pin_backlight,
+                                        backlight_mode=backlight_mode, numbering_mode=numbering_mode)
+        self.pins_e = list(pins_e)
+        self._levels = {}  # pin => level last written
+        self._is_setup = False
+
+    def port(self, index):
+        """The bus of the display on ``pins_e[index]``."""
+        return SharedBusPort(self, index)
+
+    def setup(self):
+        # Called by each display, only the first one does the work
+        if self._is_setup:
+            return
+        self._is_setup = True
+        super(SharedBus, self).setup()
+        for pin in self.pins_e[1:]:
+            _lcd.GPIO.setup(pin, _lcd.GPIO.OUT)
+            _lcd.GPIO.output(pin, 0)
+        self._levels = {}
+
+    def _output(self, pin, level):
+        if self._levels.get(pin) != level:
+            _lcd.GPIO.output(pin, level)
+            self._levels[pin] = level
+
+    def _put(self, value, mode, nibble):
+        """Set RS and the data lines for one nibble (or byte in 8 bit mode)."""
+        self._output(self.pins.rs, mode)
+        if self.data_bus_mode == LCD_8BITMODE:
+            for i in range(8):
+                self._output(self.pins[i + 3], (value >> i) & 0x01)
+        else:
+            value = value >> 4 if nibble == 0 else value
+            for i in range(4):
+                self._output(self.pins[i + 7], (value >> i) & 0x01)
+
+    def _strobe(self, pins_e):
+        """Latch the data lines into the displays on ``pins_e``."""
+        _lcd.GPIO.output(pins_e, 1)
+        usleep(1)
+        _lcd.GPIO.output(pins_e, 0)
+
+    def send_to(self, pins_e, value, mode):
+        """Send one byte to the displays on ``pins_e``."""
+        self.send_interleaved([(pin, [(value, mode)]) for pin in pins_e])
+
+    def send_interleaved(self, streams):
+        """Send several ``(pin_e, [(value, mode), ...])`` streams at once.
+
+        The streams advance together, a byte at a time. Identical bytes at
+        the same position go out once to all their displays.
+
+        """
+        if self.pins.rw is not None:
+            self._output(self.pins.rw, 0)
+        nibbles = 1 if self.data_bus_mode == LCD_8BITMODE else 2
+        length = max(len(items) for _, items in streams) if streams else 0
+
+        for step in range(length):
+            # (value, mode) => E pins of the displays getting it at this step
+            targets = {}
+            for pin_e, items in streams:
+                if step < len(items):
+                    targets.setdefault(items[step], []).append(pin_e)
+
+            for nibble in range(nibbles):
+                for (value, mode), pins_e in targets.items():
+                    self._put(value, mode, nibble)
+                    self._strobe(pins_e)
+                usleep(100)  # commands need > 37us to settle, once for all the displays
+
+    def write4bits(self, value, pins_e=None):
+        self._output(self.pins.rs, 0)
+        for i in range(4):
+            self._output(self.pins[i + 7], (value >> i) & 0x01)
+        self._strobe(pins_e or self.pins_e)
+        usleep(100)
+
+    def write8bits(self, value, pins_e=None):
+        self._output(self.pins.rs, 0)
+        for i in range(8):
+            self._output(self.pins[i + 3], (value >> i) & 0x01)
+        self._strobe(pins_e or self.pins_e)
+        usleep(100)
+
+    def set_backlight(self, value):
+        self._output(self.pins.backlight, value ^ (self.backlight_mode is BacklightMode.active_low))
+
+
+class SharedBusPort(object):
+    """The bus of one display of a :class:`SharedBus`, given to its CharLCD."""
+
+    def __init__(self, shared, index):
+        self.shared = shared
+        self.pin_e = shared.pins_e[index]
+        self.data_bus_mode = shared.data_bus_mode
+
+    @property
+    def has_backlight(self):
+        return self.shared.has_backlight
+
+    def setup(self):
+        self.shared.setup()
+
+    def set_backlight(self, value):
+        self.shared.set_backlight(value)
+
+    def close(self):
+        # The shared lines stay up for the other displays, see LCDGroup.close()
+        pass
+
+    def send(self, value, mode):
+        self.shared.send_to([self.pin_e], value, mode)
+
+    def send_many(self, items):
+        self.shared.send_interleaved([(self.pin_e, list(items))])
+
+    def write4bits(self, value):
+        self.shared.write4bits(value, [self.pin_e])
+
+    def write8bits(self, value):
+        self.shared.write8bits(value, [self.pin_e])
+
+
+class LCDGroup(object):
+    """Mirrors the CharLCD interface over several displays.
+
+    Writes are batched on every display and, when the batch ends, what each
+    display queued goes out in one interleaved pass per :class:`SharedBus`.
+    Displays on other buses get their own batch.
+
+    """
+
+    def __init__(self, lcds):
+        self.lcds = list(lcds)
+        self._batch_depth = 0
+
+    # Batching, see CharLCD._begin_batch()
+
+    def _begin_batch(self):
+        self._batch_depth += 1
+        for lcd in self.lcds:
+            lcd._begin_batch()
+
+    def _end_batch(self):
+        self._batch_depth -= 1
+        if self._batch_depth:
+            for lcd in self.lcds:
+                lcd._end_batch()
+            return
+
+        # Take what the displays queued before they flush it one by one
+        shared = {}  # SharedBus => streams
+        for lcd in self.lcds:
+            pending, lcd._pending = lcd._pending, []
+            if isinstance(lcd.bus, SharedBusPort):
+                shared.setdefault(lcd.bus.shared, []).append((lcd.bus.pin_e, pending))
+            elif pending:
+                lcd.bus.send_many(pending)
+            lcd._end_batch()
+        for bus, streams in shared.items():
+            bus.send_interleaved(streams)
+
+    def _each(self, func):
+        self._begin_batch()
+        try:
+            for lcd in self.lcds:
+                func(lcd)
+        finally:
+            self._end_batch()
+
+    # The CharLCD interface
+
+    def write_string(self, value):
+        self._each(lambda lcd: lcd.write_string(value))
+
+    def clear(self):
+        for lcd in self.lcds:
+            lcd.clear()
+
+    def home(self):
+        for lcd in self.lcds:
+            lcd.home()
+
+    def close(self, clear=False):
+        for lcd in self.lcds:
+            lcd.close(clear)
+        buses = set(lcd.bus.shared for lcd in self.lcds if isinstance(lcd.bus, SharedBusPort))
+        for bus in buses:
+            bus.close()
+
+    @property
+    def content(self):
+        """Content cache of the first display."""
+        return self.lcds[0].content
+
+    @property
+    def bytes_sent(self):
+        return sum(lcd.bytes_sent for lcd in self.lcds)
+
+    def _mirrored(name):
+        def get(self):
+            return getattr(self.lcds[0], name)
+
+        def set(self, value):
+            self._each(lambda lcd: setattr(lcd, name, value))
+
+        return property(get, set, doc='``{}`` of every display.'.format(name))
+
+    cursor_pos = _mirrored('cursor_pos')
+    cursor_mode = _mirrored('cursor_mode')
+    display_enabled = _mirrored('display_enabled')
+    backlight_enabled = _mirrored('backlight_enabled')
+    text_align_mode = _mirrored('text_align_mode')
+    write_shift_mode = _mirrored('write_shift_mode')
+
+    del _mirrored
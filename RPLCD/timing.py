@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Precise delays for the bus timings.
+
+``time.sleep`` oversleeps by tens of microseconds on a stock kernel, more
+than the delays the HD44780 asks for (1 us E pulses, 37 us settle time).
+:class:`PreciseDelay` measures that overshoot once, then:
+
+- busy-waits on ``time.perf_counter_ns`` for delays shorter than it,
+- sleeps for the longer ones, waking up early by the overshoot, and
+  busy-waits the rest.
+
+It keeps how late the delays ended, see :meth:`PreciseDelay.stats`. The
+statistics are updated by the bus threads and read from any thread (e.g.
+metrics), under a lock.
+
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import threading
+import time
+
+CALIBRATION_SLEEP_NS = 50000
+CALIBRATION_SAMPLES = 30
+CALIBRATION_PERCENTILE = 0.9  # Of the overshoot, so that few sleeps end late
+DEFAULT_OVERSHOOT_NS = 100000  # Until calibrated
+
+
+class PreciseDelay(object):
+    """Delays accurate to the microsecond, for the bus threads."""
+
+    def __init__(self):
+        self.sleep_overshoot_ns = DEFAULT_OVERSHOOT_NS
+        self.calibrated = False
+
+        # How late the delays ended, under _lock
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.late_total_ns = 0
+        self.late_max_ns = 0
+
+    def calibrate(self, samples=CALIBRATION_SAMPLES):
+        """Measure how much ``time.sleep`` oversleeps."""
+        overshoots = []
+        for _ in range(samples):
+            start = time.perf_counter_ns()
+            time.sleep(CALIBRATION_SLEEP_NS / 1e9)
+            overshoots.append(time.perf_counter_ns() - start - CALIBRATION_SLEEP_NS)
+        overshoots.sort()
+        self.sleep_overshoot_ns = max(0, overshoots[int(len(overshoots) * CALIBRATION_PERCENTILE)])
+        self.calibrated = True
+        return self.sleep_overshoot_ns
+
+    def wait_ns(self, nanoseconds):
+        """Return after ``nanoseconds``."""
+        now = time.perf_counter_ns()
+        deadline = now + nanoseconds
+        sleep_ns = nanoseconds - self.sleep_overshoot_ns
+        if sleep_ns > 0:
+            time.sleep(sleep_ns / 1e9)
+            now = time.perf_counter_ns()
+        while now < deadline:
+            now = time.perf_counter_ns()
+
+        late = now - deadline
+        with self._lock:
+            self.calls += 1
+            self.late_total_ns += late
+            if late > self.late_max_ns:
+                self.late_max_ns = late
+
+    def stats(self):
+        """The calibrated sleep overshoot and how late the delays ended, in microseconds."""
+        with self._lock:
+            calls, late_total_ns, late_max_ns = self.calls, self.late_total_ns, self.late_max_ns
+        return {
+            'sleep_overshoot_us': self.sleep_overshoot_ns / 1000,
+            'calls': calls,
+            'late_mean_us': late_total_ns / calls / 1000 if calls else 0.0,
+            'late_max_us': late_max_ns / 1000
+        }
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls = 0
+            self.late_total_ns = 0
+            self.late_max_ns = 0
+
+
+# Shared by all the buses, see RPLCD.lcd.usleep()
+DELAY = PreciseDelay()
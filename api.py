@@ -0,0 +1,200 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##################################
+#  Local API                     #
+#                                #
+#  JSON lines over a Unix socket #
+##################################
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import asyncio
+import json
+import logging
+import os
+
+import config
+
+logger = logging.getLogger(__name__)
+
+SETTABLE = ['daysBetweenWatering', 'startTime', 'durationOfWatering']
+
+
+class ApiError(Exception):
+    pass
+
+
+class ApiServer(object):
+    """Control and status of a Watering over a Unix socket, in its loop.
+
+    One JSON object per line each way. Requests have an ``op``:
+
+    - ``{"op": "status"}``
+    - ``{"op": "set", "daysBetweenWatering": 2, "startTime": [6, 30], "durationOfWatering": 30}``,
+      any subset of the three
+    - ``{"op": "start"}`` / ``{"op": "stop"}``
+    - ``{"op": "clear_emergency"}``: lets the waterings start again after an
+      emergency (e.g. a flow alarm)
+    - ``{"op": "profile", "enable": true}``: starts (or stops) the sampling
+      profiler, see profiler.py
+    - ``{"op": "subscribe"}``: the status now, then again on each change,
+      as ``{"event": "status", "status": {...}}``. The connection then only
+      streams events.
+
+    Replies are ``{"ok": true, "status": {...}}`` or ``{"ok": false, "error": "..."}``.
+
+    The status reply is encoded once in ``update``, when the state changes,
+    and sent as is to every request. Memory is bounded by ``max_clients``,
+    ``max_line`` bytes per request and ``queue_size`` events per subscriber
+    (a slow subscriber loses its oldest events, only the latest status matters).
+
+    """
+
+    def __init__(self, watering, path, max_clients=16, max_line=1024, queue_size=8):
+        self.watering = watering
+        self.path = path
+        self.max_clients = max_clients
+        self.max_line = max_line
+        self.queue_size = queue_size
+
+        self.clients = 0
+        self.subscribers = set()  # One queue of encoded events per subscriber
+        self.dropped_events = 0
+        self.status_json = None  # Current status, encoded
+        self.status_reply = None
+        self.status_event = None
+        self.server = None
+
+        self.ops = {
+            'status': self.op_status,
+            'set': self.op_set,
+            'start': self.op_start,
+            'stop': self.op_stop,
+            'clear_emergency': self.op_clear_emergency,
+            'profile': self.op_profile
+        }
+
+    async def serve(self):
+        # A socket left by a previous process would make the bind fail
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        self.server = await asyncio.start_unix_server(self.handle_client, self.path, limit=self.max_line)
+        os.chmod(self.path, 0o660)
+        logger.info('API listening on %s', self.path)
+        async with self.server:
+            await self.server.serve_forever()
+
+    # Called by the Watering on each state change
+    def update(self, status):
+        status_json = json.dumps(status, sort_keys=True)
+        if status_json == self.status_json:
+            return
+        self.status_json = status_json
+        self.status_reply = ('{"ok": true, "status": ' + status_json + '}\n').encode('utf-8')
+        self.status_event = ('{"event": "status", "status": ' + status_json + '}\n').encode('utf-8')
+
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+                self.dropped_events += 1
+            queue.put_nowait(self.status_event)
+
+    async def handle_client(self, reader, writer):
+        if self.clients >= self.max_clients:
+            await self.reply(writer, error='Too many clients')
+            writer.close()
+            return
+
+        self.clients += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Longer than max_line, the rest of the stream cannot be trusted
+                    await self.reply(writer, error='Request too long')
+                    break
+                if not line:
+                    break
+
+                try:
+                    request = json.loads(line.decode('utf-8'))
+                    if not isinstance(request, dict):
+                        raise ApiError('Request must be an object')
+                    if request.get('op') == 'subscribe':
+                        await self.stream(writer)
+                        break
+                    if request.get('op') not in self.ops:
+                        raise ApiError('Unknown op')
+                    self.ops[request['op']](request)
+                except ValueError:
+                    await self.reply(writer, error='Invalid JSON')
+                except ApiError as e:
+                    await self.reply(writer, error=str(e))
+                else:
+                    writer.write(self.status_reply)
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    # Sends the status events until the client goes away
+    async def stream(self, writer):
+        queue = asyncio.Queue(self.queue_size)
+        queue.put_nowait(self.status_event)
+        self.subscribers.add(queue)
+        try:
+            while True:
+                writer.write(await queue.get())
+                await writer.drain()
+        finally:
+            self.subscribers.discard(queue)
+
+    async def reply(self, writer, error):
+        writer.write((json.dumps({'ok': False, 'error': error}) + '\n').encode('utf-8'))
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    def op_status(self, request):
+        pass
+
+    # Same ranges as the buttons and the configuration file
+    def op_set(self, request):
+        settings = dict((k, v) for k, v in request.items() if k != 'op')
+        if not set(settings) <= set(SETTABLE):
+            raise ApiError('Only {} can be set'.format(', '.join(SETTABLE)))
+        try:
+            config.validate_watering(settings)
+        except config.ConfigError as e:
+            raise ApiError(str(e))
+
+        self.watering.apply_settings(settings)
+        self.watering.request_save()
+
+    def op_start(self, request):
+        if not self.watering.ongoingWatering:
+            self.watering.start_watering()
+
+    def op_stop(self, request):
+        if self.watering.ongoingWatering:
+            self.watering.stop_watering()
+
+    def op_clear_emergency(self, request):
+        if self.watering.emergency_on:
+            self.watering.stop_emergency_mode()
+            self.watering.request_save()
+
+    def op_profile(self, request):
+        if not self.watering.profiler:
+            raise ApiError('No profiler')
+        if request.get('enable'):
+            self.watering.profiler.start()
+        else:
+            self.watering.profiler.stop()
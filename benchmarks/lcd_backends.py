@@ -0,0 +1,77 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##################################
+#  LCD backends benchmark        #
+#                                #
+#  Full 20x4 repaint time per    #
+#  bus, on the RPLCD fakes       #
+##################################
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from RPLCD.fakes import install_fake_gpio, FakeSMBus, FakePigpio
+
+GPIO = install_fake_gpio()
+
+from RPLCD import CharLCD, I2CBus, WaveBus, batched
+
+I2C_HZ = 100000  # Standard mode I2C clock
+
+
+# Two frames differing on every cell so each repaint sends all 80 characters
+FRAMES = [
+    ['{:<20}'.format(c * 20) for c in 'ABCD'],
+    ['{:<20}'.format(c * 20) for c in 'abcd'],
+]
+
+
+def repaint(lcd, frame):
+    with batched(lcd):
+        for row, line in enumerate(frame):
+            lcd.cursor_pos = (row, 0)
+            lcd.write_string(line)
+
+
+def run(name, lcd, bus_time, repeat):
+    # Warm up and check what reached the controller
+    repaint(lcd, FRAMES[1])
+    start_bus = bus_time()
+    start = time.time()
+    for i in range(repeat):
+        repaint(lcd, FRAMES[i % 2])
+    wall = (time.time() - start) / repeat * 1000
+    wire = (bus_time() - start_bus) / repeat * 1000
+    print('{:<6} {:>10.2f} ms {:>10.2f} ms'.format(name, wall, wire))
+    return wall
+
+
+def main(repeat=20):
+    print('{:<6} {:>13} {:>13}'.format('bus', 'wall/repaint', 'wire/repaint'))
+
+    controller = GPIO.attach_lcd()
+    gpio_lcd = CharLCD(pin_backlight=18, pin_rw=None)
+    run('gpio', gpio_lcd, time.time, repeat)
+    assert controller.lines() == FRAMES[(repeat - 1) % 2]
+
+    smbus = FakeSMBus()
+    i2c_lcd = CharLCD(bus=I2CBus(bus=smbus))
+    # 9 clocks per byte plus start, address and stop per transaction
+    run('i2c', i2c_lcd,
+        lambda: (smbus.bytes_sent * 9 + len(smbus.transactions) * 20) / I2C_HZ, repeat)
+    assert smbus.lcd.lines() == FRAMES[(repeat - 1) % 2]
+
+    pi = FakePigpio()
+    wave_lcd = CharLCD(bus=WaveBus(pi=pi))
+    run('wave', wave_lcd, lambda: pi.wave_time_us / 1000000.0, repeat)
+    assert pi.lcd.lines() == FRAMES[(repeat - 1) % 2]
+
+
+if __name__ == '__main__':
+    main()
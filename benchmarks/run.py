@@ -0,0 +1,258 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##################################
+#  Benchmark suite               #
+#                                #
+#  LCD driver, menus and         #
+#  schedule on the fake GPIO     #
+##################################
+
+"""
+Usage:
+
+    python benchmarks/run.py [--filter NAME] [--min-time 0.5]
+                             [--save results.json] [--baseline baseline.json] [--tolerance 0.2]
+
+For each benchmark: operations per second, RPi.GPIO calls per operation and
+simulated bus time per operation, i.e. the time the LCD driver asked to
+sleep (usleep/msleep are counted instead of slept, so the wall time only
+measures the Python side).
+
+baseline.json holds the results of the tree it was saved with; the GPIO
+calls and bus time do not depend on the machine, ops/sec does.
+
+With --baseline, a benchmark is flagged as a regression when its ops/sec
+dropped by more than the tolerance, or when it makes more GPIO calls or
+needs more bus time than in the baseline. The exit status is then 1.
+"""
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from RPLCD.fakes import install_fake_gpio
+
+GPIO = install_fake_gpio()
+
+from RPLCD import lcd as rplcd_lcd, multi as rplcd_multi
+
+import param
+
+# No file, socket or network from the Watering during the benchmarks
+param.STATE_FILE = os.path.join(tempfile.mkdtemp(), 'state.json')
+param.CONFIG_FILE = None
+param.API = None
+param.METRICS = None
+param.FLEET = None
+param.COORDINATOR = None
+param.WEATHER = None
+param.MOISTURE = None
+param.FLOW = None
+param.SUPERVISOR = None
+param.RELAYD = None
+
+import main
+import schedule
+
+
+class BusClock(object):
+    """Stands in for RPLCD's usleep and msleep, adding up the time instead."""
+
+    def __init__(self):
+        self.us = 0.0
+
+    def usleep(self, microseconds):
+        self.us += microseconds
+
+    def msleep(self, milliseconds):
+        self.us += milliseconds * 1000
+
+    def install(self):
+        rplcd_lcd.usleep = self.usleep
+        rplcd_lcd.msleep = self.msleep
+        rplcd_multi.usleep = self.usleep
+
+
+CLOCK = BusClock()
+CLOCK.install()
+
+
+def create_watering():
+    GPIO.reset()
+    GPIO.attach_lcd()
+    watering = main.Watering()
+    # Not due, so the schedule is evaluated without starting a watering
+    watering.lastWatering = datetime.datetime.today()
+    watering.lcd = watering.create_lcd(param.LCD)
+    watering.lcd_wakeup = asyncio.Event()
+    return watering
+
+
+# Returns (name, operation) pairs, each operation being called many times
+def benchmarks():
+    watering = create_watering()
+    lcd = watering.lcd
+
+    # Alternates between two texts so all 80 characters change each time
+    texts = ['ABCDEFGHIJKLMNOPQRST' * 4, 'abcdefghijklmnopqrst' * 4]
+
+    def write_string():
+        texts.reverse()
+        lcd.cursor_pos = (0, 0)
+        lcd.write_string(texts[0])
+
+    yield 'lcd.write_string_80', write_string
+
+    # What switch_on_lcd does: a clear, then the whole frame again
+    frame = ['{:^20}'.format('Repaint row {}'.format(row)) for row in range(4)]
+
+    def clear():
+        lcd.clear()
+
+    def repaint():
+        lcd.clear()
+        watering.write_frame(frame)
+
+    yield 'lcd.clear', clear
+    yield 'lcd.repaint', repaint
+
+    # Builds the frame and writes it, the content cache then only lets the changes through
+    def render(menu, selected):
+        def op():
+            watering.configMenuSelected = selected
+            menu()
+            watering.write_frame(watering.frame)
+        return op
+
+    # The details of a config entry are shown with that entry selected, the start/stop entry is
+    # left out as showing it starts or stops the watering
+    details = watering.DAYS_OF_WATERING_CONFIG_MENU
+    for key, menu in sorted(watering.mainMenu.items()):
+        yield 'menu.main.{}.{}'.format(key, menu.__name__), render(menu, details)
+    for key, (menu, _) in sorted(watering.configMenu.items()):
+        yield 'menu.config_list.{}'.format(key), render(watering.display_config_menu, key)
+        if key != watering.START_STOP_WATERING_CONFIG_MENU:
+            yield 'menu.config.{}.{}'.format(key, menu.__name__), render(menu, key)
+
+    yield 'schedule.has_to_water', watering.has_to_water
+    yield 'schedule.next_watering_in', watering.next_watering_in
+
+    # Mon/Wed/Fri twice a day, with a daily ban window
+    calendar = schedule.CalendarSchedule(weekdays=[0, 2, 4], times=[(6, 0), (21, 30)],
+                                         daily_blackouts=[((10, 0), (18, 0))])
+
+    def calendar_has_to_water():
+        watering.schedule = calendar
+        watering.has_to_water()
+        watering.schedule = None
+
+    yield 'schedule.calendar.has_to_water', calendar_has_to_water
+
+    time_difs = [datetime.timedelta(seconds=s) for s in (42, 42 * 60, 5 * 3600 + 7 * 60, 3 * 86400 + 3600)]
+
+    def convert():
+        for time_dif in time_difs:
+            watering.convert_time_dif_to_string(time_dif)
+
+    yield 'schedule.convert_time_dif_to_string', convert
+
+    def iteration():
+        # One pass of the control loop and of the LCD writer
+        watering.tick()
+        if watering.frame != watering.last_frame:
+            watering.write_frame(watering.frame)
+            watering.last_frame = watering.frame
+
+    yield 'loop.iteration', iteration
+
+
+# ops/sec is the best of several rounds, the other rounds being slowed down by the rest of the system
+def measure(op, min_time, rounds=5):
+    op()  # Warm up
+    calls, bus_us = GPIO.calls, CLOCK.us
+    total = 0
+    best = 0
+    for _ in range(rounds):
+        count = 0
+        start = time.perf_counter()
+        deadline = start + min_time / rounds
+        while True:
+            op()
+            count += 1
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+        best = max(best, count / (now - start))
+        total += count
+    return {
+        'ops_per_sec': best,
+        'gpio_calls': (GPIO.calls - calls) / total,
+        'bus_ms': (CLOCK.us - bus_us) / total / 1000,
+    }
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        reasons = []
+        if result['ops_per_sec'] < base['ops_per_sec'] * (1 - tolerance):
+            reasons.append('{:.0f} ops/s < {:.0f}'.format(result['ops_per_sec'], base['ops_per_sec']))
+        if result['gpio_calls'] > base['gpio_calls'] + 1e-9:
+            reasons.append('{:.1f} GPIO calls > {:.1f}'.format(result['gpio_calls'], base['gpio_calls']))
+        if result['bus_ms'] > base['bus_ms'] + 1e-9:
+            reasons.append('{:.3f} ms bus > {:.3f}'.format(result['bus_ms'], base['bus_ms']))
+        if reasons:
+            regressions.append((name, reasons))
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Runs the benchmarks on the fake GPIO')
+    parser.add_argument('--filter', default='', help='Only the benchmarks whose name contains this')
+    parser.add_argument('--min-time', type=float, default=0.5, help='Seconds per benchmark')
+    parser.add_argument('--save', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare with the results saved in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed ops/sec drop, 0.2 = 20%%')
+    args = parser.parse_args()
+
+    print('{:<48} {:>12} {:>12} {:>12}'.format('benchmark', 'ops/s', 'GPIO/op', 'bus ms/op'))
+    results = {}
+    for name, op in benchmarks():
+        if args.filter not in name:
+            continue
+        result = results[name] = measure(op, args.min_time)
+        print('{:<48} {:>12.0f} {:>12.1f} {:>12.3f}'.format(
+            name, result['ops_per_sec'], result['gpio_calls'], result['bus_ms']))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'date': datetime.datetime.now().isoformat(), 'results': results}, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for name, reasons in regressions:
+            print('REGRESSION {}: {}'.format(name, ', '.join(reasons)))
+        if regressions:
+            sys.exit(1)
+        print('No regression against {}'.format(args.baseline))
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##################################
+#  Seasonal water budget         #
+#                                #
+#  Monthly or weekly percentage  #
+#  of durationOfWatering         #
+##################################
+
+"""
+A SeasonalBudget scales durationOfWatering by a percentage per month (12
+values) or per ISO week (53 values, the last one only used by long years):
+
+    SeasonalBudget(months=[30, 40, 60, 80, 100, 120, 140, 130, 100, 70, 40, 30])
+
+The duration of every day of the year is computed once, when the year,
+the table or durationOfWatering change, so the duration of a watering is
+a list lookup.
+"""
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import datetime
+
+MAX_PERCENT = 200
+STEP = 10  # Menu step, in %
+
+
+class SeasonalBudget(object):
+    """Percentage of durationOfWatering per month or per ISO week."""
+
+    def __init__(self, months=None, weeks=None):
+        if (months is None) == (weeks is None):
+            raise ValueError('Give either months or weeks')
+        self.months = list(months) if months is not None else None
+        self.weeks = list(weeks) if weeks is not None else None
+
+        self.key = None  # (year, duration, table) the days were computed for
+        self.first = None  # Ordinal of January 1st of that year
+        self.percents = []  # Day of the year - 1 => %
+        self.minutes = []  # Day of the year - 1 => minutes
+
+    @property
+    def table(self):
+        return self.months if self.months is not None else self.weeks
+
+    # Index in the table of the month or week of date
+    def slot(self, date):
+        if self.months is not None:
+            return date.month - 1
+        return date.isocalendar()[1] - 1
+
+    def compile(self, year, duration):
+        first = datetime.date(year, 1, 1)
+        days = [first + datetime.timedelta(days=i) for i in range((datetime.date(year + 1, 1, 1) - first).days)]
+        table = self.table
+        self.percents = [table[self.slot(day)] for day in days]
+        self.minutes = [int(round(duration * percent / 100)) for percent in self.percents]
+        self.key = (year, duration, tuple(table))
+        self.first = first.toordinal()
+
+    def _ensure(self, date, duration):
+        if self.key is None or self.key[0] != date.year or self.key[1] != duration:
+            self.compile(date.year, duration)
+
+    # Returns the minutes a watering starting on date lasts
+    def duration(self, date, duration):
+        self._ensure(date, duration)
+        return self.minutes[date.toordinal() - self.first]
+
+    def percent(self, date):
+        return self.table[self.slot(date)]
+
+    # Changes the % of the month or week of date by steps, the days are computed again
+    def change(self, date, steps):
+        table = self.table
+        slot = self.slot(date)
+        table[slot] = min(MAX_PERCENT, max(0, table[slot] + steps * STEP))
+        self.key = None
+
+    # Returns the pump hours of the 365 days from start, for the watering days given
+    def projected_hours(self, start, duration, watering_days):
+        minutes = 0
+        for day, count in watering_days:
+            self._ensure(day, duration)
+            minutes += self.minutes[day.toordinal() - self.first] * count
+        self._ensure(start, duration)
+        return minutes / 60
+
+    def to_settings(self):
+        return {'months': list(self.months)} if self.months is not None else {'weeks': list(self.weeks)}
+
+
+# Builds a SeasonalBudget from the "budget" watering setting (see config.validate_budget)
+def from_settings(settings):
+    return SeasonalBudget(months=settings.get('months'), weeks=settings.get('weeks'))
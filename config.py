@@ -0,0 +1,254 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##################################
+#  Configuration                 #
+#                                #
+#  param.py overridden by a JSON #
+#  file, reloaded on change      #
+##################################
+
+"""
+The file given by param.CONFIG_FILE may hold two sections, both optional:
+
+    {
+        "gpio": {... same layout as param.GPIO ...},
+        "watering": {"daysBetweenWatering": 3, "startTime": [23, 50], "durationOfWatering": 40,
+                     "volumeOfWatering": 100, "stopOnVolume": false, "mode": "AUTO",
+                     "schedule": {...}, "budget": {...}}
+    }
+
+"gpio" is only read at startup. "watering" is applied again each time the
+file changes, once validated, a setting missing from it going back to its
+default (WATERING_DEFAULTS).
+
+"schedule" replaces daysBetweenWatering and startTime by a calendar (see
+schedule.py), null to go back to them:
+
+    {"weekdays": ["mon", "wed", "fri"], "times": [[6, 0], [21, 30]],
+     "blackouts": [["2024-07-01 00:00", "2024-08-01 00:00"]], "dailyBlackouts": [[[10, 0], [18, 0]]]}
+
+blackouts and dailyBlackouts are optional. No watering starts during them.
+
+"budget" scales durationOfWatering by a percentage per month or per ISO
+week (see budget.py), null to always water durationOfWatering:
+
+    {"months": [30, 40, 60, 80, 100, 120, 140, 130, 100, 70, 40, 30]}
+    {"weeks": [... 53 values ...]}
+"""
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import collections
+import datetime
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+MODES = ['AUTO', 'MANU']
+# Watering settings the file does not set, as in a new Watering
+WATERING_DEFAULTS = {
+    'daysBetweenWatering': 3,
+    'startTime': [23, 50],
+    'durationOfWatering': 40,
+    'volumeOfWatering': 100,
+    'stopOnVolume': False,
+    'mode': MODES[0],
+    'schedule': None,
+    'budget': None
+}
+BUTTONS = ['right', 'left', 'bottom', 'up', 'emergency']
+MAX_CHANNEL = 40  # Header pins, BOARD numbering
+
+# Channels by function
+Pins = collections.namedtuple('Pins', BUTTONS + ['green', 'red', 'relay', 'flow', 'buttons'])
+
+
+class ConfigError(ValueError):
+    pass
+
+
+# Returns the configuration file as a dict, {} if there is none
+def load(path):
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (IOError, OSError, ValueError) as e:
+        raise ConfigError('Cannot read {}: {}'.format(path, e))
+    if not isinstance(data, dict):
+        raise ConfigError('{} must hold an object'.format(path))
+    return data
+
+
+# load() and compile_pins() at startup, where an error must not keep the relay from being switched off
+# An invalid file is logged and ignored, an invalid "gpio" section falls back to default_gpio (param.GPIO)
+def load_startup(path, default_gpio):
+    try:
+        data = load(path)
+    except ConfigError as e:
+        logger.error('%s ignored: %s', path, e)
+        data = {}
+    try:
+        pins = compile_pins(data.get('gpio', default_gpio))
+    except ConfigError as e:
+        logger.error('Pins of %s ignored: %s', path, e)
+        pins = compile_pins(default_gpio)
+    return data, pins
+
+
+# Flattens a param.GPIO-like dict into Pins
+# Pins.buttons maps each channel to a button name, None for the other channels
+def compile_pins(gpio):
+    try:
+        pins = dict((name, gpio['btn'][name][1]) for name in BUTTONS)
+        pins.update(green=gpio['led']['green'][1], red=gpio['led']['red'][1], relay=gpio['relay'][1],
+                    flow=gpio['flow'][1] if 'flow' in gpio else None)
+    except (KeyError, IndexError, TypeError) as e:
+        raise ConfigError('Missing pin: {}'.format(e))
+
+    channels = [c for c in pins.values() if c is not None]
+    for channel in channels:
+        if not isinstance(channel, int) or not 1 <= channel <= MAX_CHANNEL:
+            raise ConfigError('Invalid pin: {!r}'.format(channel))
+    if len(set(channels)) != len(channels):
+        raise ConfigError('A pin is used twice')
+
+    buttons = [None] * (MAX_CHANNEL + 1)
+    for name in BUTTONS:
+        buttons[pins[name]] = name
+    return Pins(buttons=buttons, **pins)
+
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+# Checks the watering settings, any subset of them, with the ranges of the buttons
+def validate_watering(settings):
+    if not isinstance(settings, dict):
+        raise ConfigError('The watering settings must be an object')
+    for key, value in settings.items():
+        if key == 'daysBetweenWatering':
+            if not is_int(value) or not 1 <= value <= 7:
+                raise ConfigError('daysBetweenWatering must be between 1 and 7')
+        elif key == 'startTime':
+            if (not isinstance(value, list) or len(value) != 2 or not all(is_int(v) for v in value)
+                    or not 0 <= value[0] <= 23 or value[1] not in range(0, 60, 10)):
+                raise ConfigError('startTime must be [hh, mm] with mm a multiple of 10')
+        elif key in ('durationOfWatering', 'volumeOfWatering'):
+            if not is_int(value) or value < 10 or value % 10:
+                raise ConfigError('{} must be a multiple of 10, from 10'.format(key))
+        elif key == 'stopOnVolume':
+            if not isinstance(value, bool):
+                raise ConfigError('stopOnVolume must be true or false')
+        elif key == 'mode':
+            if value not in MODES:
+                raise ConfigError('mode must be one of {}'.format(', '.join(MODES)))
+        elif key == 'schedule':
+            if value is not None:
+                validate_schedule(value)
+        elif key == 'budget':
+            if value is not None:
+                validate_budget(value)
+        else:
+            raise ConfigError('Unknown setting {}'.format(key))
+    return settings
+
+
+def is_time(value):
+    return (isinstance(value, list) and len(value) == 2 and all(is_int(v) for v in value)
+            and 0 <= value[0] <= 23 and 0 <= value[1] <= 59)
+
+
+# Checks the "schedule" watering setting
+def validate_schedule(settings):
+    import schedule
+
+    if not isinstance(settings, dict):
+        raise ConfigError('The schedule must be an object')
+    unknown = set(settings) - {'weekdays', 'times', 'blackouts', 'dailyBlackouts'}
+    if unknown:
+        raise ConfigError('Unknown schedule setting {}'.format(', '.join(sorted(unknown))))
+
+    weekdays = settings.get('weekdays')
+    if not isinstance(weekdays, list) or not weekdays or not all(d in schedule.WEEKDAYS for d in weekdays):
+        raise ConfigError('schedule.weekdays must list some of {}'.format(', '.join(schedule.WEEKDAYS)))
+    times = settings.get('times')
+    if not isinstance(times, list) or not times or not all(is_time(t) for t in times):
+        raise ConfigError('schedule.times must be a list of [hh, mm]')
+
+    blackouts = settings.get('blackouts', [])
+    if not isinstance(blackouts, list):
+        raise ConfigError('schedule.blackouts must be a list of ["YYYY-MM-DD HH:MM", "YYYY-MM-DD HH:MM"]')
+    for window in blackouts:
+        try:
+            start, end = [datetime.datetime.strptime(v, '%Y-%m-%d %H:%M') for v in window]
+        except (TypeError, ValueError):
+            raise ConfigError('schedule.blackouts must be a list of ["YYYY-MM-DD HH:MM", "YYYY-MM-DD HH:MM"]')
+        if end <= start:
+            raise ConfigError('A blackout must end after it starts')
+
+    daily = settings.get('dailyBlackouts', [])
+    if (not isinstance(daily, list)
+            or not all(isinstance(w, list) and len(w) == 2 and all(is_time(t) for t in w) for w in daily)):
+        raise ConfigError('schedule.dailyBlackouts must be a list of [[hh, mm], [hh, mm]]')
+    return settings
+
+
+# Checks the "budget" watering setting
+def validate_budget(settings):
+    import budget
+
+    if not isinstance(settings, dict) or len(settings) != 1 or not set(settings) <= {'months', 'weeks'}:
+        raise ConfigError('The budget must be {"months": [...]} or {"weeks": [...]}')
+    key, table = list(settings.items())[0]
+    length = 12 if key == 'months' else 53
+    if (not isinstance(table, list) or len(table) != length
+            or not all(is_int(v) and 0 <= v <= budget.MAX_PERCENT for v in table)):
+        raise ConfigError('budget.{} must be {} percentages from 0 to {}'.format(key, length, budget.MAX_PERCENT))
+    return settings
+
+
+class ConfigWatcher(object):
+    """Polls the mtime of the configuration file.
+
+    ``poll`` only stats the file every ``check_interval`` seconds, and only
+    reads it when its mtime changed, so it can run on every tick.
+
+    """
+
+    def __init__(self, path, check_interval=5):
+        self.path = path
+        self.check_interval = check_interval
+        self.mtime = self.stat()
+        self._checked_at = time.monotonic()
+
+    def stat(self):
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    # Returns the validated watering settings over WATERING_DEFAULTS if the file changed, None otherwise
+    # A setting removed from the file then goes back to its default
+    def poll(self, now=None):
+        now = time.monotonic() if now is None else now
+        if now - self._checked_at < self.check_interval:
+            return None
+        self._checked_at = now
+
+        mtime = self.stat()
+        if mtime == self.mtime:
+            return None
+        self.mtime = mtime
+
+        try:
+            return dict(WATERING_DEFAULTS, **validate_watering(load(self.path).get('watering', {})))
+        except ConfigError as e:
+            logger.error('Configuration not reloaded: %s', e)
+            return None
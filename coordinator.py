@@ -0,0 +1,189 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##################################
+#  Coordinator                   #
+#                                #
+#  Staggers the waterings of     #
+#  controllers sharing a pump    #
+##################################
+
+"""
+Controllers ask for a slot with their start time, duration and flow, and
+get back the offset (in minutes) to add to their start time so that the
+total flow never goes over the capacity of the supply.
+
+The service is a separate process:
+
+    python coordinator.py --socket /run/watering-coordinator.sock --capacity 60
+
+speaking one JSON line each way:
+
+    {"op": "request", "id": "...", "start": [23, 50], "duration": 40, "flow": 15} => {"offset": 20}
+    {"op": "release", "id": "..."} => {"ok": true}
+
+``offset`` is null when no slot fits in a day.
+"""
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 24 * 60
+REQUEST_TIMEOUT = 5
+
+
+class SlotPlanner(object):
+    """Packs the waterings into the minutes of a day against a flow capacity.
+
+    ``used`` holds the flow (L/min) reserved in each minute of the day. A
+    request takes the first offset from its start time where every minute
+    of the session has room. When a minute is full the search jumps right
+    after it, so a request costs O(minutes in a day + duration) whatever
+    the number of controllers.
+
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.used = [0.0] * MINUTES_PER_DAY
+        self.reservations = {}  # id => (start minute, duration, flow)
+
+    # Returns the offset in minutes, None if it does not fit in a day
+    def request(self, controller_id, start, duration, flow):
+        self.release(controller_id)
+        start = (start[0] * 60 + start[1]) % MINUTES_PER_DAY
+        duration = min(int(duration), MINUTES_PER_DAY)
+        if flow > self.capacity:
+            return None
+
+        used = self.used
+        limit = self.capacity - flow
+        offset = 0
+        minute = 0  # Minutes of the session checked from offset
+        while offset < MINUTES_PER_DAY:
+            if minute == duration:
+                self.reserve(controller_id, (start + offset) % MINUTES_PER_DAY, duration, flow)
+                return offset
+            if used[(start + offset + minute) % MINUTES_PER_DAY] > limit:
+                offset += minute + 1
+                minute = 0
+            else:
+                minute += 1
+        return None
+
+    def reserve(self, controller_id, start, duration, flow):
+        for minute in range(start, start + duration):
+            self.used[minute % MINUTES_PER_DAY] += flow
+        self.reservations[controller_id] = (start, duration, flow)
+
+    def release(self, controller_id):
+        reservation = self.reservations.pop(controller_id, None)
+        if reservation:
+            start, duration, flow = reservation
+            for minute in range(start, start + duration):
+                self.used[minute % MINUTES_PER_DAY] -= flow
+
+    def handle(self, message):
+        op = message.get('op')
+        if op == 'request':
+            return {'offset': self.request(message['id'], message['start'], message['duration'],
+                                           message['flow'])}
+        if op == 'release':
+            self.release(message['id'])
+            return {'ok': True}
+        return {'error': 'Unknown op'}
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    break
+                if not line:
+                    break
+                try:
+                    reply = self.handle(json.loads(line.decode('utf-8')))
+                except (ValueError, KeyError, TypeError, IndexError, AttributeError) as e:
+                    reply = {'error': 'Invalid message: {}'.format(e)}
+                writer.write((json.dumps(reply) + '\n').encode('utf-8'))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, path):
+        server = await asyncio.start_unix_server(self.handle_client, path, limit=4096)
+        logger.info('Coordinator listening on %s, capacity %s L/min', path, self.capacity)
+        async with server:
+            await server.serve_forever()
+
+
+class CoordinatorClient(object):
+    """Asks the coordinator service for slots, one connection per request."""
+
+    def __init__(self, path):
+        self.path = path
+
+    async def request(self, controller_id, start, duration, flow):
+        reply = await asyncio.wait_for(self.call({
+            'op': 'request', 'id': controller_id, 'start': start, 'duration': duration, 'flow': flow
+        }), REQUEST_TIMEOUT)
+        if 'error' in reply:
+            raise ValueError(reply['error'])
+        return reply['offset']
+
+    async def call(self, message):
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        try:
+            writer.write((json.dumps(message) + '\n').encode('utf-8'))
+            await writer.drain()
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError('Connection closed by the coordinator')
+            return json.loads(line.decode('utf-8'))
+        finally:
+            writer.close()
+
+
+class LocalCoordinator(object):
+    """In-process stand-in for CoordinatorClient, backed by its own SlotPlanner."""
+
+    def __init__(self, capacity, planner=None):
+        self.planner = planner or SlotPlanner(capacity)
+
+    async def request(self, controller_id, start, duration, flow):
+        return self.planner.request(controller_id, start, duration, flow)
+
+
+# Creates the client described by param.COORDINATOR
+def create_coordinator(config):
+    if config.get('capacity'):
+        return LocalCoordinator(config['capacity'])
+    return CoordinatorClient(config['path'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Staggers the waterings against the pump capacity')
+    parser.add_argument('--socket', default='/run/watering-coordinator.sock', help='Socket of the service')
+    parser.add_argument('--capacity', type=float, required=True, help='Flow available to all controllers, L/min')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        os.unlink(args.socket)
+    except OSError:
+        pass
+    asyncio.run(SlotPlanner(args.capacity).serve(args.socket))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##################################
+#  Fleet                         #
+#                                #
+#  State-change events of many   #
+#  controllers in one place      #
+##################################
+
+"""
+Each controller runs a Publisher (param.FLEET) sending its events, in
+batches, to MQTT or to the aggregator's own socket. The aggregator is a
+separate process:
+
+    python fleet.py --socket /run/watering-fleet.sock [--mqtt broker:1883]
+
+and answers one JSON line per query on the same socket:
+
+    {"op": "watering"}  => {"watering": ["zone", ...]}
+    {"op": "emergency"} => {"emergency": ["zone", ...]}
+    {"op": "controller", "id": "..."} => {"controller": {...}}
+    {"op": "summary"}   => {"controllers": n, "watering": n, "emergency": n}
+"""
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import argparse
+import asyncio
+import binascii
+import collections
+import itertools
+import json
+import logging
+import os
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+RETRY_MIN = 1  # Seconds before sending again after a failure, doubled up to RETRY_MAX
+RETRY_MAX = 60
+ACK_TIMEOUT = 5
+PAST_BOOTS = 8  # Boots remembered per controller, to drop the late events of a previous process
+
+
+class LocalTransport(object):
+    """Sends the batches to the aggregator socket, which acknowledges each one."""
+
+    def __init__(self, path):
+        self.path = path
+        self.reader = None
+        self.writer = None
+
+    async def send(self, batch):
+        try:
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+            self.writer.write((json.dumps({'events': batch}) + '\n').encode('utf-8'))
+            await self.writer.drain()
+            if not await asyncio.wait_for(self.reader.readline(), ACK_TIMEOUT):
+                raise ConnectionError('Connection closed by the aggregator')
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class MqttTransport(object):
+    """Publishes the batches on ``<prefix>/<id>/events`` with QoS 1.
+
+    paho-mqtt keeps the connection in its own thread. While it is down the
+    batches stay in the Publisher buffer rather than in paho's.
+
+    """
+
+    def __init__(self, controller_id, host, port=1883, prefix='watering'):
+        import paho.mqtt.client as mqtt
+        self.mqtt = mqtt
+        self.topic = '{}/{}/events'.format(prefix, controller_id)
+        self.client = mqtt.Client(client_id='watering-' + controller_id)
+        self.client.reconnect_delay_set(RETRY_MIN, RETRY_MAX)
+        self.client.connect_async(host, port)
+        self.client.loop_start()
+
+    async def send(self, batch):
+        if not self.client.is_connected():
+            raise ConnectionError('Not connected to the MQTT broker')
+        info = self.client.publish(self.topic, json.dumps(batch), qos=1)
+        if info.rc != self.mqtt.MQTT_ERR_SUCCESS:
+            raise ConnectionError(self.mqtt.error_string(info.rc))
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+class Publisher(object):
+    """Turns the status changes of a Watering into events and sends them.
+
+    Events close together are sent as one batch. While the bus is down they
+    wait in a buffer of ``buffer_size`` events, the oldest being dropped
+    first, and go out once it is back.
+
+    """
+
+    def __init__(self, transport, controller_id=None, zone=None, batch_size=50, batch_delay=1,
+                 buffer_size=1000):
+        self.transport = transport
+        self.controller_id = controller_id or socket.gethostname()
+        self.zone = zone or self.controller_id
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.buffer = collections.deque(maxlen=buffer_size)
+        # Tells the events of this process from the previous one's. Random, as the clock of a Pi without
+        # RTC can go back between two runs
+        self.boot = int(binascii.hexlify(os.urandom(6)), 16)
+        self.seq = 0
+        self.state = None  # (mode, ongoingWatering, emergency) last published
+        self.wakeup = None  # Created in the loop by run()
+
+    # Called with the new status on each state change
+    def observe(self, status):
+        state = (status['mode'], status['ongoingWatering'], status['emergency'])
+        last, self.state = self.state, state
+        if last is None:
+            self.publish('hello')
+            return
+
+        if state[1] != last[1]:
+            self.publish('watering_started' if state[1] else 'watering_stopped',
+                         volume=status.get('lastWateringVolume') if not state[1] else None)
+        if state[0] != last[0]:
+            self.publish('mode_changed')
+        if state[2] != last[2]:
+            self.publish('emergency' if state[2] else 'emergency_cleared')
+
+    def publish(self, event, **data):
+        self.seq += 1
+        mode, watering, emergency = self.state
+        data.update(event=event, id=self.controller_id, zone=self.zone, boot=self.boot, seq=self.seq,
+                    time=time.time(), mode=mode, watering=watering, emergency=emergency)
+        self.buffer.append(data)
+        if self.wakeup:
+            self.wakeup.set()
+
+    async def run(self):
+        self.wakeup = asyncio.Event()
+        delay = RETRY_MIN
+        while True:
+            if not self.buffer:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                await asyncio.sleep(self.batch_delay)
+
+            batch = list(itertools.islice(self.buffer, self.batch_size))
+            try:
+                await self.transport.send(batch)
+            except (IOError, OSError, asyncio.TimeoutError) as e:
+                logger.warning('Cannot publish %d events, retrying in %d s: %s', len(self.buffer), delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RETRY_MAX)
+                continue
+            delay = RETRY_MIN
+
+            # The buffer may have dropped events from its head in the meantime
+            while self.buffer and self.buffer[0]['seq'] <= batch[-1]['seq']:
+                self.buffer.popleft()
+
+
+# Creates the publisher described by param.FLEET
+def create_publisher(config):
+    config = dict(config)
+    bus = config.pop('bus', 'local')
+    controller_id = config.get('controller_id') or socket.gethostname()
+    if bus == 'mqtt':
+        transport = MqttTransport(controller_id, config.pop('host'), config.pop('port', 1883),
+                                  config.pop('prefix', 'watering'))
+    else:
+        transport = LocalTransport(config.pop('path'))
+    return Publisher(transport, **config)
+
+
+class Aggregator(object):
+    """Latest state of every controller, indexed by what is asked of it.
+
+    ``watering`` and ``emergency`` are sets of controller ids kept up to date
+    on each event, so "which zones are watering now" never scans the fleet.
+
+    """
+
+    def __init__(self):
+        self.controllers = {}  # id => latest state
+        self.past_boots = collections.defaultdict(lambda: collections.deque(maxlen=PAST_BOOTS))  # id => boots replaced
+        self.watering = set()
+        self.emergency = set()
+
+    def apply(self, event):
+        controller_id = event['id']
+        state = self.controllers.get(controller_id)
+        if state is None:
+            state = self.controllers[controller_id] = {'id': controller_id, 'boot': 0, 'seq': 0}
+        # Boot ids are random: a new one is a new process, its seq starts again
+        if event['boot'] != state['boot']:
+            # Replayed after an outage by a process already replaced
+            if event['boot'] in self.past_boots[controller_id]:
+                return False
+            if state['boot']:
+                self.past_boots[controller_id].append(state['boot'])
+        # Replayed after an outage, or older than what is known
+        elif event['seq'] <= state['seq']:
+            return False
+
+        for key in ('zone', 'boot', 'seq', 'mode', 'watering', 'emergency', 'event', 'time'):
+            state[key] = event[key]
+        if event['event'] == 'watering_stopped':
+            state['lastVolume'] = event.get('volume')
+        state['seen'] = time.time()
+
+        (self.watering.add if event['watering'] else self.watering.discard)(controller_id)
+        (self.emergency.add if event['emergency'] else self.emergency.discard)(controller_id)
+        return True
+
+    def zones(self, ids):
+        return sorted(self.controllers[i]['zone'] for i in ids)
+
+    def query(self, request):
+        op = request.get('op')
+        if op == 'watering':
+            return {'watering': self.zones(self.watering)}
+        if op == 'emergency':
+            return {'emergency': self.zones(self.emergency)}
+        if op == 'controller':
+            return {'controller': self.controllers.get(request.get('id'))}
+        if op == 'summary':
+            return {'controllers': len(self.controllers), 'watering': len(self.watering),
+                    'emergency': len(self.emergency)}
+        return {'error': 'Unknown op'}
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    break
+                if not line:
+                    break
+                try:
+                    message = json.loads(line.decode('utf-8'))
+                    if 'events' in message:
+                        for event in message['events']:
+                            self.apply(event)
+                        reply = {'ok': True}
+                    else:
+                        reply = self.query(message)
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    reply = {'error': 'Invalid message: {}'.format(e)}
+                writer.write((json.dumps(reply) + '\n').encode('utf-8'))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    # Applies the batches published on MQTT, from paho's thread
+    def subscribe(self, loop, host, port=1883, prefix='watering'):
+        import paho.mqtt.client as mqtt
+
+        def on_connect(client, userdata, flags, rc):
+            client.subscribe(prefix + '/+/events', qos=1)
+
+        def on_message(client, userdata, message):
+            try:
+                batch = json.loads(message.payload.decode('utf-8'))
+            except ValueError:
+                return
+            loop.call_soon_threadsafe(self.apply_batch, batch)
+
+        client = mqtt.Client(client_id='watering-aggregator')
+        client.on_connect = on_connect
+        client.on_message = on_message
+        client.connect_async(host, port)
+        client.loop_start()
+        return client
+
+    def apply_batch(self, batch):
+        for event in batch:
+            try:
+                self.apply(event)
+            except (KeyError, TypeError):
+                logger.warning('Invalid event: %r', event)
+
+    async def serve(self, path, mqtt=None, prefix='watering'):
+        if mqtt:
+            host, _, port = mqtt.partition(':')
+            self.subscribe(asyncio.get_running_loop(), host, int(port or 1883), prefix)
+        server = await asyncio.start_unix_server(self.handle_client, path, limit=1 << 20)
+        logger.info('Aggregator listening on %s', path)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aggregates the events of the watering controllers')
+    parser.add_argument('--socket', default='/run/watering-fleet.sock', help='Socket for the queries and local publishers')
+    parser.add_argument('--mqtt', help='Also subscribe to this MQTT broker, host[:port]')
+    parser.add_argument('--prefix', default='watering', help='MQTT topic prefix')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        os.unlink(args.socket)
+    except OSError:
+        pass
+    asyncio.run(Aggregator().serve(args.socket, args.mqtt, args.prefix))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##################################
+#  Flow meter                    #
+#                                #
+#  Hall effect pulses turned     #
+#  into litres and leak alarms   #
+##################################
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+LEAK = 'leak'  # Water flowing while the valve is closed
+BURST = 'burst'  # Flow above max_rate during a watering
+
+
+class FlowMeter(object):
+    """Pulse counter fed by the GPIO edge callback.
+
+    RPi.GPIO runs every edge callback in the same thread, so ``pulses`` has a
+    single writer and ``count`` stays one increment, fast enough for several
+    hundred Hz. Readers only ever load the value.
+
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.pulses = 0
+
+    # Edge callback
+    def count(self, channel):
+        self.pulses += 1
+
+
+class FlowAggregator(object):
+    """Turns the pulse count into flow rate and volumes, and detects leaks.
+
+    ``update`` is meant to be called periodically, it only reads the counter.
+
+    """
+
+    def __init__(self, meter, pulses_per_litre=450, leak_rate=0.2, max_rate=30, periods=3, grace=5):
+        """
+        Args:
+            meter: The FlowMeter.
+            pulses_per_litre: Meter constant (450 for the common YF-S201).
+            leak_rate: Flow (L/min) over which the valve is considered leaking when closed.
+            max_rate: Flow (L/min) over which a pipe is considered burst during a watering.
+            periods: Consecutive updates over a limit before raising the alarm.
+            grace: Seconds ignored after the valve opens or closes, while the flow settles.
+        """
+        self.meter = meter
+        self.pulses_per_litre = pulses_per_litre
+        self.leak_rate = leak_rate
+        self.max_rate = max_rate
+        self.periods = periods
+        self.grace = grace
+
+        self.rate = 0.0  # L/min over the last period
+        self.total = 0.0  # Litres since start
+        self.over_limit = 0  # Consecutive periods over a limit
+        self._session_pulses = meter.pulses
+        self._last_pulses = meter.pulses
+        self._last_time = None
+        self._watering = False
+        self._changed_at = None
+
+    def start_session(self):
+        self._session_pulses = self.meter.pulses
+
+    # Litres since the last start_session(), read straight from the counter
+    @property
+    def session(self):
+        return (self.meter.pulses - self._session_pulses) / self.pulses_per_litre
+
+    # Returns LEAK, BURST or None
+    def update(self, now, watering):
+        pulses = self.meter.pulses
+        delta, self._last_pulses = pulses - self._last_pulses, pulses
+        last_time, self._last_time = self._last_time, now
+        if last_time is None or now <= last_time:
+            return None
+
+        litres = delta / self.pulses_per_litre
+        self.rate = litres / (now - last_time) * 60
+        self.total += litres
+
+        if watering != self._watering or self._changed_at is None:
+            self._watering = watering
+            self._changed_at = now
+        if now - self._changed_at < self.grace:
+            self.over_limit = 0
+            return None
+
+        if watering:
+            alarm = BURST if self.rate > self.max_rate else None
+        else:
+            alarm = LEAK if self.rate > self.leak_rate else None
+
+        if alarm is None:
+            self.over_limit = 0
+            return None
+
+        self.over_limit += 1
+        return alarm if self.over_limit >= self.periods else None
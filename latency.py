@@ -0,0 +1,69 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##################################
+#  Input latency                 #
+#                                #
+#  From the button edge to the   #
+#  LCD update                    #
+##################################
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import collections
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_WAITING = 64  # Presses kept while no frame is built (LCD off)
+
+# Stage => help, each stage timed from the end of the previous one
+STAGES = [
+    ('dispatch', 'Button edge to handler, in the loop'),
+    ('state', 'Handler run'),
+    ('frame', 'Handler end to frame built'),
+    ('present', 'Frame built to frame written to the LCD')
+]
+
+
+class InputTracer(object):
+    """Follows each button press through the handler, the frame and the LCD.
+
+    A press is stamped on the GPIO edge, when its handler starts and ends,
+    when the next frame is built and when that frame (or a newer one) has
+    been written to the LCD. All stamps are ``time.monotonic()``.
+
+    """
+
+    def __init__(self, registry):
+        self.latency = registry.summary('watering_input_latency_seconds', 'Button edge to LCD update')
+        self.stages = [registry.summary('watering_input_{}_seconds'.format(stage), text) for stage, text in STAGES]
+        self.waiting = collections.deque(maxlen=MAX_WAITING)  # Presses without frame yet
+        self.framed = []  # Presses whose frame waits for the LCD writer
+
+    def pressed(self, edge, dispatched, changed):
+        self.waiting.append((edge, dispatched, changed))
+
+    # A frame has been built, already on screen if presented
+    def frame_built(self, now, presented):
+        if not self.waiting:
+            return
+        traces = [trace + (now,) for trace in self.waiting]
+        self.waiting.clear()
+        if presented:
+            self.complete(traces, now)
+        else:
+            self.framed.extend(traces)
+
+    # Returns the presses the frame being written shows
+    def take(self):
+        traces, self.framed = self.framed, []
+        return traces
+
+    def complete(self, traces, presented):
+        for trace in traces:
+            stamps = trace + (presented,)
+            for i, stage in enumerate(self.stages):
+                stage.observe(stamps[i + 1] - stamps[i])
+            self.latency.observe(presented - stamps[0])
+            logger.debug('Input latency %.1f ms', (presented - stamps[0]) * 1000)
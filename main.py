@@ -11,39 +11,146 @@
 
 from __future__ import print_function, division, absolute_import, unicode_literals
 
-import param
 import time
+
+IMPORTED_AT = time.monotonic()
+
+import param
+import config
+import metrics
+import latency
+import relayd
+import asyncio
+import collections
+import concurrent.futures
 import datetime
+import json
+import logging
+import os
+import signal
+import socket
 import RPi.GPIO as GPIO
 import math
-import multiprocessing
-import subprocess
 
-# LCD import
-from RPLCD import CharLCD
-from RPLCD import Alignment, CursorMode, ShiftMode
-from RPLCD import cursor, cleared
-from RPLCD import BacklightMode
+# The LCD modules are imported in the LCD thread, see create_lcd()
+# The optional subsystems (flow, weather, api...) are only imported when param.py or the
+# configuration file enables them. asyncio imports subprocess itself (the date is set with
+# asyncio.create_subprocess_exec), it makes most of the import time and cannot be deferred
+
+logger = logging.getLogger(__name__)
+
+# Loop timings (in seconds)
+TICK_INTERVAL = .5  # Schedule evaluation and menu refresh
+STATUS_DURATION = 3  # How long a transient status message stays on screen
+LCD_TIMEOUT = 2  # Max time for one LCD operation in the writer thread
+LCD_RETRY_DELAY = 1  # Before writing a frame again after an LCD error
+LCD_REINIT_FAILURES = 3  # Failed frames in a row before the LCD is initialised again
+DATE_COMMAND_TIMEOUT = 10  # Max time for the date/hwclock commands
+SELF_TEST_DURATION = 5  # Both LEDs on at startup
+FLOW_INTERVAL = 1  # Flow meter aggregation period
+COORDINATION_INTERVAL = 3600  # Slot asked again even without change, in case the coordinator restarted
+COORDINATION_RETRY = 60
+# With PYTHONASYNCIODEBUG=1, asyncio logs every callback blocking the loop longer than this
+SLOW_CALLBACK_DURATION = .005
+MONTHS = ['Janvier', 'Février', 'Mars', 'Avril', 'Mai', 'Juin', 'Juillet', 'Août', 'Septembre', 'Octobre',
+          'Novembre', 'Décembre']
+
+
+# Returns the seconds elapsed since the process started
+def process_uptime():
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (IOError, OSError, ValueError, IndexError):
+        # No procfs, count from the import of this module
+        return time.monotonic() - IMPORTED_AT
 
 
 class Watering:
     def __init__(self):
+        # Snapshot left by a previous run of the process, None after a cold boot
+        snapshot = self.load_state()
+
+        # Configuration file over param.py, its pins are only read here
+        # Only the pins are read before the relay is safe, as they tell which pin the relay is on
+        self.config, self.pins = config.load_startup(param.CONFIG_FILE, param.GPIO)
+
+        # Put the relay to the off position before anything else, unless a watering is still running
+        # The relay is driven by relayd (param.RELAYD) or by this process
+        GPIO.setwarnings(False)
+        GPIO.setmode(GPIO.BOARD)
+        self.relay = relayd.create_relay(param.RELAYD, self.pins.relay, GPIO)
+        self.relay_max_on = None  # Seconds the relay was switched on for, None until stopped
+        self.relayd_down = False  # No watering starts while relayd is down, until it is back
+        relay_on = False
+        if snapshot and snapshot['ongoingWatering']:
+            relay_on = self.relay.is_on()
+        if not relay_on:
+            self.relay.set(False)
+
+        self.config_watcher = config.ConfigWatcher(param.CONFIG_FILE) if param.CONFIG_FILE else None
+
         # Watering variables
         self.daysBetweenWatering = 3  # Number of days between one watering
         self.startTime = [23, 50]  # [hh, mm]
         self.durationOfWatering = 40  # in minutes
-        self.modeList = ['AUTO', 'MANU']  # List of available modes
+        self.budget = None  # SeasonalBudget scaling durationOfWatering, None to always water durationOfWatering
+        self.projection_key = None  # What projection was computed from
+        self.projection = None  # Pump hours over the next 365 days
+        self.volumeOfWatering = 100  # in litres
+        self.stopOnVolume = False  # Ends the watering at volumeOfWatering (flow meter needed), durationOfWatering is then a safety cap
+        self.modeList = list(config.MODES)  # List of available modes
         self.currentModeSelected = 0
         self.lastWatering = None  # Last date of watering
+        self.schedule = None  # CalendarSchedule of the configuration file, None to water every daysBetweenWatering days
+        self.next_watering_key = None  # What next_watering_date was computed from
+        self.next_watering_date = None
         self.ongoingWatering = False  # Is the watering on going or not
         self.endWateringDate = None  # Contains the datetime of the end of the current watering
 
         # Emergency
         self.emergency_on = False
 
-        # Process
-        self.watering_process = None
-        self.emergency_process = None
+        # Soil moisture sensor (param.MOISTURE), None to water on the schedule only
+        self.moisture_sensor = None
+        self.moisture_pending = bool(param.MOISTURE)  # Sensor still being created
+
+        # Flow meter (param.FLOW), None without one
+        self.flow_meter = None
+        self.flow = None
+        self.lastWateringVolume = None  # Litres delivered by the last watering
+        if param.FLOW:
+            import flow
+            self.flow_meter = flow.FlowMeter(self.pins.flow)
+            self.flow = flow.FlowAggregator(self.flow_meter, **param.FLOW)
+
+        # Forecast files (param.WEATHER), None to ignore the weather
+        self.weather = None
+        if param.WEATHER:
+            import weather
+            self.weather = weather.ForecastCache(**param.WEATHER)
+        self.wateringFactor = 1.0  # Weather factor applied to the current watering
+        self.lastSkip = None  # Last watering skipped because of the weather
+        self.weather_loading = False  # Forecast files being parsed in an executor
+
+        # Tasks
+        self.loop = None
+        self.main_task = None
+        self.tasks = set()
+        self.watering_task = None
+        self.emergency_task = None
+        self.status_task = None
+        self.date_lock = None
+        self.activity = None
+
+        # Channel => button callback, filled by setup_gpio
+        self.btn_handlers = [None] * len(self.pins.buttons)
+
+        # Seconds between the process start and the first schedule evaluation
+        self.first_check_delay = None
 
         # Menu
         self.currentMenuSelected = 0
@@ -64,112 +171,609 @@ class Watering:
         self.DAYS_OF_WATERING_CONFIG_MENU = 1
         self.START_WATERING_AT_CONFIG_MENU = 2
         self.DURATION_OF_WATERING_CONFIG_MENU = 3
-        self.MODE_SELECTION_CONFIG_MENU = 4
-        self.CHANGE_DAY_DATE_CONFIG_MENU = 5
-        self.CHANGE_MONTH_DATE_CONFIG_MENU = 6
-        self.CHANGE_YEAR_DATE_CONFIG_MENU = 7
-        self.CHANGE_HOUR_DATE_CONFIG_MENU = 8
-        self.CHANGE_MINUTE_DATE_CONFIG_MENU = 9
+        self.BUDGET_CONFIG_MENU = 4
+        self.VOLUME_OF_WATERING_CONFIG_MENU = 5
+        self.END_OF_WATERING_CONFIG_MENU = 6
+        self.MODE_SELECTION_CONFIG_MENU = 7
+        self.CHANGE_DAY_DATE_CONFIG_MENU = 8
+        self.CHANGE_MONTH_DATE_CONFIG_MENU = 9
+        self.CHANGE_YEAR_DATE_CONFIG_MENU = 10
+        self.CHANGE_HOUR_DATE_CONFIG_MENU = 11
+        self.CHANGE_MINUTE_DATE_CONFIG_MENU = 12
         self.configMenu = {
-            0: (self.display_menu_start_stop_watering, "Demarrer/Arreter"),
+            0: (self.display_menu_start_stop_watering, "Démarrer/Arrêter"),
             1: (self.display_menu_watering_days, "Jours d'arro."),
-            2: (self.display_menu_start_time, "Heure de debut"),
-            3: (self.display_menu_duration, "Duree d'arro."),
-            4: (self.display_menu_mode, "Mode d'arro."),
-            5: (self.display_menu_change_day_date, 'Changer le jour'),
-            6: (self.display_menu_change_month_date, 'Changer le mois'),
-            7: (self.display_menu_change_year_date, 'Changer l\'annee'),
-            8: (self.display_menu_change_hour_date, 'Changer l\'heure'),
-            9: (self.display_menu_change_minute_date, 'Changer les min')
+            2: (self.display_menu_start_time, "Heure de début"),
+            3: (self.display_menu_duration, "Durée d'arro."),
+            4: (self.display_menu_budget, "Budget saison"),
+            5: (self.display_menu_volume, "Volume d'arro."),
+            6: (self.display_menu_end_of_watering, "Fin d'arro."),
+            7: (self.display_menu_mode, "Mode d'arro."),
+            8: (self.display_menu_change_day_date, 'Changer le jour'),
+            9: (self.display_menu_change_month_date, 'Changer le mois'),
+            10: (self.display_menu_change_year_date, 'Changer l\'année'),
+            11: (self.display_menu_change_hour_date, 'Changer l\'heure'),
+            12: (self.display_menu_change_minute_date, 'Changer les min')
         }
 
         # LCD setup and startup
         self.last_activity = datetime.datetime.today()
         self.time_before_switch_off = 60 * 5  # In seconds
-        self.lcd = CharLCD(pin_backlight=18, backlight_mode=BacklightMode.active_high, pin_rw=None)
-        self.lcd.backlight = True
-        self.lcd.cursor_pos = (0, 0)
-        self.lcd.write_string('Demarrage en cours..')
-        self.lcd.cursor_pos = (1, 0)
-        self.lcd.write_string('Initialisation des')
-        self.lcd.cursor_pos = (2, 0)
-        self.lcd.write_string('parametres ')
-        self.lcd.cursor_mode = CursorMode.blink
+        self.lcd_enabled = True  # Wanted display state, applied by the LCD writer
+        self.status_lines = None  # Transient status message shown instead of the menu
+        self.frame = None  # Next frame to be written to the LCD
+        self.last_frame = None  # Last frame written to the LCD
+        self.lcd_jobs = collections.deque()  # LCD operations waiting for the writer
+        self.lcd_wakeup = None
+        # All LCD I/O happens in this single thread so the loop never waits on the bus
+        self.lcd_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.lcd = None  # Created by the LCD writer, see create_lcd()
+        self.lcd_content = None  # What the LCD shows after a warm restart
+        # Pushes a frame as soon as a button changed the state instead of at the next tick
+        self.present_on_change = param.LCD.get('present_on_change', True)
+        self.frame_written_at = None  # Monotonic time the last frame was written, in the LCD thread
+
+        # Local API (param.API), None without one
+        self.api = None
+        if param.API:
+            import api
+            self.api = api.ApiServer(self, **param.API)
+
+        # Events published to the fleet aggregator (param.FLEET), None without one
+        self.publisher = None
+        if param.FLEET:
+            import fleet
+            self.publisher = fleet.create_publisher(param.FLEET)
+
+        # Start time staggering (param.COORDINATOR), None without it
+        self.coordinator = None
+        if param.COORDINATOR:
+            import coordinator
+            self.coordinator = coordinator.create_coordinator(param.COORDINATOR)
+        self.startOffset = 0  # Minutes added to startTime by the coordinator
+        self.schedule_changed = None
+
+        # Sampling profiler (param.PROFILER), None without it
+        self.profiler = None
+        if param.PROFILER:
+            import profiler
+            self.profiler = profiler.SamplingProfiler(**param.PROFILER)
+
+        # Supervisor forcing the relay off and restarting the process (param.SUPERVISOR), None without it
+        self.supervisor = None
+        self.last_restart = None  # (reason, detection latency) when the supervisor restarted us
+        if param.SUPERVISOR:
+            import supervisor
+            self.supervisor = supervisor.create_supervisor(param.SUPERVISOR, self.force_relay_off)
+            self.last_restart = supervisor.last_restart()
+            if self.last_restart:
+                logger.warning('Restarted by the supervisor: %s, detected after %.3f s', *self.last_restart)
+
+        # Metrics, exposed as set in param.METRICS
+        self.metrics = metrics.Registry()
+        self.relay_on_since = None  # Monotonic time the relay went on, None when off
+        self.relay_on_total = 0.0  # Seconds, without the current watering
+        self.setup_metrics()
+        self.tracer = latency.InputTracer(self.metrics)
+
+        # Watering settings of the configuration file
+        try:
+            file_settings = config.validate_watering(self.config.get('watering', {}))
+        except config.ConfigError as e:
+            logger.error('Watering settings of %s ignored: %s', param.CONFIG_FILE, e)
+            file_settings = {}
+        self.apply_settings(file_settings)
+
+        # Warm restart
+        self.warm_start = snapshot is not None
+        if snapshot:
+            self.restore_state(snapshot, relay_on)
+            # Edited while the process was down, the file wins, the settings removed from it go back to their default
+            if self.config_watcher and snapshot.get('configMtime') != self.config_watcher.mtime:
+                self.apply_settings(dict(config.WATERING_DEFAULTS, **file_settings))
+
+        # Last snapshot of the watering state, written with the LCD content by save_state()
+        self.saved_state = self.snapshot()
 
         # Setup the GPIOs
-        self.setup_gpio(param.GPIO)
-
-        # Test if all LEDs work
-        self.test_setup()
-
-        # Clean the lcd
-        self.lcd.clear()
-        self.lcd.cursor_mode = CursorMode.hide
+        self.setup_gpio()
+
+        # The flow meter counts in the RPi.GPIO thread, without going through the loop
+        if self.flow_meter:
+            GPIO.add_event_detect(self.flow_meter.channel, GPIO.FALLING, callback=self.flow_meter.count)
+
+    # Loads the snapshot saved by save_state()
+    def load_state(self):
+        try:
+            with open(param.STATE_FILE) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    # Takes over the settings, the running watering and the LCD content of the previous process
+    def restore_state(self, snapshot, relay_on):
+        self.daysBetweenWatering = snapshot['daysBetweenWatering']
+        self.startTime = snapshot['startTime']
+        self.durationOfWatering = snapshot['durationOfWatering']
+        self.volumeOfWatering = snapshot.get('volumeOfWatering', self.volumeOfWatering)
+        self.stopOnVolume = snapshot.get('stopOnVolume', self.stopOnVolume)
+        self.wateringFactor = snapshot.get('wateringFactor', self.wateringFactor)
+        self.startOffset = snapshot.get('startOffset', self.startOffset)
+        if 'budget' in snapshot:
+            self.apply_settings({'budget': snapshot['budget']})
+        self.currentModeSelected = snapshot['currentModeSelected']
+        if snapshot['lastWatering']:
+            self.lastWatering = datetime.datetime.strptime(snapshot['lastWatering'], '%Y-%m-%dT%H:%M:%S.%f')
+
+        if relay_on:
+            self.ongoingWatering = True
+            self.endWateringDate = datetime.datetime.strptime(snapshot['endWateringDate'], '%Y-%m-%dT%H:%M:%S.%f')
+            logger.info('Watering still running, ends at %s', self.endWateringDate)
+            self.relay_on_since = time.monotonic()
+
+        # Only trust the LCD content if the previous process was not killed in the middle of a write
+        if snapshot['lcd'] and snapshot['lcd']['clean']:
+            self.lcd_content = [row.encode('latin-1') for row in snapshot['lcd']['content']]
+
+    # Returns what a warm restart needs of the watering state, in the loop
+    # Never modified once taken, so the LCD thread can write it without lock
+    def snapshot(self):
+        return {
+            'daysBetweenWatering': self.daysBetweenWatering,
+            'startTime': list(self.startTime),
+            'durationOfWatering': self.durationOfWatering,
+            'volumeOfWatering': self.volumeOfWatering,
+            'stopOnVolume': self.stopOnVolume,
+            'wateringFactor': self.wateringFactor,
+            'startOffset': self.startOffset,
+            'budget': self.budget.to_settings() if self.budget else None,
+            'configMtime': self.config_watcher.mtime if self.config_watcher else None,
+            'currentModeSelected': self.currentModeSelected,
+            'lastWatering': self.lastWatering.strftime('%Y-%m-%dT%H:%M:%S.%f') if self.lastWatering else None,
+            'ongoingWatering': self.ongoingWatering,
+            'endWateringDate': self.endWateringDate.strftime('%Y-%m-%dT%H:%M:%S.%f') if self.endWateringDate else None
+        }
 
-        # Put the relay to the off position
-        GPIO.output(param.GPIO['relay'][1], GPIO.LOW)
-        self.start()
+    # Saves the last snapshot and the LCD content, in the LCD thread
+    def save_state(self, lcd_clean=True):
+        state = dict(self.saved_state, lcd=None)
+        if self.lcd:
+            state['lcd'] = {
+                'clean': lcd_clean,
+                'content': [row.decode('latin-1') for row in self.lcd.content]
+            }
+
+        # Written next to the target then renamed, so a reader never sees half a file
+        try:
+            with open(param.STATE_FILE + '.tmp', 'w') as f:
+                json.dump(state, f)
+            os.rename(param.STATE_FILE + '.tmp', param.STATE_FILE)
+        except (IOError, OSError) as e:
+            logger.warning('Cannot save the state: %s', e)
+
+    # Saves the state after a change, from the loop
+    def request_save(self):
+        self.state_changed()
+        self.saved_state = self.snapshot()
+        self.lcd_executor.submit(self.save_state)
+
+    # Publishes the new status to the API and the fleet
+    def state_changed(self):
+        if self.schedule_changed:
+            self.schedule_changed.set()
+        if self.api or self.publisher:
+            status = self.status()
+            if self.api:
+                self.api.update(status)
+            if self.publisher:
+                self.publisher.observe(status)
+
+    # Returns the status served by the API
+    def status(self):
+        def iso(date):
+            return date.isoformat() if date else None
+
+        return {
+            'mode': self.modeList[self.currentModeSelected],
+            'ongoingWatering': self.ongoingWatering,
+            'emergency': self.emergency_on,
+            'relaydDown': self.relayd_down,
+            'nextWatering': iso(self.get_next_watering_date()),
+            'lastWatering': iso(self.lastWatering),
+            'endWateringDate': iso(self.endWateringDate) if self.ongoingWatering else None,
+            'daysBetweenWatering': self.daysBetweenWatering,
+            'startTime': list(self.startTime),
+            'durationOfWatering': self.durationOfWatering,
+            'effectiveDuration': self.effective_duration(),
+            'lastWateringVolume': self.lastWateringVolume
+        }
 
-    # GPIO configuration
-    def setup_gpio(self, array):
+    # Creates the LCD on the bus selected in param.LCD, in the LCD thread
+    def create_lcd(self, config):
+        from RPLCD import CharLCD, BacklightMode, I2CBus, WaveBus
+        from RPLCD.charmap import FRENCH_GLYPHS
+
+        kwargs = {'charmap': config.get('charmap', 'A00')}
+        if config.get('french_glyphs', True):
+            kwargs['glyphs'] = FRENCH_GLYPHS
+        # After a warm restart the controller is initialised and shows lcd_content
+        if self.lcd_content:
+            kwargs.update(initialised=True, content=self.lcd_content)
+
+        if config['bus'] == 'i2c':
+            bus = I2CBus(address=config['i2c_address'])
+        elif config['bus'] == 'wave':
+            bus = WaveBus(pin_backlight=24, backlight_mode=BacklightMode.active_high)
+        elif config.get('mirror_pins_e'):
+            # Mirrors on the same lines, only E differs, refreshed together
+            from RPLCD.multi import SharedBus, LCDGroup
+            shared = SharedBus(pins_e=[16] + list(config['mirror_pins_e']), pin_backlight=18,
+                               backlight_mode=BacklightMode.active_high)
+            return LCDGroup([CharLCD(bus=shared.port(i), **kwargs) for i in range(len(shared.pins_e))])
+        else:
+            return CharLCD(pin_backlight=18, backlight_mode=BacklightMode.active_high, pin_rw=None, **kwargs)
+
+        return CharLCD(bus=bus, **kwargs)
+
+    def setup_metrics(self):
+        m = self.metrics
+        self.metric_waterings = m.counter('watering_sessions_total', 'Waterings started')
+        m.counter('watering_relay_on_seconds_total', 'Time the relay has been on', function=self.relay_on_seconds)
+        self.metric_button_presses = m.counter('watering_button_presses_total', 'Button presses', ['button'])
+        m.counter('watering_lcd_bytes_sent_total', 'Bytes sent to the LCD controller',
+                  function=lambda: self.lcd.bytes_sent if self.lcd else 0)
+        m.gauge('watering_lcd_delay_late_seconds', 'Mean time the LCD bus delays ended late',
+                function=lambda: self.lcd_delay_stats()['late_mean_us'] / 1e6)
+        m.gauge('watering_lcd_delay_late_max_seconds', 'Longest time an LCD bus delay ended late',
+                function=lambda: self.lcd_delay_stats()['late_max_us'] / 1e6)
+        self.metric_loop_iterations = m.counter('watering_loop_iterations_total', 'Control loop iterations')
+        m.gauge('watering_next_watering_seconds', 'Time before the next watering, NaN when none is planned',
+                function=self.next_watering_seconds)
+        m.gauge('watering_projected_pump_hours', 'Hours the pump is planned to run over the next 365 days',
+                function=self.projected_pump_hours)
+        self.metric_loop_latency = m.summary('watering_loop_latency_seconds', 'Control loop wake-up delay')
+        self.metric_relay_latency = m.summary('watering_relay_command_latency_seconds',
+                                              'Time between a relay command and the relay switching')
+        if self.supervisor:
+            import supervisor
+            m.gauge('watering_supervisor_detection_seconds',
+                    'Time the supervisor took to see the violation that restarted the process, NaN without one',
+                    function=lambda: self.last_restart[1] if self.last_restart else float('nan'))
+            m.gauge('watering_resident_memory_bytes', 'Resident memory, as seen by the supervisor',
+                    function=lambda: supervisor.resident_memory() or float('nan'))
+        # Channel => button_presses child, filled by setup_gpio
+        self.btn_presses = [None] * len(self.pins.buttons)
+
+    # Overshoot of time.sleep and lateness of the LCD bus delays, see RPLCD.timing
+    def lcd_delay_stats(self):
+        from RPLCD.timing import DELAY
+        return DELAY.stats()
+
+    def relay_on_seconds(self):
+        if self.relay_on_since is None:
+            return self.relay_on_total
+        return self.relay_on_total + time.monotonic() - self.relay_on_since
+
+    def next_watering_seconds(self):
+        if self.ongoingWatering or self.modeList[self.currentModeSelected] != "AUTO":
+            return float('nan')
+        next_watering_date = self.get_next_watering_date()
+        if next_watering_date is None:
+            return float('nan')
+        return (next_watering_date - datetime.datetime.today()).total_seconds()
+
+    # GPIO configuration, from the compiled pins
+    def setup_gpio(self):
         GPIO.setwarnings(False)
         GPIO.setmode(GPIO.BOARD)
 
-        # v[0] contains the key
-        # v[1] contains the value
-        for v in array.items():
-            if isinstance(v[1], dict):
-                self.setup_gpio(v[1])
-            else:
-                if v[1][0].upper() == "IN":
-                    GPIO.setup(v[1][1], GPIO.IN, pull_up_down=GPIO.PUD_UP)
-
-                    # Define callback method
-                    if v[0] in ['left', 'right']:
-                        GPIO.add_event_detect(v[1][1], GPIO.FALLING, callback=self.left_right_btn_pressed,
-                                              bouncetime=500)
-                    elif v[0] in ['up', 'bottom']:
-                        GPIO.add_event_detect(v[1][1], GPIO.FALLING, callback=self.up_bottom_btn_pressed,
-                                              bouncetime=500)
-                    elif v[0] == 'emergency':
-                        GPIO.add_event_detect(v[1][1], GPIO.FALLING, callback=self.emergency_btn_pressed,
-                                              bouncetime=2000)
-                else:
-                    GPIO.setup(v[1][1], GPIO.OUT)
+        # Button => (callback, bounce time in ms)
+        buttons = {
+            'left': (self.left_right_btn_pressed, 500),
+            'right': (self.left_right_btn_pressed, 500),
+            'up': (self.up_bottom_btn_pressed, 500),
+            'bottom': (self.up_bottom_btn_pressed, 500),
+            'emergency': (self.emergency_btn_pressed, 2000)
+        }
+        for name in config.BUTTONS:
+            channel = getattr(self.pins, name)
+            GPIO.setup(channel, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+            self.btn_handlers[channel] = buttons[name][0]
+            self.btn_presses[channel] = self.metric_button_presses.labels(name)
+            GPIO.add_event_detect(channel, GPIO.FALLING, callback=self.gpio_edge, bouncetime=buttons[name][1])
+
+        # The relay is already set up by __init__
+        GPIO.setup(self.pins.green, GPIO.OUT, initial=GPIO.LOW)
+        GPIO.setup(self.pins.red, GPIO.OUT, initial=GPIO.LOW)
+        # The flow pin is left alone without param.FLOW
+        if self.flow_meter:
+            GPIO.setup(self.pins.flow, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+
+    # Applies validated watering settings (see config.validate_watering)
+    def apply_settings(self, settings):
+        for key in ('daysBetweenWatering', 'durationOfWatering', 'volumeOfWatering', 'stopOnVolume'):
+            if key in settings:
+                setattr(self, key, settings[key])
+        if 'startTime' in settings:
+            self.startTime = list(settings['startTime'])
+        if 'mode' in settings:
+            self.currentModeSelected = self.modeList.index(settings['mode'])
+        if 'schedule' in settings:
+            self.schedule = None
+            if settings['schedule']:
+                import schedule
+                self.schedule = schedule.from_settings(settings['schedule'])
+        if 'budget' in settings:
+            self.budget = None
+            if settings['budget']:
+                import budget
+                self.budget = budget.from_settings(settings['budget'])
 
     # Test if all LEDs work
-    def test_setup(self):
-        GPIO.output(param.GPIO['led']['green'][1], GPIO.HIGH)
-        GPIO.output(param.GPIO['led']['red'][1], GPIO.HIGH)
-        time.sleep(5)
-        GPIO.output(param.GPIO['led']['green'][1], GPIO.LOW)
-        GPIO.output(param.GPIO['led']['red'][1], GPIO.LOW)
-
+    async def test_setup(self):
+        GPIO.output(self.pins.green, GPIO.HIGH)
+        GPIO.output(self.pins.red, GPIO.HIGH)
+        await asyncio.sleep(SELF_TEST_DURATION)
+        GPIO.output(self.pins.green, GPIO.LOW)
+        GPIO.output(self.pins.red, GPIO.LOW)
+
+    # Runs the controller until the process is stopped
     def start(self):
+        try:
+            asyncio.run(self.run())
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            logger.info('Stopped')
+        except Exception:
+            # Nothing drives the relay once the process is gone
+            logger.critical('Controller failed, relay off', exc_info=True)
+            self.relay.set(False)
+            raise
+        finally:
+            # The watchdog must not reboot the Pi once the process is gone
+            if self.supervisor:
+                self.supervisor.stop()
+
+    # SIGTERM (systemctl stop) ends run(), a running watering carries on after a restart
+    def stop(self):
+        self.main_task.cancel()
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.main_task = asyncio.current_task()
+        self.loop.add_signal_handler(signal.SIGTERM, self.stop)
+        self.loop.slow_callback_duration = SLOW_CALLBACK_DURATION
+        self.date_lock = asyncio.Lock()
+        self.activity = asyncio.Event()
+        self.lcd_wakeup = asyncio.Event()
+        if self.supervisor:
+            self.supervisor.start()
+
+        # The LED self-test and the LCD init (in the LCD writer) run alongside the schedule
+        # A warm restart carries on silently
+        if not self.warm_start:
+            self.spawn(self.test_setup())
+            self.show_status([
+                'Démarrage en cours..',
+                'Initialisation des',
+                'paramètres ',
+                None
+            ], SELF_TEST_DURATION)
+        if self.ongoingWatering:
+            self.watering_task = self.spawn(self.watering())
+        if param.MOISTURE:
+            self.spawn(self.start_moisture_sensor())
+        if self.flow:
+            self.spawn(self.flow_monitor())
+        if self.api or self.publisher:
+            self.state_changed()
+        if self.api:
+            self.spawn(self.api.serve())
+        if self.publisher:
+            self.spawn(self.publisher.run())
+        if self.coordinator:
+            self.schedule_changed = asyncio.Event()
+            self.spawn(self.coordinate())
+        if self.profiler:
+            self.loop.add_signal_handler(signal.SIGUSR2, self.profiler.toggle)
+        if param.METRICS and param.METRICS.get('file'):
+            self.spawn(self.metrics.export(param.METRICS['file'], param.METRICS.get('interval', 15)))
+        elif param.METRICS:
+            self.spawn(self.metrics.serve(param.METRICS['port'], param.METRICS.get('host', '127.0.0.1')))
+
+        await asyncio.gather(
+            self.spawn(self.lcd_writer()),
+            self.spawn(self.inactivity_timeout()),
+            self.spawn(self.control_loop())
+        )
+
+    # Starts sampling the soil moisture in its own thread
+    async def start_moisture_sensor(self):
+        try:
+            self.moisture_sensor = await self.loop.run_in_executor(None, self.create_moisture_sensor)
+        finally:
+            self.moisture_pending = False
+
+    def create_moisture_sensor(self):
+        # Imported here as NumPy is slow to import
+        import sensors
+        return sensors.create_moisture_sensor(param.MOISTURE)
+
+    # Aggregates the flow meter pulses and cuts the water on a leak or a burst pipe
+    async def flow_monitor(self):
+        while True:
+            await asyncio.sleep(FLOW_INTERVAL)
+            alarm = self.flow.update(time.monotonic(), self.ongoingWatering)
+            # Raised once, until the emergency is cleared (button or API)
+            if alarm and not self.emergency_on:
+                logger.error('Flow alarm (%s): %.1f L/min', alarm, self.flow.rate)
+                self.start_emergency_mode()
+
+    # Asks the coordinator for a slot whenever the start time or the duration changes
+    async def coordinate(self):
+        controller_id = param.COORDINATOR.get('controller_id') or socket.gethostname()
+        asked = None
+        while True:
+            self.schedule_changed.clear()
+            slot = (list(self.startTime), self.effective_duration())
+            try:
+                if slot != asked:
+                    offset = await self.coordinator.request(controller_id, slot[0], slot[1],
+                                                            param.COORDINATOR.get('flow', 15))
+                    asked = slot
+                    if offset is None:
+                        logger.warning('No slot from the coordinator, starting at %s', self.display_time())
+                        offset = 0
+                    if offset != self.startOffset:
+                        logger.info('Start time offset by %d min', offset)
+                        self.startOffset = offset
+                        self.request_save()
+                timeout = COORDINATION_INTERVAL
+            except (IOError, OSError, ValueError, asyncio.TimeoutError) as e:
+                logger.warning('Cannot reach the coordinator: %s', e)
+                timeout = COORDINATION_RETRY
+
+            try:
+                await asyncio.wait_for(self.schedule_changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                asked = None
+
+    # Runs a coroutine as a task, logging its failure
+    def spawn(self, coro):
+        task = self.loop.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.task_done)
+        return task
+
+    def task_done(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Task %r failed', task, exc_info=task.exception())
+
+    # Cancels a task, unless it is the one currently running
+    def cancel(self, task):
+        if task and task is not asyncio.current_task():
+            task.cancel()
+
+    # Evaluates the schedule and refreshes the menu every TICK_INTERVAL
+    async def control_loop(self):
+        while True:
+            self.tick()
+            self.metric_loop_iterations.inc()
+            # Only a tick that went through tells the supervisor the loop is alive
+            if self.supervisor:
+                self.supervisor.heartbeat(self.relay_deadline())
+            expected = self.loop.time() + TICK_INTERVAL
+            await asyncio.sleep(TICK_INTERVAL)
+            self.metric_loop_latency.observe(self.loop.time() - expected)
+
+    # One iteration of the control loop
+    def tick(self):
+        relay_latency, cut, relayd_down = self.relay.poll()
+        if relay_latency is not None:
+            self.metric_relay_latency.observe(relay_latency)
+        # The relay is driven by this process until relayd is back, no watering starts meanwhile
+        if relayd_down != self.relayd_down:
+            self.relayd_down = relayd_down
+            if relayd_down:
+                self.stop_watering()
+            self.state_changed()
+        elif cut and self.ongoingWatering:
+            logger.error('Relay switched off by relayd at its max on-time')
+            self.finish_watering()
+        # Switched to mode ON during a watering, which now lasts until stopped
+        elif self.ongoingWatering and self.relay_max_on is not None and self.modeList[self.currentModeSelected] == "ON":
+            self.relay_max_on = None
+            self.relay.set(True)
+
+        # Displays the menu only if the screen is on
+        if self.lcd_enabled:
+            self.display_menu()
+
+        # Applies the watering settings of the configuration file when it changes
+        if self.config_watcher:
+            settings = self.config_watcher.poll()
+            if settings is not None:
+                self.apply_settings(settings)
+                logger.info('Configuration reloaded: %s', settings)
+                self.request_save()
+
+        # Picks up new forecast files, at most once per check_interval, parsed out of the loop
+        if self.weather and not self.weather_loading and self.weather.due():
+            self.weather_loading = True
+            self.spawn(self.load_weather())
+
+        # Calculates if it has to water or not
+        # If mode AUTO
+        if self.modeList[self.currentModeSelected] == "AUTO" and self.has_to_water() and not self.ongoingWatering:
+            self.start_watering(self.weather_factor())
+        # Stops the watering after duration specified
+        elif self.ongoingWatering and self.endWateringDate < datetime.datetime.today():
+            self.stop_watering()
+        # Or once the volume is delivered
+        elif self.ongoingWatering and self.volume_reached():
+            self.stop_watering()
+
+        if self.first_check_delay is None:
+            self.first_check_delay = process_uptime()
+            logger.info('First schedule check %d ms after process start', self.first_check_delay * 1000)
+
+    # Returns the monotonic time the supervisor forces the relay off at, None when it is off or in mode ON
+    def relay_deadline(self):
+        if not self.ongoingWatering or self.modeList[self.currentModeSelected] == "ON":
+            return None
+        return self.supervisor.deadline((self.endWateringDate - datetime.datetime.today()).total_seconds())
+
+    # Called by the supervisor, from its thread, before it restarts the process
+    def force_relay_off(self):
+        self.relay.set(False)
+
+    # Parses the forecast files in an executor, then swaps the factors in
+    async def load_weather(self):
+        try:
+            loaded = await self.loop.run_in_executor(None, self.weather.load)
+            if loaded is not None:
+                self.weather.apply(loaded)
+        finally:
+            self.weather_loading = False
+
+    # Switches the LCD off after time_before_switch_off without activity, and back on at the first press
+    async def inactivity_timeout(self):
         while True:
             date_diff = datetime.datetime.today() - self.last_activity
-            if self.lcd.display_enabled and date_diff.seconds > self.time_before_switch_off and self.currentMenuSelected != self.CONFIG_DETAILS_MENU:
+            remaining = self.time_before_switch_off - date_diff.total_seconds()
+            if self.lcd_enabled and remaining < 0 and self.currentMenuSelected != self.CONFIG_DETAILS_MENU:
                 self.switch_off_lcd()
                 self.currentMenuSelected = self.HOME_MENU
-            elif not self.lcd.display_enabled and date_diff.seconds < self.time_before_switch_off:
+            elif not self.lcd_enabled and remaining > 0:
                 self.switch_on_lcd()
                 self.display_menu()
-            else:
-                # Displays the menu only if the screen is on
-                self.display_menu()
 
-            # Calculates if it has to water or not
-            # If mode AUTO
-            if self.modeList[self.currentModeSelected] == "AUTO" and self.has_to_water() and not self.ongoingWatering:
-                self.start_watering()
-            # Stops the watering after duration specified
-            elif self.ongoingWatering and self.endWateringDate < datetime.datetime.today():
-                self.stop_watering()
-            time.sleep(.5)
+            self.activity.clear()
+            try:
+                await asyncio.wait_for(self.activity.wait(), max(remaining, TICK_INTERVAL))
+            except asyncio.TimeoutError:
+                pass
+
+    # Called from the RPi.GPIO thread, hands the edge over to the loop
+    def gpio_edge(self, channel):
+        loop = self.loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self.btn_pressed, channel, time.monotonic())
+
+    # Dispatches a button press, in the loop
+    def btn_pressed(self, channel, edge_time):
+        dispatched = time.monotonic()
+        self.btn_presses[channel].inc()
+        self.btn_handlers[channel](channel)
+        self.tracer.pressed(edge_time, dispatched, time.monotonic())
+        self.activity.set()
+        self.request_save()
+        if self.present_on_change and self.lcd_enabled:
+            self.display_menu()
 
     # Changes the currentMenuSelected
     def left_right_btn_pressed(self, channel):
-        if not self.lcd.display_enabled:
+        if not self.lcd_enabled:
             self.last_activity = datetime.datetime.today()
             return
         self.last_activity = datetime.datetime.today()
@@ -177,128 +781,151 @@ class Watering:
         if self.emergency_on:
             return
 
-        if param.GPIO['btn']['right'][1] == channel:
+        if self.pins.right == channel:
             self.currentMenuSelected = self.currentMenuSelected + 1 if self.currentMenuSelected < len(
                 self.mainMenu) - 2 else 0
-        elif param.GPIO['btn']['left'][1] == channel:
+        elif self.pins.left == channel:
             self.currentMenuSelected = self.currentMenuSelected - 1 if self.currentMenuSelected > 0 else 0
 
     # Changes the value of the corresponding currentMenuSelected
     def up_bottom_btn_pressed(self, channel):
-        if not self.lcd.display_enabled:
+        if not self.lcd_enabled:
             self.last_activity = datetime.datetime.today()
             return
         self.last_activity = datetime.datetime.today()
 
         # Change the current selected config menu
         if self.currentMenuSelected == self.CONFIG_MENU:
-            if param.GPIO['btn']['up'][1] == channel:
+            if self.pins.up == channel:
                 self.configMenuSelected = self.configMenuSelected - 1 if self.configMenuSelected > 0 else len(
                     self.configMenu) - 1
-            if param.GPIO['btn']['bottom'][1] == channel:
+            if self.pins.bottom == channel:
                 self.configMenuSelected = self.configMenuSelected + 1 if self.configMenuSelected < len(
                     self.configMenu) - 1 else 0
 
         # Adds or removes days between watering
         elif self.configMenuSelected == self.DAYS_OF_WATERING_CONFIG_MENU:
-            if param.GPIO['btn']['up'][1] == channel:
+            if self.pins.up == channel:
                 self.daysBetweenWatering = self.daysBetweenWatering + 1 if self.daysBetweenWatering < 7 else 1
-            if param.GPIO['btn']['bottom'][1] == channel:
+            if self.pins.bottom == channel:
                 self.daysBetweenWatering = self.daysBetweenWatering - 1 if self.daysBetweenWatering > 1 else 7
 
         # Defines the time when the watering must start
         elif self.configMenuSelected == self.START_WATERING_AT_CONFIG_MENU:
-            if param.GPIO['btn']['up'][1] == channel:
+            if self.pins.up == channel:
                 self.add_start_time()
-            if param.GPIO['btn']['bottom'][1] == channel:
+            if self.pins.bottom == channel:
                 self.remove_start_time()
 
         # Adds or removes the duration of watering
         elif self.configMenuSelected == self.DURATION_OF_WATERING_CONFIG_MENU:
-            if param.GPIO['btn']['up'][1] == channel:
+            if self.pins.up == channel:
                 self.durationOfWatering += 10
-            if param.GPIO['btn']['bottom'][1] == channel and self.durationOfWatering > 10:
+            if self.pins.bottom == channel and self.durationOfWatering > 10:
                 self.durationOfWatering -= 10
 
+        # Raises or lowers the budget of the current month (or week)
+        elif self.configMenuSelected == self.BUDGET_CONFIG_MENU:
+            if self.budget is None:
+                import budget
+                self.budget = budget.SeasonalBudget(months=[100] * 12)
+            if self.pins.up == channel:
+                self.budget.change(datetime.date.today(), 1)
+            if self.pins.bottom == channel:
+                self.budget.change(datetime.date.today(), -1)
+
+        # Adds or removes the volume of watering
+        elif self.configMenuSelected == self.VOLUME_OF_WATERING_CONFIG_MENU:
+            if self.pins.up == channel:
+                self.volumeOfWatering += 10
+            if self.pins.bottom == channel and self.volumeOfWatering > 10:
+                self.volumeOfWatering -= 10
+
+        # Ends the watering after the duration or the volume
+        elif self.configMenuSelected == self.END_OF_WATERING_CONFIG_MENU:
+            if self.pins.up == channel or self.pins.bottom == channel:
+                self.stopOnVolume = not self.stopOnVolume
+
         # Changes the current mode
         elif self.configMenuSelected == self.MODE_SELECTION_CONFIG_MENU:
             length = len(self.modeList)
             
-            if param.GPIO['btn']['up'][1] == channel:
+            if self.pins.up == channel:
                 self.currentModeSelected = self.currentModeSelected + 1 if self.currentModeSelected < length - 1 else 0
-            if param.GPIO['btn']['bottom'][1] == channel:
+            if self.pins.bottom == channel:
                 self.currentModeSelected = self.currentModeSelected - 1 if self.currentModeSelected > 0 else length - 1
 
         # Change the current datetime of the OS
         elif self.configMenuSelected == self.CHANGE_DAY_DATE_CONFIG_MENU:
-            if param.GPIO['btn']['up'][1] == channel:
-                subprocess.call(["sudo", "date", "-s", "+1 day"])
-            elif param.GPIO['btn']['bottom'][1] == channel:
-                subprocess.call(["sudo", "date", "-s", "-1 day"])
-
-            subprocess.call(["sudo", "hwclock", "-w"])
+            self.change_date(channel, 'day')
 
         elif self.configMenuSelected == self.CHANGE_MONTH_DATE_CONFIG_MENU:
-            if param.GPIO['btn']['up'][1] == channel:
-                subprocess.call(["sudo", "date", "-s", "+1 month"])
-            elif param.GPIO['btn']['bottom'][1] == channel:
-                subprocess.call(["sudo", "date", "-s", "-1 month"])
-
-            subprocess.call(["sudo", "hwclock", "-w"])
+            self.change_date(channel, 'month')
 
         elif self.configMenuSelected == self.CHANGE_YEAR_DATE_CONFIG_MENU:
-            if param.GPIO['btn']['up'][1] == channel:
-                subprocess.call(["sudo", "date", "-s", "+1 year"])
-            elif param.GPIO['btn']['bottom'][1] == channel:
-                subprocess.call(["sudo", "date", "-s", "-1 year"])
-
-            subprocess.call(["sudo", "hwclock", "-w"])
+            self.change_date(channel, 'year')
 
         elif self.configMenuSelected == self.CHANGE_HOUR_DATE_CONFIG_MENU:
-            if param.GPIO['btn']['up'][1] == channel:
-                subprocess.call(["sudo", "date", "-s", "+1 hour"])
-            elif param.GPIO['btn']['bottom'][1] == channel:
-                subprocess.call(["sudo", "date", "-s", "-1 hour"])
-
-            subprocess.call(["sudo", "hwclock", "-w"])
+            self.change_date(channel, 'hour')
 
         elif self.configMenuSelected == self.CHANGE_MINUTE_DATE_CONFIG_MENU:
-            if param.GPIO['btn']['up'][1] == channel:
-                subprocess.call(["sudo", "date", "-s", "+1 minute"])
-            elif param.GPIO['btn']['bottom'][1] == channel:
-                subprocess.call(["sudo", "date", "-s", "-1 minute"])
-
-            subprocess.call(["sudo", "hwclock", "-w"])
+            self.change_date(channel, 'minute')
+
+    # Shifts the OS date by one unit in the direction of the button
+    def change_date(self, channel, unit):
+        shift = None
+        if self.pins.up == channel:
+            shift = '+1 ' + unit
+        elif self.pins.bottom == channel:
+            shift = '-1 ' + unit
+
+        self.spawn(self.set_system_date(shift))
+
+    # Runs date and hwclock without blocking the loop
+    async def set_system_date(self, shift):
+        commands = [["sudo", "hwclock", "-w"]]
+        if shift:
+            commands.insert(0, ["sudo", "date", "-s", shift])
+
+        async with self.date_lock:
+            for command in commands:
+                process = await asyncio.create_subprocess_exec(*command)
+                try:
+                    await asyncio.wait_for(process.wait(), DATE_COMMAND_TIMEOUT)
+                except asyncio.TimeoutError:
+                    process.kill()
+                    logger.error('%s timed out', ' '.join(command))
+                    return
 
     # Stops or start the emergency
     def emergency_btn_pressed(self, channel):
-        return
         self.last_activity = datetime.datetime.today()
 
         # Stops
         if self.emergency_on:
-            if self.emergency_process.is_alive():
-                self.emergency_process.terminate()
-
-            self.emergency_on = False
-            self.currentMenuSelected = self.HOME_MENU
-            GPIO.output(param.GPIO['led']['red'][1], GPIO.LOW)
+            self.stop_emergency_mode()
         # Starts
         else:
-            self.emergency_on = True
-            self.currentMenuSelected = self.EMERGENCY_MENU
-            self.stop_watering()
+            self.start_emergency_mode()
+
+    # Cuts the water and blinks the red LED until the emergency is stopped
+    def start_emergency_mode(self):
+        self.emergency_on = True
+        self.currentMenuSelected = self.EMERGENCY_MENU
+        self.stop_watering()
 
-            # If an old process exists -> terminate
-            if self.emergency_process:
-                if self.emergency_process.is_alive():
-                    self.emergency_process.terminate()
+        # If an old task exists -> cancel
+        self.cancel(self.emergency_task)
+        self.emergency_task = self.spawn(self.start_emergency())
 
-                self.emergency_process = None
+    # Lets the waterings start again and stops the red LED
+    def stop_emergency_mode(self):
+        self.cancel(self.emergency_task)
+        self.emergency_task = None
 
-            # Creation of the new process
-            self.emergency_process = multiprocessing.Process(target=self.start_emergency)
-            self.emergency_process.start()
+        self.emergency_on = False
+        self.currentMenuSelected = self.HOME_MENU
+        GPIO.output(self.pins.red, GPIO.LOW)
 
     # Adds 10 minutes to the start time
     def add_start_time(self):
@@ -328,19 +955,128 @@ class Watering:
 
     # Displays the main menu
     def display_menu(self):
+        # A transient status message hides the menu while it lasts
+        if self.status_lines:
+            self.display_2_lcd(self.status_lines)
+            return
+
         self.mainMenu.get(self.currentMenuSelected)()
 
-    # Display the menu to the LCD
+    # Shows a status message instead of the menu during duration seconds
+    def show_status(self, lines, duration=STATUS_DURATION):
+        self.status_lines = lines
+        self.cancel(self.status_task)
+        self.status_task = self.spawn(self.clear_status(duration))
+        self.display_menu()
+
+    async def clear_status(self, duration):
+        await asyncio.sleep(duration)
+        self.status_lines = None
+
+    # Hands the menu over to the LCD writer
     def display_2_lcd(self, lines):
+        # Presses shown by this frame are done if it is already on the LCD
+        self.tracer.frame_built(time.monotonic(), lines == self.last_frame)
+        self.frame = lines
+        self.lcd_wakeup.set()
+
+    # Queues an LCD operation for the LCD writer
+    def lcd_job(self, func, *args):
+        self.lcd_jobs.append((func, args))
+        self.lcd_wakeup.set()
+
+    # Runs an LCD operation in the LCD thread, returns False when it failed
+    # An LCD error (e.g. OSError 121 from the I2C bus) is logged, it never reaches the loop
+    async def lcd_call(self, func, *args):
+        try:
+            await asyncio.wait_for(self.loop.run_in_executor(self.lcd_executor, self.run_lcd_job, func, args),
+                                   LCD_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error('LCD operation %s timed out', func)
+            return False
+        except Exception as e:
+            logger.error('LCD operation %s failed: %r', func, e)
+            return False
+        return True
+
+    # Runs an LCD operation in the LCD thread, flagging the LCD content as unknown while it runs
+    # Only the LCD part changes around the job, the watering state is the last snapshot of the loop
+    def run_lcd_job(self, func, args):
+        self.save_state(lcd_clean=False)
+        func(*args)
+        self.save_state()
+
+    # Creates the LCD in the LCD thread, returns False when it failed
+    async def open_lcd(self):
+        try:
+            self.lcd = await self.loop.run_in_executor(self.lcd_executor, self.create_lcd, param.LCD)
+        except Exception as e:
+            logger.error('Cannot initialise the LCD: %r', e)
+            return False
+        logger.info('LCD ready, time.sleep oversleeps by %.0f us', self.lcd_delay_stats()['sleep_overshoot_us'])
+        # The content of a warm restart is only valid once, the whole frame is written again
+        self.lcd_content = None
+        self.last_frame = None
+        self.request_save()
+        return True
+
+    # Creates the LCD, then applies the queued LCD operations and the latest frame
+    # A frame that failed is written again after LCD_RETRY_DELAY, the LCD is initialised again after
+    # LCD_REINIT_FAILURES failures in a row
+    async def lcd_writer(self):
+        failures = 0
+        while True:
+            if self.lcd is None or failures >= LCD_REINIT_FAILURES:
+                if not await self.open_lcd():
+                    await asyncio.sleep(LCD_RETRY_DELAY)
+                    continue
+                failures = 0
+
+            await self.lcd_wakeup.wait()
+            self.lcd_wakeup.clear()
+
+            while self.lcd_jobs:
+                func, args = self.lcd_jobs.popleft()
+                await self.lcd_call(func, *args)
+
+            # Only the latest frame matters, older ones are dropped
+            frame, self.frame = self.frame, None
+            traces = self.tracer.take()
+            if frame is not None and frame != self.last_frame:
+                self.last_frame = frame
+                self.frame_written_at = None
+                if await self.lcd_call(self.write_frame, frame):
+                    failures = 0
+                else:
+                    # What the LCD shows is unknown, the frame is written again unless a newer one came
+                    failures += 1
+                    self.last_frame = None
+                    if self.frame is None:
+                        self.frame = frame
+                    self.loop.call_later(LCD_RETRY_DELAY, self.lcd_wakeup.set)
+                presented = self.frame_written_at  # None when the write failed
+            else:
+                presented = time.monotonic()  # Already on the LCD
+            if traces and presented is not None:
+                self.tracer.complete(traces, presented)
+
+    # Writes a frame to the LCD, in the LCD thread
+    def write_frame(self, lines):
+        from RPLCD import CursorMode, batched
+
         self.lcd.cursor_mode = CursorMode.hide
         blank_line = '{:^20}'.format(' ')
 
-        for key, value in enumerate(lines):
-            self.lcd.cursor_pos = (key, 0)
-            if value:
-                self.lcd.write_string('{:20}'.format(value))
-            else:
-                self.lcd.write_string(blank_line)
+        # The whole frame goes to the bus in one go
+        with batched(self.lcd):
+            for key, value in enumerate(lines):
+                self.lcd.cursor_pos = (key, 0)
+                if value:
+                    self.lcd.write_string('{:20}'.format(value))
+                else:
+                    self.lcd.write_string(blank_line)
+        # The batch is flushed, the last byte of the frame is on the bus
+        self.frame_written_at = time.monotonic()
 
     # Displays the home menu
     def display_menu_home(self):
@@ -349,16 +1085,24 @@ class Watering:
         today = datetime.datetime.today()
 
         line1 = '{:^20}'.format(today.strftime("%d/%m/%Y %H:%M"))
-        line2 = '{:^20}'.format('Mode ' + self.modeList[self.currentModeSelected])
+        line2 = '{:^20}'.format('Mode {} - {} min'.format(self.modeList[self.currentModeSelected],
+                                                          self.effective_duration()))
         line4 = None
 
         # If watering ongoing
         if self.ongoingWatering:
             line3 = 'Arrosage en cours   '
             line4 = '{:^20}'.format(self.end_watering_in())
+            if self.flow and self.stopOnVolume:
+                line4 = '{:^20}'.format('{:.1f} / {:.0f} L'.format(self.flow.session, self.target_volume()))
+            elif self.flow:
+                line4 = '{:^20}'.format(self.end_watering_in() + ' - ' + '{:.1f} L'.format(self.flow.session))
+        # No watering starts while relayd is down
+        elif self.relayd_down:
+            line3 = '{:^20}'.format('relayd arrêté')
         # If mode MANU
         elif self.modeList[self.currentModeSelected] == "MANU":
-            line3 = 'Pas d\'arro programme'
+            line3 = 'Pas d\'arro programmé'
         # If mode AUTO
         else:
             line3 = 'Proch. arro. dans:  '
@@ -374,39 +1118,38 @@ class Watering:
         if self.ongoingWatering:
             # If the ON mode is selected -> cant stop the watering
             if self.modeList[self.currentModeSelected] == 'ON':
-                self.display_2_lcd([
-                    "Impossible d'arreter",
+                self.show_status([
+                    "Impossible d'arrêter",
                     "l'arrosage en cours",
-                    '{:^20}'.format("Mode ON active"),
+                    '{:^20}'.format("Mode ON activé"),
                     None
                 ])
             else:
                 self.stop_watering()
-                self.display_2_lcd([
+                self.show_status([
                     None,
-                    '{:^20}'.format("Arret de l'arrosage"),
+                    '{:^20}'.format("Arrêt de l'arrosage"),
                     '{:^20}'.format("en cours..."),
                     None
                 ])
         else:
             # If the OFF mode is selected -> cant start the watering
             if self.modeList[self.currentModeSelected] == 'OFF':
-                self.display_2_lcd([
+                self.show_status([
                     "Impossible d'allumer",
                     "l'arrosage",
-                    '{:^20}'.format("Mode OFF active"),
+                    '{:^20}'.format("Mode OFF activé"),
                     None
                 ])
             else:
                 self.start_watering()
-                self.display_2_lcd([
+                self.show_status([
                     None,
-                    '{:^20}'.format('Demarrage de'),
+                    '{:^20}'.format('Démarrage de'),
                     '{:^20}'.format("l'arrosage en cours..."),
                     None
                 ])
 
-        time.sleep(3)
         self.currentMenuSelected = self.HOME_MENU
 
     def display_menu_watering_days(self):
@@ -419,7 +1162,7 @@ class Watering:
 
     def display_menu_start_time(self):
         self.display_2_lcd([
-            'Arrosage a partir de',
+            'Arrosage à partir de',
             '{:^20}'.format(self.display_time()),
             None,
             '<Retour        Home>'
@@ -433,6 +1176,42 @@ class Watering:
             '<Retour        Home>'
         ])
 
+    def display_menu_budget(self):
+        today = datetime.date.today()
+        if self.budget is None:
+            period = 'Pas de budget'
+        elif self.budget.months is not None:
+            period = '{}: {}%'.format(MONTHS[today.month - 1], self.budget.percent(today))
+        else:
+            period = 'Semaine {}: {}%'.format(today.isocalendar()[1], self.budget.percent(today))
+        self.display_2_lcd([
+            'Budget saison       ',
+            '{:^20}'.format(period),
+            '{:^20}'.format('{} min, {:.0f} h/an'.format(self.effective_duration(), self.projected_pump_hours())),
+            '<Retour        Home>'
+        ])
+
+    def display_menu_volume(self):
+        self.display_2_lcd([
+            'Arrosage de         ',
+            '{:^20}'.format(str(self.volumeOfWatering) + ' L'),
+            None,
+            '<Retour        Home>'
+        ])
+
+    def display_menu_end_of_watering(self):
+        if self.stopOnVolume:
+            choice = ' durée  >VOLUME< '
+        else:
+            choice = ' >DURÉE<  volume '
+
+        self.display_2_lcd([
+            'Fin de l\'arrosage   ',
+            '{:^20}'.format(choice),
+            None if self.flow else '{:^20}'.format('Pas de débitmètre'),
+            '<Retour        Home>'
+        ])
+
     def display_menu_mode(self):
         mode = ""
         for key, val in enumerate(self.modeList):
@@ -543,32 +1322,119 @@ class Watering:
 
     def display_emergency(self):
         self.display_2_lcd([
-            '{:^20}'.format('Urgence activee !'),
+            '{:^20}'.format('Urgence activée !'),
             None,
-            '{:^20}'.format('Systeme desactive'),
+            '{:^20}'.format('Système désactivé'),
             None
         ])
 
     # Returns True if it's necessary to watering
     # Returns False if not
     def has_to_water(self):
-        time_dif = self.get_next_watering_date() - datetime.datetime.today()
+        next_watering_date = self.get_next_watering_date()
+        if next_watering_date is None:
+            return False
+        now = datetime.datetime.today()
+        time_dif = next_watering_date - now
 
         if math.ceil(time_dif.total_seconds() / 60) <= 0:
-            return True
+            # Overdue, but not during a blackout window
+            if self.schedule and self.schedule.blocked(now):
+                return False
+
+            # Rain enough, this watering is skipped
+            if self.weather_factor() == 0:
+                self.skip_watering('the weather')
+                return False
+            # No water this season
+            if self.effective_duration() == 0:
+                self.skip_watering('the seasonal budget')
+                return False
+
+            # Once due, waits for the soil to be dry
+            if self.moisture_pending:
+                return False
+            return self.moisture_sensor is None or self.moisture_sensor.is_dry()
 
         return False
 
+    # Returns the minutes a watering started on date (today by default) lasts, with the seasonal budget
+    def effective_duration(self, date=None):
+        if self.budget is None:
+            return self.durationOfWatering
+        return self.budget.duration(date or datetime.date.today(), self.durationOfWatering)
+
+    # Returns the (date, waterings) of the next 365 days, as planned by the schedule
+    def watering_days(self, start):
+        days = [start + datetime.timedelta(days=i) for i in range(365)]
+        if self.schedule:
+            return [(day, len(self.schedule.times)) for day in days if day.weekday() in self.schedule.weekdays]
+        next_watering_date = self.get_next_watering_date()
+        first = max(next_watering_date.date(), start) if next_watering_date else start
+        return [(day, 1) for day in days if day >= first and (day - first).days % self.daysBetweenWatering == 0]
+
+    # Returns the hours the pump is planned to run over the next 365 days, without the weather
+    # Only computed again when what it depends on changes
+    def projected_pump_hours(self):
+        today = datetime.date.today()
+        key = (today, self.durationOfWatering, tuple(self.budget.table) if self.budget else None,
+               self.schedule, self.daysBetweenWatering, self.get_next_watering_date())
+        if key != self.projection_key:
+            days = self.watering_days(today)
+            if self.budget is None:
+                self.projection = sum(count for _, count in days) * self.durationOfWatering / 60
+            else:
+                self.projection = self.budget.projected_hours(today, self.durationOfWatering, days)
+            self.projection_key = key
+        return self.projection
+
+    # Returns the factor the weather applies to today's watering, 0 to skip it
+    def weather_factor(self):
+        if self.weather is None:
+            return 1.0
+        return self.weather.factor(datetime.date.today())
+
+    # Skips the due watering, the next one is daysBetweenWatering later
+    def skip_watering(self, reason):
+        self.lastWatering = self.lastSkip = datetime.datetime.today()
+        logger.info('Watering skipped because of %s', reason)
+        self.request_save()
+
     # Returns the time before the next watering begin
     def next_watering_in(self):
-        time_dif = self.get_next_watering_date() - datetime.datetime.today()
+        next_watering_date = self.get_next_watering_date()
+        if next_watering_date is None:
+            return 'Aucun'
+        time_dif = next_watering_date - datetime.datetime.today()
+
+        # Due but the soil is still wet
+        if time_dif.total_seconds() < 0 and self.moisture_sensor is not None:
+            return 'Sol humide ' + '{:.0f}%'.format(self.moisture_sensor.average() or 0)
 
         return self.convert_time_dif_to_string(time_dif)
 
-    # Returns the next datetime to be watered
+    # Returns the next datetime to be watered, None when the calendar has none
+    # Only computed again when what it depends on changes
     def get_next_watering_date(self):
+        key = (self.lastWatering or datetime.date.today(), self.daysBetweenWatering, tuple(self.startTime),
+               self.startOffset, self.schedule)
+        if key != self.next_watering_key:
+            self.next_watering_key = key
+            self.next_watering_date = self.compute_next_watering_date()
+        return self.next_watering_date
+
+    def compute_next_watering_date(self):
+        # The coordinator offset moves the start, not the day it belongs to
+        offset = datetime.timedelta(minutes=self.startOffset)
+        if self.schedule:
+            # The first start of the calendar after the last watering, from today without one
+            after = self.lastWatering - offset if self.lastWatering else datetime.datetime.combine(
+                datetime.date.today(), datetime.time()) - datetime.timedelta(microseconds=1)
+            start = self.schedule.next_after(after)
+            return start + offset if start else None
+
         if self.lastWatering:
-            next_watering_date = self.lastWatering + datetime.timedelta(days=self.daysBetweenWatering)
+            next_watering_date = self.lastWatering - offset + datetime.timedelta(days=self.daysBetweenWatering)
         else:
             next_watering_date = datetime.datetime.today()
 
@@ -578,7 +1444,15 @@ class Watering:
         hour = '{:02d}'.format(self.startTime[0])
         minute = '{:02d}'.format(self.startTime[1])
 
-        return datetime.datetime.strptime(day + "/" + month + "/" + year + " " + hour + ":" + minute, "%d/%m/%Y %H:%M")
+        return datetime.datetime.strptime(day + "/" + month + "/" + year + " " + hour + ":" + minute, "%d/%m/%Y %H:%M") + offset
+
+    # Returns True if the watering ends on volume and its target volume has been delivered
+    def volume_reached(self):
+        return self.stopOnVolume and self.flow is not None and self.flow.session >= self.target_volume()
+
+    # Returns the volume of the current watering, scaled by the weather
+    def target_volume(self):
+        return self.volumeOfWatering * self.wateringFactor
 
     # Returns the time until the watering is completed
     def end_watering_in(self):
@@ -603,29 +1477,37 @@ class Watering:
             return str(seconds) + " sec"
 
     # Starts the watering
-    def start_watering(self):
+    # factor scales durationOfWatering and volumeOfWatering, a manual start is never scaled
+    def start_watering(self, factor=1.0):
         # If the mode is OFF, cannot water
         if self.modeList[self.currentModeSelected] == "OFF":
             return
 
-        # If the emergency is on
-        if self.emergency_on:
+        # If the emergency is on, or relayd is down
+        if self.emergency_on or self.relayd_down:
             return
 
-        GPIO.output(param.GPIO['relay'][1], GPIO.HIGH)
-        self.ongoingWatering = True
         self.lastWatering = datetime.datetime.today()
-        self.endWateringDate = self.lastWatering + datetime.timedelta(minutes=self.durationOfWatering)
-
-        # Terminates an old process if exists
-        if self.watering_process:
-            if self.watering_process.is_alive:
-                self.watering_process.terminate()
-
-            self.watering_process = None
-
-        self.watering_process = multiprocessing.Process(target=self.watering)
-        self.watering_process.start()
+        minutes = self.effective_duration(self.lastWatering.date()) * factor
+        # relayd cuts the water on its own after the watering, unless in mode ON
+        self.relay_max_on = minutes * 60 if self.modeList[self.currentModeSelected] != "ON" else None
+        self.relay.set(True, self.relay_max_on)
+        self.ongoingWatering = True
+        self.wateringFactor = factor
+        self.metric_waterings.inc()
+        if self.relay_on_since is None:
+            self.relay_on_since = time.monotonic()
+        self.endWateringDate = self.lastWatering + datetime.timedelta(minutes=minutes)
+        if minutes != self.durationOfWatering:
+            logger.info('Weather factor %.2f, budget %s%%, watering for %.0f min', factor,
+                        self.budget.percent(self.lastWatering) if self.budget else 100, minutes)
+        if self.flow:
+            self.flow.start_session()
+
+        # Cancels an old task if exists
+        self.cancel(self.watering_task)
+        self.watering_task = self.spawn(self.watering())
+        self.request_save()
 
     # Stops the watering
     def stop_watering(self):
@@ -633,54 +1515,79 @@ class Watering:
         if self.modeList[self.currentModeSelected] == "ON" and not self.emergency_on:
             return
 
-        if self.watering_process:
-            if self.watering_process.is_alive():
-                self.watering_process.terminate()
+        self.relay.set(False)
+        self.finish_watering()
 
-            self.watering_process = None
+    # Ends the watering once the relay is off
+    def finish_watering(self):
+        self.cancel(self.watering_task)
+        self.watering_task = None
 
-        GPIO.output(param.GPIO['relay'][1], GPIO.LOW)
+        if self.relay_on_since is not None:
+            self.relay_on_total += time.monotonic() - self.relay_on_since
+            self.relay_on_since = None
+        if self.flow and self.ongoingWatering:
+            self.lastWateringVolume = self.flow.session
+            logger.info('Watering done, %.1f L delivered', self.lastWateringVolume)
         self.ongoingWatering = False
-        GPIO.output(param.GPIO['led']['green'][1], GPIO.LOW)
+        GPIO.output(self.pins.green, GPIO.LOW)
+        self.request_save()
+
+    # Blinks the LED during the watering and stops it at endWateringDate
+    async def watering(self):
+        remaining = (self.endWateringDate - datetime.datetime.today()).total_seconds()
+        try:
+            await asyncio.wait_for(self.blink_watering_led(), max(remaining, 0))
+        except asyncio.TimeoutError:
+            self.stop_watering()
 
-    # Blinks the LED during the watering
-    def watering(self):
-        green_led = param.GPIO['led']['green'][1]
-        self.led_blink(green_led, 5, 0.1)
+    async def blink_watering_led(self):
+        green_led = self.pins.green
+        await self.led_blink(green_led, 5, 0.1)
 
         while True:
             GPIO.output(green_led, GPIO.HIGH)
-            time.sleep(1)
+            await asyncio.sleep(1)
             GPIO.output(green_led, GPIO.LOW)
-            time.sleep(1)
+            await asyncio.sleep(1)
 
     # Blinks during 1 sec fast
-    def led_blink(self, pin, how_much, how_fast):
+    async def led_blink(self, pin, how_much, how_fast):
         for i in range(how_much):
             GPIO.output(pin, GPIO.HIGH)
-            time.sleep(how_fast)
+            await asyncio.sleep(how_fast)
             GPIO.output(pin, GPIO.LOW)
-            time.sleep(how_fast)
+            await asyncio.sleep(how_fast)
 
-    # Starts the emergency process
-    def start_emergency(self):
+    # Blinks the red LED until the emergency is stopped
+    async def start_emergency(self):
         while True:
-            GPIO.output(param.GPIO['led']['red'][1], GPIO.HIGH)
-            time.sleep(1)
-            GPIO.output(param.GPIO['led']['red'][1], GPIO.LOW)
-            time.sleep(1)
+            GPIO.output(self.pins.red, GPIO.HIGH)
+            await asyncio.sleep(1)
+            GPIO.output(self.pins.red, GPIO.LOW)
+            await asyncio.sleep(1)
 
     def switch_off_lcd(self):
-        self.lcd.display_enabled = False
-        self.lcd.backlight_enabled = False
+        self.lcd_enabled = False
+        self.lcd_job(self.lcd_power, False)
 
     def switch_on_lcd(self):
-        self.lcd.display_enabled = True
-        self.lcd.backlight_enabled = True
-        self.lcd.clear()
-        self.lcd.cursor_pos = (0, 0)
-        self.lcd.cursor_mode = CursorMode.hide
+        self.lcd_enabled = True
+        self.last_frame = None
+        self.lcd_job(self.lcd_power, True)
+
+    # Switches the LCD on or off, in the LCD thread
+    def lcd_power(self, on):
+        from RPLCD import CursorMode
+
+        self.lcd.display_enabled = on
+        self.lcd.backlight_enabled = on
+        if on:
+            self.lcd.clear()
+            self.lcd.cursor_pos = (0, 0)
+            self.lcd.cursor_mode = CursorMode.hide
 
 
 if __name__ == '__main__':
-    Watering()
+    logging.basicConfig(level=logging.INFO)
+    Watering().start()
@@ -0,0 +1,193 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##################################
+#  Metrics                       #
+#                                #
+#  Counters and gauges in the    #
+#  Prometheus text format        #
+##################################
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import asyncio
+import collections
+import logging
+import math
+import os
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Metric(object):
+    """Base of the metrics, a single value or one child per label values.
+
+    The value is a plain attribute updated in place, so updating a metric is
+    one addition or assignment. ``function``, when given, is called at
+    exposition time instead, for values that already live somewhere else.
+
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name, help='', labelnames=(), function=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self.value = 0
+        self.children = {}  # (label values) => child metric
+
+    # Returns the child for these label values, resolve it once outside hot paths
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = type(self)(self.name)
+        return child
+
+    def get(self):
+        return self.function() if self.function else self.value
+
+    # Yields (name, {label: value}, value)
+    def samples(self):
+        if not self.labelnames:
+            yield self.name, {}, self.get()
+            return
+        for values, child in sorted(self.children.items()):
+            yield self.name, dict(zip(self.labelnames, values)), child.get()
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value):
+        self.value = value
+
+
+class Summary(Metric):
+    """Quantiles over the last ``size`` observations, plus their sum and count."""
+
+    kind = 'summary'
+
+    def __init__(self, name, help='', quantiles=(0.5, 0.9, 0.99), size=1024):
+        super(Summary, self).__init__(name, help)
+        self.quantiles = quantiles
+        self.window = collections.deque(maxlen=size)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.window.append(value)
+        self.count += 1
+        self.sum += value
+
+    # The window is only sorted when the metrics are read
+    def samples(self):
+        window = sorted(self.window)
+        for q in self.quantiles:
+            value = window[min(int(q * len(window)), len(window) - 1)] if window else float('nan')
+            yield self.name, {'quantile': q}, value
+        yield self.name + '_sum', {}, self.sum
+        yield self.name + '_count', {}, self.count
+
+
+class Registry(object):
+    """Holds the metrics of the process and exposes them."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def summary(self, *args, **kwargs):
+        return self.register(Summary(*args, **kwargs))
+
+    # Returns the metrics in the Prometheus text format
+    def expose(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.help))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+            for name, labels, value in metric.samples():
+                if labels:
+                    name += '{' + ','.join('{}="{}"'.format(k, v) for k, v in sorted(labels.items())) + '}'
+                lines.append('{} {}'.format(name, format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    # Writes the metrics to a file, for the node_exporter textfile collector
+    def write(self, path):
+        write_file(path, self.expose())
+
+    # Writes the metrics to path every interval seconds
+    async def export(self, path, interval=15):
+        loop = asyncio.get_running_loop()
+        while True:
+            text = self.expose()
+            try:
+                await loop.run_in_executor(None, write_file, path, text)
+            except (IOError, OSError) as e:
+                logger.warning('Cannot write the metrics: %s', e)
+            await asyncio.sleep(interval)
+
+    # Serves the metrics over HTTP on GET /metrics
+    async def serve(self, port=9102, host='127.0.0.1'):
+        server = await asyncio.start_server(self.handle_scrape, host, port, limit=4096)
+        logger.info('Metrics on http://%s:%d/metrics', host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def handle_scrape(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            # Skips the headers
+            while (await asyncio.wait_for(reader.readline(), 5)).strip():
+                pass
+
+            parts = request.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', self.expose().encode('utf-8')
+            else:
+                status, body = '404 Not Found', b'Not found\n'
+
+            writer.write('HTTP/1.0 {}\r\nContent-Type: {}\r\nContent-Length: {}\r\n\r\n'.format(
+                status, CONTENT_TYPE, len(body)).encode('latin-1') + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ValueError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float):
+        if math.isnan(value):
+            return 'NaN'
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+# Written next to the target then renamed, so a reader never sees half a file
+def write_file(path, text):
+    with open(path + '.tmp', 'w') as f:
+        f.write(text)
+    os.rename(path + '.tmp', path)
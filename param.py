@@ -1,6 +1,10 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+# JSON file overriding GPIO below and the watering settings, see config.py
+# The watering settings are applied again whenever the file changes
+CONFIG_FILE = '/etc/watering.json'
+
 GPIO = {
     'btn': {
         'right': ("in", 29),
@@ -13,9 +17,104 @@ GPIO = {
         'green': ("out", 36),
         'red': ("out", 38)
     },
-    'relay': ('out', 40)
+    'relay': ('out', 40),
+    'flow': ('in', 32)  # Only set up with FLOW below
+}
+
+# LCD bus
+# 'gpio' => parallel bus through RPi.GPIO (pins below)
+# 'i2c'  => PCF8574 backpack at i2c_address
+# 'wave' => parallel bus played as pigpio waves (BCM numbering, needs pigpiod)
+# mirror_pins_e => E pins of more displays wired to the RS and data lines of the 'gpio' bus,
+#                  showing the same frames (e.g. [26] for a second display at the manifold)
+# present_on_change => a button press updates the display right away instead of at the next tick
+# charmap => character ROM of the controller, 'A00' (japanese) or 'A02' (european)
+# french_glyphs => é, è and à as custom characters, for the A00 ROM which does not have them
+LCD = {
+    'bus': 'gpio',
+    'i2c_address': 0x27,
+    'mirror_pins_e': [],
+    'present_on_change': True,
+    'charmap': 'A00',
+    'french_glyphs': True
 }
 
+# Soil moisture sensors on an MCP3008, None to water on the schedule only
+# Once due, an AUTO watering waits until the average moisture is under threshold (in %)
+# Example: {'spi': (0, 0), 'channels': [0, 1], 'rate': 10, 'batch': 10, 'window': 5, 'alpha': 0.1,
+#           'threshold': 40, 'dry_raw': 850, 'wet_raw': 400}
+# Add 'trace': 'file.csv' to replay a recorded trace instead of reading the ADC
+MOISTURE = None
+
+# Hall effect flow meter on GPIO['flow'], None without one
+# A flow over leak_rate (L/min) with the valve closed, or over max_rate during a watering,
+# for periods consecutive seconds triggers the emergency (relay off)
+# Example: {'pulses_per_litre': 450, 'leak_rate': 0.2, 'max_rate': 30, 'periods': 3, 'grace': 5}
+FLOW = None
+
+# Forecast / evapotranspiration files (JSON or CSV) dropped in directory by any other process,
+# None to ignore the weather
+# Records: date (YYYY-MM-DD) and rain_mm, et0_mm (mm/day) or factor. An AUTO watering is skipped
+# from skip_rain mm of rain, otherwise its duration and volume are scaled by
+# (et0_mm - rain_mm) / reference_et0, bounded by min_factor and max_factor
+# Example: {'directory': '/var/lib/watering/weather', 'skip_rain': 5, 'reference_et0': 4,
+#           'min_factor': 0.5, 'max_factor': 1.5, 'check_interval': 60}
+WEATHER = None
+
+# Local API, JSON lines over a Unix socket (see api.py), None to disable it
+# Example: {'path': '/run/watering.sock', 'max_clients': 16}
+# Try it with: echo '{"op": "status"}' | socat - UNIX-CONNECT:/run/watering.sock
+API = None
+
+# Metrics in the Prometheus text format (see metrics.py), None to disable them
+# {'host': '127.0.0.1', 'port': 9102} serves them on http://host:port/metrics
+# {'file': '/var/lib/node_exporter/textfile/watering.prom', 'interval': 15} writes them for
+# the node_exporter textfile collector instead
+METRICS = None
+
+# Events (watering started/stopped, mode change, emergency) published to the fleet aggregator
+# (python fleet.py), None to disable them. controller_id defaults to the hostname, zone to controller_id
+# Example: {'bus': 'local', 'path': '/run/watering-fleet.sock', 'zone': 'potager'}
+#          {'bus': 'mqtt', 'host': 'broker.lan', 'port': 1883, 'prefix': 'watering', 'zone': 'potager'}
+# Add 'batch_size', 'batch_delay' (seconds) or 'buffer_size' (events kept while the bus is down) to tune it
+FLEET = None
+
+# Start time staggering between controllers sharing a supply, None to start at startTime
+# The coordinator (python coordinator.py) offsets startTime so that the flows (L/min) of the
+# waterings never add up over its capacity
+# Example: {'path': '/run/watering-coordinator.sock', 'flow': 15}
+# {'capacity': 60, 'flow': 15} uses an in-process coordinator instead, for tests
+COORDINATOR = None
+
+# Sampling profiler (see profiler.py), None to disable it
+# Toggled by SIGUSR2 (kill -USR2 <pid>) or the API ({"op": "profile", "enable": true}), the stacks
+# are written on stop to path, a time.strftime pattern. rate is in samples per second
+# Example: {'path': '/var/tmp/watering-%Y%m%d-%H%M%S.folded', 'rate': 100, 'max_duration': 300}
+PROFILER = None
+
+# Relay process (see relayd.py), None to drive the relay from this process
+# Start it with: python relayd.py --block /dev/shm/watering-relay --max-on 14400
+# The relay commands go through the shared block at path. relayd switches the relay off by itself
+# margin seconds after the end of a watering (mode ON excepted), and after --max-on seconds anyway
+# Without relayd heartbeat, the relay is driven by this process and no watering starts until relayd is
+# back, relayd being only reported down grace seconds after the start of this process
+# Example: {'path': '/dev/shm/watering-relay', 'margin': 60, 'grace': 30}
+RELAYD = None
+
+# Supervisor (see supervisor.py), None to disable it
+# Every interval seconds the supervisor checks that the last tick is at most max_heartbeat_age seconds old,
+# that the relay is off relay_margin seconds after endWateringDate (mode ON excepted) and that the resident
+# memory did not grow by max_rss_growth MB since rss_grace seconds after the start. Otherwise it forces the
+# relay off and restarts the process
+# device => watchdog petted by the control loop after each healthy tick, e.g. '/dev/watchdog', None without
+# one. Once opened, the Pi reboots timeout seconds after the process died without stopping (SIGTERM, Ctrl+C)
+# Example: {'device': None, 'timeout': 15, 'interval': .5, 'max_heartbeat_age': 5, 'relay_margin': 60,
+#           'max_rss_growth': 64, 'rss_grace': 300}
+SUPERVISOR = None
+
+# Snapshot used to carry on after a restart of the process (on tmpfs, so a reboot is always a cold start)
+STATE_FILE = '/dev/shm/watering_state.json'
+
 """
 ==============
 LCD param
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##################################
+#  Sampling profiler             #
+#                                #
+#  Collapsed stacks for          #
+#  flamegraphs                   #
+##################################
+
+"""
+Started and stopped at runtime (SIGUSR2 or the ``profile`` op of the API),
+nothing runs while it is stopped.
+
+While it runs, a thread takes the stack of every other thread (the loop,
+the RPi.GPIO callbacks, the LCD thread...) ``rate`` times per second. On
+stop, the stacks are written in the collapsed format, one
+``thread;file:function;... count`` line per distinct stack, ready for
+flamegraph.pl or speedscope:
+
+    flamegraph.pl /var/tmp/watering-20240601-063000.folded > watering.svg
+"""
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler(object):
+    """Samples the stacks of the process in a thread of its own.
+
+    ``path`` is a ``time.strftime`` pattern, so each run gets its own file.
+    A run stops by itself after ``max_duration`` seconds.
+
+    """
+
+    def __init__(self, path, rate=100, max_duration=300):
+        self.path = path
+        self.interval = 1 / rate
+        self.max_duration = max_duration
+        self.thread = None
+        self.stopping = None
+        self.last_file = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.sample, args=(self.stopping,), name='profiler', daemon=True)
+        self.thread.start()
+        logger.info('Profiler started, %.0f samples/s', 1 / self.interval)
+
+    # The stacks are written by the profiler thread, stop() does not wait for it
+    def stop(self):
+        if self.running:
+            self.stopping.set()
+
+    def toggle(self):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def sample(self, stopping):
+        me = threading.get_ident()
+        stacks = collections.Counter()
+        labels = {}  # Code object => frame label
+        samples = 0
+        started = time.monotonic()
+        deadline = started + self.max_duration
+
+        while not stopping.wait(self.interval) and time.monotonic() < deadline:
+            names = dict((thread.ident, thread.name) for thread in threading.enumerate())
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = '{}:{}'.format(os.path.basename(code.co_filename), code.co_name)
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                stacks[';'.join(reversed(stack))] += 1
+            samples += 1
+
+        self.write(stacks)
+        logger.info('Profiler stopped, %d samples in %.1f s written to %s',
+                    samples, time.monotonic() - started, self.last_file)
+
+    def write(self, stacks):
+        path = time.strftime(self.path)
+        try:
+            with open(path, 'w') as f:
+                for stack, count in sorted(stacks.items()):
+                    f.write('{} {}\n'.format(stack, count))
+        except (IOError, OSError) as e:
+            logger.error('Cannot write the profile to %s: %s', path, e)
+            return
+        self.last_file = path
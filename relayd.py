@@ -0,0 +1,334 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##################################
+#  Relay process                 #
+#                                #
+#  Owns the relay pin, cuts the  #
+#  water after a max on-time     #
+##################################
+
+"""
+The relay is driven by a process of its own, so that a stall of the
+controller (LCD, subprocess, GC...) never delays cutting the water:
+
+    python relayd.py --block /dev/shm/watering-relay --max-on 14400
+
+The controller and relayd share a 128 bytes block (an mmap of a file in
+/dev/shm), written by one process each, read by both:
+
+    offset 0   command   seq, id, on, max_on (s, 0 = none), sent (ns)          written by the controller
+    offset 64  state     seq, acked id, on, reason, on since, deadline,        written by relayd
+                         applied, latency, heartbeat (ns), pid
+
+Each half is a seqlock: its writer makes seq odd, writes the fields and
+makes seq even again, a reader retries while seq is odd or changed under
+it. Python writes the mmap without memory barriers, so on ARM another core
+may see the stores in a different order: each half also ends with the
+CRC32 of its fields, and a reader retries until it matches. Times come
+from CLOCK_MONOTONIC, shared by all the processes.
+
+While relayd is down (no heartbeat for 10 polls + 1 s) the controller
+still writes its commands to the block, for relayd to pick up, but drives
+the pin itself and starts no watering until relayd is back. relayd is not
+reported down during the first ``grace`` seconds of the controller, so that
+both can start in any order.
+
+After writing a command the controller sends SIGUSR1 to relayd, which
+otherwise looks at the block every ``poll`` seconds. relayd switches the
+relay, then publishes the id of the command, the command-to-relay latency
+and the deadline of the relay: the smaller of the max_on of the command
+and --max-on. Past it, relayd switches the relay off by itself.
+"""
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import collections
+import logging
+import mmap
+import os
+import signal
+import struct
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 128
+COMMAND_OFFSET = 0
+STATE_OFFSET = 64
+SEQ = struct.Struct(str('<I'))
+COMMAND = struct.Struct(str('<IIBxxxdQI'))  # seq, id, on, max_on, sent_ns, crc
+STATE = struct.Struct(str('<IIBBxxQQQQQII'))  # seq, acked, on, reason, on_since_ns, deadline_ns, applied_ns,
+#                                              latency_ns, heartbeat_ns, pid, crc
+READ_RETRIES = 1000
+
+# Why the relay is in its state
+REASON_COMMAND = 0
+REASON_MAX_ON = 1
+REASON_START = 2  # Switched off when relayd started
+REASON_STOP = 3  # Switched off when relayd stopped
+REASONS = ['command', 'max on-time', 'relayd start', 'relayd stop']
+
+DEFAULT_MAX_ON = 4 * 3600  # Seconds
+DEFAULT_POLL = .1  # Seconds
+
+RelayState = collections.namedtuple('RelayState', [
+    'acked', 'on', 'reason', 'on_since', 'deadline', 'applied', 'latency', 'heartbeat', 'pid'])
+
+
+class Block(object):
+    """The shared block, created with zeros by the first process opening it."""
+
+    def __init__(self, path):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < BLOCK_SIZE:
+                os.ftruncate(fd, BLOCK_SIZE)
+            self.mm = mmap.mmap(fd, BLOCK_SIZE)
+        finally:
+            os.close(fd)
+        self.path = path
+
+    # Writes the fields of layout at offset, seq being the current even sequence number, returns the next one
+    def write(self, offset, layout, seq, *values):
+        crc = zlib.crc32(layout.pack(seq, *(values + (0,)))[SEQ.size:-4]) & 0xFFFFFFFF
+        SEQ.pack_into(self.mm, offset, seq + 1)
+        layout.pack_into(self.mm, offset, seq + 1, *(values + (crc,)))
+        SEQ.pack_into(self.mm, offset, seq + 2)
+        return (seq + 2) & 0xFFFFFFFF
+
+    # Returns the fields of layout at offset, seq first and without the CRC, as written by a single write()
+    # A half never written (seq 0) reads as zeros
+    def read(self, offset, layout):
+        for _ in range(READ_RETRIES):
+            data = self.mm[offset:offset + layout.size]
+            values = layout.unpack(data)
+            if values[0] & 1 or SEQ.unpack_from(self.mm, offset)[0] != values[0]:
+                continue
+            if values[0] == 0 or zlib.crc32(data[SEQ.size:-4]) & 0xFFFFFFFF == values[-1]:
+                return values[:-1]
+        raise RuntimeError('Relay block {} stuck in a write'.format(self.path))
+
+    def close(self):
+        self.mm.close()
+
+
+class RelayDaemon(object):
+    """Switches the relay on the commands of the block, within max_on seconds."""
+
+    def __init__(self, block, pin, gpio, max_on=DEFAULT_MAX_ON, poll=DEFAULT_POLL):
+        self.block = block
+        self.pin = pin
+        self.gpio = gpio
+        self.max_on_ns = int(max_on * 1e9)
+        self.poll = poll
+        self.pid = os.getpid()
+
+        state = block.read(STATE_OFFSET, STATE)
+        self.seq = state[0]
+        self.acked, self.on, self.reason, self.on_since, self.deadline, self.applied, self.latency = state[1:8]
+
+        # A restarted relayd carries on with a watering before its deadline, the relay is off otherwise
+        # Setting up an output without initial value keeps its current level
+        gpio.setup(pin, gpio.OUT)
+        now = time.monotonic_ns()
+        if not (self.on and gpio.input(pin) == gpio.HIGH and now < self.deadline):
+            self.switch(False, REASON_START, now)
+        self.publish(now)
+
+    def switch(self, on, reason, now):
+        self.gpio.output(self.pin, self.gpio.HIGH if on else self.gpio.LOW)
+        if on and not self.on:
+            self.on_since = now
+        self.on = on
+        self.reason = reason
+        if not on:
+            self.deadline = 0
+
+    def publish(self, now):
+        self.seq = self.block.write(STATE_OFFSET, STATE, self.seq, self.acked, self.on, self.reason, self.on_since,
+                                    self.deadline, self.applied, self.latency, now, self.pid)
+
+    # Applies a new command and enforces the deadline
+    def step(self):
+        command = self.block.read(COMMAND_OFFSET, COMMAND)
+        if command[1] != self.acked:
+            _, self.acked, on, max_on, sent = command
+            self.switch(bool(on), REASON_COMMAND, time.monotonic_ns())
+            self.applied = time.monotonic_ns()
+            self.latency = max(0, self.applied - sent)
+            if self.on:
+                limit = min(int(max_on * 1e9), self.max_on_ns) if max_on > 0 else self.max_on_ns
+                self.deadline = self.on_since + limit
+            logger.info('Relay %s in %.0f us (command %d)', 'on' if self.on else 'off', self.latency / 1000,
+                        self.acked)
+
+        now = time.monotonic_ns()
+        if self.on and now >= self.deadline:
+            self.switch(False, REASON_MAX_ON, now)
+            logger.error('Relay on for %.1f s, switched off', (now - self.on_since) / 1e9)
+        self.publish(now)
+
+    def run(self):
+        wakeup = {signal.SIGUSR1, signal.SIGTERM, signal.SIGINT}
+        signal.pthread_sigmask(signal.SIG_BLOCK, wakeup)
+        logger.info('Relay on pin %d, max on-time %.0f s, block %s', self.pin, self.max_on_ns / 1e9,
+                    self.block.path)
+        while True:
+            info = signal.sigtimedwait(wakeup, self.poll)
+            if info is not None and info.si_signo != signal.SIGUSR1:
+                break
+            self.step()
+
+        now = time.monotonic_ns()
+        self.switch(False, REASON_STOP, now)
+        self.pid = 0
+        self.publish(now)
+        logger.info('Relay off, relayd stopped')
+
+
+class RelayClient(object):
+    """Sends the relay commands of the controller to relayd through the block.
+
+    ``fallback`` (a LocalRelay) drives the pin while relayd is down.
+
+    """
+
+    def __init__(self, path, fallback, margin=60, poll=DEFAULT_POLL, grace=30):
+        self.block = Block(path)
+        self.fallback = fallback
+        self.margin = margin
+        self.alive_ns = int((poll * 10 + 1) * 1e9)  # relayd heartbeat older than this => relayd is down
+        self.grace_end = time.monotonic_ns() + int(grace * 1e9)  # relayd may start after the controller
+        self.lock = threading.Lock()  # set() is called by the loop and by the supervisor thread
+        self.down = False
+
+        command = self.block.read(COMMAND_OFFSET, COMMAND)
+        self.seq, self.sent_id, self.sent_on = command[0], command[1], bool(command[2])
+        self.seen_id = self.block.read(STATE_OFFSET, STATE)[1]
+        self.cut_id = None
+
+    def state(self):
+        values = self.block.read(STATE_OFFSET, STATE)
+        return RelayState(values[1], bool(values[2]), *values[3:])
+
+    def alive(self, state=None):
+        state = state or self.state()
+        return state.pid > 0 and time.monotonic_ns() - state.heartbeat < self.alive_ns
+
+    # Updates down from state, logging the changes, returns alive()
+    # A missing heartbeat only counts as down after the grace period
+    def check(self, state):
+        alive = self.alive(state)
+        down = not alive and time.monotonic_ns() >= self.grace_end
+        if down != self.down:
+            self.down = down
+            if down:
+                logger.error('relayd is down, the relay is driven by the controller')
+            else:
+                logger.warning('relayd is back')
+        return alive
+
+    def is_on(self):
+        state = self.state()
+        return state.on if self.check(state) else self.fallback.is_on()
+
+    # Switches the relay, on for at most max_on seconds (plus margin) when given
+    def set(self, on, max_on=None):
+        with self.lock:
+            self.sent_id = (self.sent_id + 1) & 0xFFFFFFFF
+            self.sent_on = on
+            self.seq = self.block.write(COMMAND_OFFSET, COMMAND, self.seq, self.sent_id, on,
+                                        max_on + self.margin if on and max_on is not None else 0,
+                                        time.monotonic_ns())
+        # The signal only wakes relayd up, a stale pid of a dead relayd must not get it
+        state = self.state()
+        if self.check(state):
+            try:
+                os.kill(state.pid, signal.SIGUSR1)
+            except OSError:
+                pass
+        else:
+            self.fallback.set(on)
+
+    # Returns (latency of the commands acknowledged since the last call or None,
+    # True once when relayd cut the last on command at its max on-time, True while relayd is down)
+    def poll(self):
+        state = self.state()
+        self.check(state)
+        latency = None
+        if state.acked != self.seen_id:
+            self.seen_id = state.acked
+            latency = state.latency / 1e9
+        cut = (state.reason == REASON_MAX_ON and state.acked == self.sent_id and self.sent_on
+               and self.cut_id != self.sent_id)
+        if cut:
+            self.cut_id = self.sent_id
+        return latency, cut, self.down
+
+
+class LocalRelay(object):
+    """In-process stand-in for RelayClient, driving the pin from the controller."""
+
+    def __init__(self, pin, gpio):
+        self.pin = pin
+        self.gpio = gpio
+        self.ready = False
+        self.latency = None
+
+    def is_on(self):
+        if not self.ready:
+            # Setting up an output without initial value keeps its current level
+            self.gpio.setup(self.pin, self.gpio.OUT)
+            self.ready = True
+        return self.gpio.input(self.pin) == self.gpio.HIGH
+
+    def set(self, on, max_on=None):
+        start = time.monotonic_ns()
+        level = self.gpio.HIGH if on else self.gpio.LOW
+        if self.ready:
+            self.gpio.output(self.pin, level)
+        else:
+            self.gpio.setup(self.pin, self.gpio.OUT, initial=level)
+            self.ready = True
+        self.latency = (time.monotonic_ns() - start) / 1e9
+
+    def poll(self):
+        latency, self.latency = self.latency, None
+        return latency, False, False
+
+
+# Creates the relay described by param.RELAYD, driving pin in process without it
+def create_relay(config, pin, gpio):
+    if config:
+        return RelayClient(config['path'], LocalRelay(pin, gpio), config.get('margin', 60),
+                           grace=config.get('grace', 30))
+    return LocalRelay(pin, gpio)
+
+
+def main():
+    import argparse
+    import config
+    import param
+
+    parser = argparse.ArgumentParser(description='Drives the relay for the controller, within a max on-time')
+    parser.add_argument('--block', default='/dev/shm/watering-relay', help='Shared block file')
+    parser.add_argument('--pin', type=int, help='Relay pin (BOARD numbering), default: the one of the controller')
+    parser.add_argument('--max-on', type=float, default=DEFAULT_MAX_ON, help='Longest time the relay stays on, s')
+    parser.add_argument('--poll', type=float, default=DEFAULT_POLL, help='Block check interval without signal, s')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    import RPi.GPIO as GPIO
+    GPIO.setwarnings(False)
+    GPIO.setmode(GPIO.BOARD)
+    pin = args.pin
+    if pin is None:
+        pin = config.load_startup(param.CONFIG_FILE, param.GPIO)[1].relay
+    RelayDaemon(Block(args.block), pin, GPIO, args.max_on, args.poll).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##################################
+#  Calendar schedule             #
+#                                #
+#  Weekdays, start times and     #
+#  blackout windows              #
+##################################
+
+"""
+A CalendarSchedule waters on some weekdays, at one or more start times,
+except during blackout windows (e.g. a municipal watering ban):
+
+    CalendarSchedule(weekdays=[0, 2, 4], times=[(6, 0), (21, 30)],
+                     blackouts=[(datetime(2024, 7, 1), datetime(2024, 8, 1))],
+                     daily_blackouts=[((10, 0), (18, 0))])
+
+The start times of the next horizon_days are compiled into a sorted index,
+without the ones falling in a blackout window, so the next start is a
+bisect away. The index is compiled again once half of it has gone by.
+"""
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import bisect
+import datetime
+
+WEEKDAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+HORIZON_DAYS = 28
+
+
+class Blackouts(object):
+    """Time windows, merged into sorted disjoint [start, end) intervals."""
+
+    def __init__(self, intervals):
+        merged = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            elif start < end:
+                merged.append([start, end])
+        self.starts = [start for start, _ in merged]
+        self.ends = [end for _, end in merged]
+
+    def __len__(self):
+        return len(self.starts)
+
+    # Returns the end of the window holding when, None when it is in none
+    def end_of(self, when):
+        i = bisect.bisect_right(self.starts, when) - 1
+        if i >= 0 and when < self.ends[i]:
+            return self.ends[i]
+        return None
+
+    def __contains__(self, when):
+        return self.end_of(when) is not None
+
+
+class CalendarSchedule(object):
+    """Start times on weekdays (0 = Monday), without the blackout windows.
+
+    ``blackouts`` are (start, end) datetimes, ``daily_blackouts`` are
+    ((hh, mm), (hh, mm)) windows repeated every day, over midnight when the
+    end comes before the start.
+
+    """
+
+    def __init__(self, weekdays, times, blackouts=(), daily_blackouts=(), horizon_days=HORIZON_DAYS):
+        self.weekdays = frozenset(weekdays)
+        self.times = sorted(datetime.time(hour, minute) for hour, minute in times)
+        self.blackouts = list(blackouts)
+        self.daily_blackouts = [(datetime.time(*start), datetime.time(*end)) for start, end in daily_blackouts]
+        self.horizon = datetime.timedelta(days=horizon_days)
+
+        self.index = []  # Start datetimes, sorted
+        self.excluded = Blackouts([])
+        self.index_from = None
+        self.index_to = None
+
+    # Builds the index from the day before start to start + horizon
+    def compile(self, start):
+        first_day = start.date() - datetime.timedelta(days=1)
+        days = [first_day + datetime.timedelta(days=i) for i in range(self.horizon.days + 2)]
+
+        intervals = list(self.blackouts)
+        for day in days:
+            for begin, end in self.daily_blackouts:
+                end_day = day if end > begin else day + datetime.timedelta(days=1)
+                intervals.append((datetime.datetime.combine(day, begin), datetime.datetime.combine(end_day, end)))
+        self.excluded = Blackouts(intervals)
+
+        self.index = [datetime.datetime.combine(day, time) for day in days if day.weekday() in self.weekdays
+                      for time in self.times]
+        self.index = [when for when in self.index if when not in self.excluded]
+        self.index_from = datetime.datetime.combine(first_day, datetime.time())
+        self.index_to = start + self.horizon
+
+    # Returns the first start after when, None if there is none within the horizon
+    def next_after(self, when):
+        if self.index_from is None or not self.index_from <= when <= self.index_to - self.horizon / 2:
+            self.compile(when)
+        i = bisect.bisect_right(self.index, when)
+        return self.index[i] if i < len(self.index) else None
+
+    # Returns True when a blackout window holds when
+    def blocked(self, when):
+        if self.index_from is None or not self.index_from <= when <= self.index_to:
+            self.compile(when)
+        return when in self.excluded
+
+
+# Builds a CalendarSchedule from the "schedule" watering setting (see config.validate_schedule)
+def from_settings(settings):
+    def parse(value):
+        return datetime.datetime.strptime(value, '%Y-%m-%d %H:%M')
+
+    return CalendarSchedule(
+        weekdays=[WEEKDAYS.index(day) for day in settings['weekdays']],
+        times=settings['times'],
+        blackouts=[(parse(start), parse(end)) for start, end in settings.get('blackouts', [])],
+        daily_blackouts=settings.get('dailyBlackouts', []))
@@ -0,0 +1,263 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##################################
+#  Soil moisture sensors         #
+#                                #
+#  Sampled on an SPI ADC in a    #
+#  background thread             #
+##################################
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import csv
+import logging
+import math
+import threading
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+logger = logging.getLogger(__name__)
+
+# StreamingFilter computes its EMA chunk by chunk, so that (1 - alpha) ** -n stays under e ** EMA_EXPONENT
+# (far from the float overflow at e ** 709), n being at most EMA_CHUNK and less for a large alpha
+EMA_CHUNK = 256
+EMA_EXPONENT = 600
+
+
+class MCP3008(object):
+    """8 channels, 10 bits SPI ADC."""
+
+    def __init__(self, bus=0, device=0, max_speed_hz=1350000, spi=None):
+        if spi is None:
+            import spidev
+            spi = spidev.SpiDev()
+            spi.open(bus, device)
+            spi.max_speed_hz = max_speed_hz
+        self.spi = spi
+
+    # Returns the raw reading (0-1023) of a single-ended channel
+    def read(self, channel):
+        reply = self.spi.xfer2([1, (8 + channel) << 4, 0])
+        return ((reply[1] & 3) << 8) | reply[2]
+
+    def close(self):
+        self.spi.close()
+
+
+class FakeADC(object):
+    """Stand-in for MCP3008 replaying recorded traces, looping at the end."""
+
+    def __init__(self, traces):
+        # traces: {channel: [raw readings]}
+        self.traces = dict((channel, list(values)) for channel, values in traces.items())
+        self.positions = dict((channel, 0) for channel in self.traces)
+
+    # Loads a CSV with one column per channel, the header holding the channel numbers
+    @classmethod
+    def from_csv(cls, path):
+        with open(path) as f:
+            rows = list(csv.reader(f))
+        channels = [int(c) for c in rows[0]]
+        return cls(dict((c, [int(row[i]) for row in rows[1:]]) for i, c in enumerate(channels)))
+
+    def read(self, channel):
+        trace = self.traces[channel]
+        position = self.positions[channel]
+        self.positions[channel] = (position + 1) % len(trace)
+        return trace[position]
+
+    def close(self):
+        pass
+
+
+class RingBuffer(object):
+    """Fixed-size buffer of floats, the oldest values are overwritten."""
+
+    def __init__(self, size):
+        self.data = np.zeros(size)
+        self.size = size
+        self.position = 0  # Next write index
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=float)[-self.size:]
+        end = self.position + len(values)
+        if end <= self.size:
+            self.data[self.position:end] = values
+        else:
+            split = self.size - self.position
+            self.data[self.position:] = values[:split]
+            self.data[:end - self.size] = values[split:]
+        self.position = end % self.size
+        self.count = min(self.count + len(values), self.size)
+
+    # Returns the last n values, oldest first
+    def last(self, n=None):
+        n = self.count if n is None else min(n, self.count)
+        return np.roll(self.data, -self.position)[self.size - n:]
+
+
+class StreamingFilter(object):
+    """Running median over window samples followed by an exponential moving
+    average, fed batch by batch with the same output as sample by sample."""
+
+    def __init__(self, window=5, alpha=0.1):
+        if not 0 < alpha < 1:
+            raise ValueError('alpha must be between 0 and 1 excluded, not {}'.format(alpha))
+        self.window = window
+        self.alpha = alpha
+        self.chunk = max(1, min(EMA_CHUNK, int(EMA_EXPONENT / -math.log(1 - alpha))))
+        self.tail = None  # The last window - 1 raw samples
+        self.ema = None
+
+    # Filters a batch of raw samples, returns one filtered value per sample
+    def update(self, batch):
+        batch = np.asarray(batch, dtype=float)
+        if not len(batch):
+            return batch
+        if self.tail is None:
+            # Start as if the first sample had always been there
+            self.tail = np.full(self.window - 1, batch[0])
+            self.ema = None
+
+        samples = np.concatenate([self.tail, batch])
+        medians = np.median(sliding_window_view(samples, self.window), axis=1)
+        self.tail = samples[len(samples) - (self.window - 1):]
+
+        return np.concatenate([self._ema(medians[i:i + self.chunk])
+                               for i in range(0, len(medians), self.chunk)])
+
+    # y[k] = (1 - a) * y[k - 1] + a * x[k], in closed form
+    def _ema(self, x):
+        if self.ema is None:
+            self.ema = x[0]
+        powers = (1 - self.alpha) ** np.arange(1, len(x) + 1)
+        y = powers * self.ema + self.alpha * powers * np.cumsum(x / powers)
+        self.ema = y[-1]
+        return y
+
+
+class MoistureSensor(object):
+    """Samples soil moisture sensors in a background thread.
+
+    The control loop only reads ``moisture``, a list replaced in one go at
+    the end of each batch, so it never waits on the ADC nor on the filters.
+
+    """
+
+    def __init__(self, adc, channels=[0], rate=10, batch=10, buffer_size=600,
+                 window=5, alpha=0.1, threshold=40, dry_raw=850, wet_raw=400):
+        """
+        Args:
+            adc: An MCP3008 or FakeADC.
+            channels: ADC channels with a sensor.
+            rate: Samples per second and per channel.
+            batch: Samples filtered together.
+            buffer_size: Filtered samples kept per channel.
+            window: Median window, in samples.
+            alpha: EMA smoothing factor.
+            threshold: Moisture (in %) under which the soil is dry.
+            dry_raw, wet_raw: Raw readings in dry air and in water.
+        """
+        self.adc = adc
+        self.channels = list(channels)
+        self.rate = rate
+        self.batch = batch
+        self.threshold = threshold
+        self.dry_raw = dry_raw
+        self.wet_raw = wet_raw
+        self.filters = [StreamingFilter(window, alpha) for _ in self.channels]
+        self.buffers = [RingBuffer(buffer_size) for _ in self.channels]
+        self.moisture = None  # Latest filtered moisture per channel, in %
+        self.samples = 0
+        self.overruns = 0  # Sampling periods missed because a batch took too long
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.sample, name='moisture')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    # Returns the average moisture in %, None before the first batch
+    def average(self):
+        moisture = self.moisture
+        if moisture is None:
+            return None
+        return sum(moisture) / len(moisture)
+
+    # Returns True if the soil needs water
+    # Before the first batch, only if the sampling has died (better water than never)
+    def is_dry(self):
+        average = self.average()
+        if average is None:
+            return self._thread is None or not self._thread.is_alive()
+        return average < self.threshold
+
+    # Converts raw readings to % (capacitive sensors read lower when wet)
+    def to_percent(self, raw):
+        percent = (self.dry_raw - raw) / (self.dry_raw - self.wet_raw) * 100
+        return np.clip(percent, 0, 100)
+
+    # Sampling thread
+    def sample(self):
+        period = 1 / self.rate
+        raw = [[] for _ in self.channels]
+        next_sample = time.monotonic()
+
+        while not self._stop.is_set():
+            try:
+                for i, channel in enumerate(self.channels):
+                    raw[i].append(self.adc.read(channel))
+            except (IOError, OSError):
+                logger.exception('Cannot read the soil moisture, sampling stopped')
+                self.moisture = None
+                return
+            self.samples += 1
+
+            if len(raw[0]) >= self.batch:
+                self.process(raw)
+                raw = [[] for _ in self.channels]
+
+            next_sample += period
+            delay = next_sample - time.monotonic()
+            if delay < 0:
+                # Drop the missed periods instead of bursting to catch up
+                self.overruns += 1
+                next_sample = time.monotonic()
+                delay = 0
+            self._stop.wait(delay)
+
+    # Filters a batch of raw readings and publishes the latest moisture
+    def process(self, raw):
+        moisture = []
+        for i, readings in enumerate(raw):
+            filtered = self.to_percent(self.filters[i].update(readings))
+            self.buffers[i].extend(filtered)
+            moisture.append(float(filtered[-1]))
+        self.moisture = moisture
+
+
+# Creates the sensor described by param.MOISTURE
+def create_moisture_sensor(config):
+    if config.get('trace'):
+        adc = FakeADC.from_csv(config['trace'])
+    else:
+        adc = MCP3008(*config.get('spi', (0, 0)))
+
+    options = dict((k, v) for k, v in config.items() if k not in ('spi', 'trace'))
+    sensor = MoistureSensor(adc, **options)
+    sensor.start()
+    logger.info('Sampling soil moisture on channels %s at %s Hz', sensor.channels, sensor.rate)
+    return sensor
@@ -0,0 +1,216 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##################################
+#  Supervisor and watchdog       #
+#                                #
+#  Relay off and restart when    #
+#  the control loop misbehaves   #
+##################################
+
+"""
+The control loop calls Supervisor.heartbeat() after each healthy tick, which
+pets the watchdog (/dev/watchdog, or a NullWatchdog without one) and hands
+over when the relay has to be off at the latest.
+
+The supervisor thread wakes up every ``interval`` seconds and checks:
+
+- the age of the last heartbeat, against ``max_heartbeat_age``,
+- the relay, against the deadline of the last heartbeat (endWateringDate
+  plus ``relay_margin``),
+- the resident memory, against its size after ``rss_grace`` seconds plus
+  ``max_rss_growth`` MB.
+
+On a violation the relay is forced off and the process restarts itself
+(execv), so a violation is seen within ``interval`` seconds of the limit
+being crossed. If even that fails, the watchdog is not petted anymore and
+the kernel reboots the Pi after ``timeout`` seconds.
+"""
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import fcntl
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+WDIOC_SETTIMEOUT = 0xC0045706  # _IOWR('W', 6, int)
+RESTART_ENV = 'WATERING_SUPERVISOR_RESTART'  # "reason;detection latency" of the violation before a restart
+
+
+class Watchdog(object):
+    """The kernel watchdog device, rebooting the Pi when not petted for ``timeout`` seconds."""
+
+    def __init__(self, path='/dev/watchdog', timeout=15):
+        self.path = path
+        self.fd = os.open(path, os.O_WRONLY)
+        self.pets = 0
+        try:
+            fcntl.ioctl(self.fd, WDIOC_SETTIMEOUT, struct.pack(str('i'), timeout))
+        except (IOError, OSError) as e:
+            logger.warning('Cannot set the timeout of %s to %d s: %s', path, timeout, e)
+
+    def pet(self):
+        os.write(self.fd, b'\0')
+        self.pets += 1
+
+    # Disarms the watchdog ("magic close"), only when the process stops on purpose
+    def close(self):
+        if self.fd is not None:
+            os.write(self.fd, b'V')
+            os.close(self.fd)
+            self.fd = None
+
+
+class NullWatchdog(object):
+    """Stand-in for a Pi without a watchdog device, the supervisor still runs."""
+
+    def __init__(self):
+        self.pets = 0
+
+    def pet(self):
+        self.pets += 1
+
+    def close(self):
+        pass
+
+
+# Returns the resident memory of the process, in bytes, None without procfs
+def resident_memory():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+
+# Replaces the process with a fresh one, same interpreter and arguments
+def restart_process(reason, latency):
+    logging.shutdown()
+    os.environ[RESTART_ENV] = '{};{:.6f}'.format(reason, latency)
+    os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+class Supervisor(object):
+    """Checks the control loop from a thread of its own.
+
+    ``force_off`` switches the relay off, from the supervisor thread.
+    ``restart`` is called with the reason and the detection latency (in
+    seconds) once the relay is off.
+
+    """
+
+    def __init__(self, watchdog, force_off, restart=restart_process, timeout=15, interval=.5,
+                 max_heartbeat_age=5, relay_margin=60, max_rss_growth=64, rss_grace=300):
+        if max_heartbeat_age + interval >= timeout:
+            raise ValueError('The watchdog timeout must be longer than max_heartbeat_age + interval')
+        self.watchdog = watchdog
+        self.force_off = force_off
+        self.restart = restart
+        self.interval = interval
+        self.max_heartbeat_age = max_heartbeat_age
+        self.relay_margin = relay_margin
+        self.max_rss_growth = max_rss_growth * 1024 * 1024
+
+        self.started = None
+        self.last_heartbeat = None  # Monotonic time
+        self.relay_deadline = None  # Monotonic time the relay has to be off by, None when off
+        self.rss_grace = rss_grace
+        self.rss_baseline = None
+        self.rss = None
+        self.tripped = False
+        self.detection_latency = None  # Of the last violation, in seconds
+        self.thread = None
+        self.stopping = threading.Event()
+
+    @property
+    def bound(self):
+        """Longest time between a limit being crossed and the relay being forced off."""
+        return self.interval
+
+    # Returns the monotonic deadline of a relay on until end_in seconds from now
+    def deadline(self, end_in):
+        return time.monotonic() + end_in + self.relay_margin
+
+    # Called by the control loop after a healthy tick, relay_deadline from deadline() or None
+    def heartbeat(self, relay_deadline):
+        if self.tripped:
+            return
+        self.last_heartbeat = time.monotonic()
+        self.relay_deadline = relay_deadline
+        self.watchdog.pet()
+
+    def start(self):
+        self.started = self.last_heartbeat = time.monotonic()
+        self.thread = threading.Thread(target=self.run, name='supervisor', daemon=True)
+        self.thread.start()
+        logger.info('Supervisor started, violations detected within %.1f s', self.bound)
+
+    # Stops the checks and disarms the watchdog
+    def stop(self):
+        self.stopping.set()
+        self.watchdog.close()
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            violation = self.check(time.monotonic())
+            if violation:
+                self.trip(*violation)
+                return
+
+    # Returns (reason, how long ago the limit was crossed) or None
+    def check(self, now):
+        stalled_at = self.last_heartbeat + self.max_heartbeat_age
+        if now > stalled_at:
+            return 'no heartbeat for {:.1f} s'.format(now - self.last_heartbeat), now - stalled_at
+
+        deadline = self.relay_deadline
+        if deadline is not None and now > deadline:
+            return 'relay on past the end of the watering', now - deadline
+
+        self.rss = resident_memory()
+        if self.rss is not None and now - self.started >= self.rss_grace:
+            if self.rss_baseline is None:
+                self.rss_baseline = self.rss
+            elif self.rss > self.rss_baseline + self.max_rss_growth:
+                return 'resident memory grew by {:.0f} MB'.format((self.rss - self.rss_baseline) / 1048576), 0.0
+        return None
+
+    def trip(self, reason, latency):
+        self.tripped = True
+        try:
+            self.force_off()
+        finally:
+            self.detection_latency = latency
+            logger.critical('Supervisor: %s, relay forced off %.3f s after the limit, restarting', reason, latency)
+            self.restart(reason, latency)
+
+
+# Returns the violation and the detection latency that restarted the process, None after a normal start
+def last_restart():
+    value = os.environ.pop(RESTART_ENV, None)
+    if not value:
+        return None
+    reason, _, latency = value.rpartition(';')
+    try:
+        return reason, float(latency)
+    except ValueError:
+        return None
+
+
+# Builds the supervisor and the watchdog of param.SUPERVISOR, falling back to a NullWatchdog
+def create_supervisor(config, force_off):
+    options = dict(config)
+    device = options.pop('device', None)
+    watchdog = NullWatchdog()
+    if device:
+        try:
+            watchdog = Watchdog(device, options.get('timeout', 15))
+        except (IOError, OSError) as e:
+            logger.warning('No watchdog (%s), the supervisor runs alone', e)
+    return Supervisor(watchdog, force_off, **options)
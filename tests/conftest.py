@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import asyncio
+import os
+import signal
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from RPLCD.fakes import install_fake_gpio
+
+# RPLCD.lcd and main import RPi.GPIO when loaded
+GPIO = install_fake_gpio()
+
+
+@pytest.fixture
+def gpio():
+    GPIO.reset()
+    return GPIO
+
+
+@pytest.fixture
+def doorbell():
+    """SIGUSR1 ignored, for a relayd running in the test process."""
+    previous = signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    yield
+    signal.signal(signal.SIGUSR1, previous)
+
+
+@pytest.fixture
+def make_watering(gpio, tmp_path, monkeypatch):
+    """Returns a function creating a Watering on the fake GPIO, with the param.py values given to it.
+
+    Without state file, configuration file nor supervisor unless given.
+
+    """
+    import main
+    import param
+
+    monkeypatch.setattr(param, 'STATE_FILE', str(tmp_path / 'state.json'))
+    monkeypatch.setattr(param, 'CONFIG_FILE', None)
+    monkeypatch.setattr(param, 'SUPERVISOR', None)
+
+    def make(**params):
+        for name, value in params.items():
+            monkeypatch.setattr(param, name, value)
+        return main.Watering()
+    return make
+
+
+@pytest.fixture
+def in_loop():
+    """Returns a function calling func (a coroutine function or not) in a new loop set up like Watering.run()."""
+    def run(watering, func):
+        async def main():
+            watering.loop = asyncio.get_running_loop()
+            watering.activity = asyncio.Event()
+            watering.lcd_wakeup = asyncio.Event()
+            result = func()
+            if asyncio.iscoroutine(result):
+                result = await result
+            for task in list(watering.tasks):
+                task.cancel()
+            return result
+        return asyncio.run(main())
+    return run
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import json
+import os
+
+import pytest
+
+import config
+import param
+
+
+def write(path, watering, mtime):
+    with open(path, 'w') as f:
+        json.dump({'watering': watering}, f)
+    os.utime(path, (mtime, mtime))
+
+
+def test_defaults_match_watering(make_watering):
+    watering = make_watering()
+    settings = dict((key, getattr(watering, key)) for key in config.WATERING_DEFAULTS
+                    if key not in ('mode', 'schedule', 'budget'))
+    settings.update(mode=watering.modeList[watering.currentModeSelected], schedule=watering.schedule,
+                    budget=watering.budget)
+    assert settings == config.WATERING_DEFAULTS
+
+
+def test_removed_setting_back_to_default(make_watering, tmp_path):
+    path = str(tmp_path / 'config.json')
+    write(path, {'durationOfWatering': 20, 'mode': 'MANU', 'budget': {'months': [50] * 12}}, 1000)
+    watering = make_watering(CONFIG_FILE=path)
+    assert (watering.durationOfWatering, watering.currentModeSelected) == (20, 1)
+    assert watering.budget is not None
+
+    write(path, {'mode': 'MANU'}, 2000)
+    settings = watering.config_watcher.poll(now=float('inf'))
+    watering.apply_settings(settings)
+    assert settings == dict(config.WATERING_DEFAULTS, mode='MANU')
+    assert watering.durationOfWatering == 40
+    assert watering.currentModeSelected == 1
+    assert watering.budget is None
+
+
+def test_invalid_reload_ignored(tmp_path):
+    path = str(tmp_path / 'config.json')
+    write(path, {'durationOfWatering': 20}, 1000)
+    watcher = config.ConfigWatcher(path)
+    write(path, {'durationOfWatering': 25}, 2000)
+    assert watcher.poll(now=float('inf')) is None
+    # Unchanged since
+    assert watcher.poll(now=float('inf')) is None
+
+
+def test_warm_restart_edited_file(make_watering, in_loop, tmp_path):
+    path = str(tmp_path / 'config.json')
+    write(path, {'durationOfWatering': 20}, 1000)
+    watering = make_watering(CONFIG_FILE=path)
+    in_loop(watering, watering.request_save)
+    watering.lcd_executor.submit(lambda: None).result()
+
+    # Removed while the process was down
+    write(path, {}, 2000)
+    assert make_watering(CONFIG_FILE=path).durationOfWatering == 40
+
+
+def test_invalid_file_at_startup(make_watering, tmp_path):
+    path = str(tmp_path / 'config.json')
+    with open(path, 'w') as f:
+        f.write('{')
+    watering = make_watering(CONFIG_FILE=path)
+    assert watering.pins == config.compile_pins(param.GPIO)
+    with pytest.raises(config.ConfigError):
+        config.load(path)
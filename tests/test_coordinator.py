@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import random
+
+from coordinator import MINUTES_PER_DAY, SlotPlanner
+
+
+# Minutes of the day covered by each reservation, wrapping at midnight
+def covered(planner):
+    minutes = {}
+    for controller_id, (start, duration, flow) in planner.reservations.items():
+        minutes[controller_id] = set((start + m) % MINUTES_PER_DAY for m in range(duration))
+    return minutes
+
+
+def test_no_overlap_at_full_flow():
+    planner = SlotPlanner(capacity=15)
+    offsets = [planner.request(i, (23, 50), 40, 15) for i in range(4)]
+    # Back to back, the first one across midnight
+    assert offsets == [0, 40, 80, 120]
+    slots = list(covered(planner).values())
+    for i, a in enumerate(slots):
+        for b in slots[i + 1:]:
+            assert not a & b
+
+
+def test_shared_capacity():
+    planner = SlotPlanner(capacity=60)
+    assert [planner.request(i, (6, 0), 30, 15) for i in range(5)] == [0, 0, 0, 0, 30]
+    assert planner.request('big', (6, 0), 10, 61) is None
+    planner.release(0)
+    assert planner.request(5, (6, 10), 10, 15) == 0
+
+
+def test_random_requests_never_overlap():
+    rng = random.Random(38)
+    planner = SlotPlanner(capacity=60)
+    for _ in range(2000):
+        controller_id = rng.randrange(40)
+        if rng.random() < 0.2:
+            planner.release(controller_id)
+            continue
+        flow = rng.choice([10, 15, 20, 30, 60])
+        offset = planner.request(controller_id, (rng.randrange(24), rng.randrange(60)),
+                                 rng.randrange(1, 240), flow)
+        if offset is None:
+            assert controller_id not in planner.reservations
+
+        # The reserved flows never add up over the capacity in any minute
+        total = [0] * MINUTES_PER_DAY
+        for other, minutes in covered(planner).items():
+            for minute in minutes:
+                total[minute] += planner.reservations[other][2]
+        assert max(total) <= planner.capacity
+        assert total == [round(used, 6) for used in planner.used]
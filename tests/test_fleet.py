@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import asyncio
+
+import fleet
+
+
+def status(mode='AUTO', watering=False, emergency=False, volume=None):
+    return {'mode': mode, 'ongoingWatering': watering, 'emergency': emergency, 'lastWateringVolume': volume}
+
+
+def publisher(controller_id, transport=None):
+    return fleet.Publisher(transport, controller_id=controller_id, zone='zone ' + controller_id, batch_delay=0)
+
+
+def test_events():
+    p = publisher('a')
+    p.observe(status())
+    p.observe(status(watering=True))
+    p.observe(status(watering=False, volume=12.5))
+    p.observe(status(mode='MANU', emergency=True))
+    assert [e['event'] for e in p.buffer] == ['hello', 'watering_started', 'watering_stopped', 'mode_changed',
+                                              'emergency']
+    assert [e['seq'] for e in p.buffer] == [1, 2, 3, 4, 5]
+    assert p.buffer[2]['volume'] == 12.5
+
+
+def test_aggregator_index():
+    aggregator = fleet.Aggregator()
+    publishers = [publisher(i) for i in 'abc']
+    for p in publishers:
+        p.observe(status())
+    publishers[0].observe(status(watering=True))
+    publishers[2].observe(status(watering=True))
+    publishers[2].observe(status(watering=True, emergency=True))
+    for p in publishers:
+        for event in p.buffer:
+            assert aggregator.apply(event)
+    assert aggregator.query({'op': 'watering'}) == {'watering': ['zone a', 'zone c']}
+    assert aggregator.query({'op': 'emergency'}) == {'emergency': ['zone c']}
+    assert aggregator.query({'op': 'summary'}) == {'controllers': 3, 'watering': 2, 'emergency': 1}
+
+
+def test_boots():
+    aggregator = fleet.Aggregator()
+    old = publisher('a')
+    old.observe(status())
+    old.observe(status(watering=True))
+    assert aggregator.apply(old.buffer[0])
+
+    # The process restarted, whatever the clock says its events win
+    new = publisher('a')
+    assert new.boot != old.boot
+    new.observe(status())
+    assert aggregator.apply(new.buffer[0])
+    # A late event of the previous process, or a replayed one, is dropped
+    assert not aggregator.apply(old.buffer[1])
+    assert not aggregator.apply(new.buffer[0])
+    assert aggregator.query({'op': 'watering'}) == {'watering': []}
+
+
+class FlakyTransport(object):
+    def __init__(self, failures):
+        self.failures = failures
+        self.batches = []
+
+    async def send(self, batch):
+        if self.failures:
+            self.failures -= 1
+            raise OSError('Bus down')
+        self.batches.append([e['seq'] for e in batch])
+
+
+def test_offline_buffer(monkeypatch):
+    monkeypatch.setattr(fleet, 'RETRY_MIN', 0)
+    transport = FlakyTransport(failures=2)
+    p = publisher('a', transport)
+
+    async def scenario():
+        task = asyncio.ensure_future(p.run())
+        await asyncio.sleep(0)
+        for watering in (False, True, False):
+            p.observe(status(watering=watering))
+        for _ in range(100):
+            await asyncio.sleep(0)
+        task.cancel()
+    asyncio.run(scenario())
+    # Sent in one batch once the bus is back
+    assert transport.batches == [[1, 2, 3]]
+    assert not p.buffer
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import flow
+
+
+def aggregator(**options):
+    meter = flow.FlowMeter(channel=7)
+    # 60 pulses per litre: n pulses a second is n L/min
+    return meter, flow.FlowAggregator(meter, pulses_per_litre=60, leak_rate=0.2, max_rate=30, periods=3,
+                                      grace=5, **options)
+
+
+# One update a second from start, with rate pulses a second, returns the alarms
+def run(meter, agg, start, seconds, rate, watering):
+    alarms = []
+    for now in range(start, start + seconds):
+        meter.pulses += rate
+        alarms.append(agg.update(now, watering))
+    return alarms
+
+
+def test_leak():
+    meter, agg = aggregator()
+    assert agg.update(0, False) is None
+    # Ignored during the grace period after the first update, then raised on the third period over leak_rate
+    assert run(meter, agg, 1, 8, 10, False) == [None] * 7 + [flow.LEAK]
+    assert agg.rate == 10
+    assert run(meter, agg, 9, 2, 10, False) == [flow.LEAK] * 2
+
+
+def test_consecutive_periods():
+    meter, agg = aggregator()
+    agg.update(0, False)
+    run(meter, agg, 1, 5, 0, False)  # Grace
+    assert run(meter, agg, 6, 2, 10, False) == [None, None]
+    # A period under the limit starts the count again
+    assert run(meter, agg, 8, 1, 0, False) == [None]
+    assert agg.over_limit == 0
+    assert run(meter, agg, 9, 3, 10, False) == [None, None, flow.LEAK]
+
+
+def test_burst():
+    meter, agg = aggregator()
+    agg.update(0, False)
+    run(meter, agg, 1, 10, 0, False)
+    agg.start_session()
+    # The valve opened: a normal flow, then one over max_rate once the grace period is over
+    assert run(meter, agg, 11, 5, 60, True) == [None] * 5
+    assert run(meter, agg, 16, 3, 20, True) == [None] * 3
+    assert run(meter, agg, 19, 3, 40, True) == [None, None, flow.BURST]
+    assert agg.session == (5 * 60 + 3 * 20 + 3 * 40) / 60
+
+
+def test_grace_after_closing():
+    meter, agg = aggregator()
+    agg.update(0, True)
+    run(meter, agg, 1, 10, 20, True)
+    # The pipe drains after the valve closed
+    assert run(meter, agg, 11, 5, 10, False) == [None] * 5
+    assert run(meter, agg, 16, 3, 0, False) == [None] * 3
+
+
+def test_alarm_cleared_by_button(make_watering, in_loop, monkeypatch):
+    import asyncio
+    import main
+    monkeypatch.setattr(main, 'FLOW_INTERVAL', .01)
+    watering = make_watering(FLOW={'pulses_per_litre': 60, 'periods': 1, 'grace': 0})
+    raised = []
+
+    async def scenario():
+        watering.spawn(watering.flow_monitor())
+        for _ in range(100):
+            watering.flow_meter.pulses += 10
+            await asyncio.sleep(.01)
+            if watering.emergency_on:
+                raised.append(watering.currentMenuSelected)
+                break
+        # The leak stopped, the emergency button lets the waterings start again
+        await asyncio.sleep(.05)
+        watering.emergency_btn_pressed(watering.pins.emergency)
+        await asyncio.sleep(.05)
+    in_loop(watering, scenario)
+    assert raised == [watering.EMERGENCY_MENU]
+    assert not watering.emergency_on
+    assert watering.currentMenuSelected == watering.HOME_MENU
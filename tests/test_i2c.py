@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from RPLCD import CharLCD, I2CBus
+from RPLCD.fakes import FakeSMBus
+from RPLCD.lcd import RS_DATA, RS_INSTRUCTION, PCF_RW, I2C_BLOCK_SIZE
+
+
+def four_bit_bus():
+    smbus = FakeSMBus()
+    smbus.lcd.four_bit = True  # As left by the CharLCD init sequence
+    return smbus, I2CBus(bus=smbus)
+
+
+def test_data_byte_ports():
+    smbus, bus = four_bit_bus()
+    bus.send(0x41, RS_DATA)
+    # High then low nibble on P4-P7, each with E high then low, backlight and RS set
+    assert smbus.transactions == [(0x27, b'\x4d\x49\x1d\x19')]
+    assert smbus.lcd.data == 1
+    assert smbus.lcd.ddram[0] == 0x41
+
+
+def test_instruction_decoded():
+    smbus, bus = four_bit_bus()
+    bus.send(0x80 | 0x45, RS_INSTRUCTION)  # Set DDRAM address
+    assert smbus.transactions == [(0x27, b'\xcc\xc8\x5c\x58')]
+    assert smbus.lcd.commands == 1
+    assert smbus.lcd.address == 0x45
+
+
+def test_block_transfers():
+    smbus, bus = four_bit_bus()
+    text = b'Hello, world!'
+    bus.send_many([(c, RS_DATA) for c in bytearray(text)])
+    # 4 port writes per byte, split in SMBus blocks
+    assert smbus.bytes_sent == 4 * len(text)
+    assert all(len(data) <= I2C_BLOCK_SIZE for _, data in smbus.transactions)
+    assert not any(port & PCF_RW for _, data in smbus.transactions for port in bytearray(data))
+    assert bytes(smbus.lcd.ddram[:len(text)]) == text
+
+
+def test_char_lcd():
+    smbus = FakeSMBus()
+    lcd = CharLCD(bus=I2CBus(bus=smbus))
+    lcd.cursor_pos = (2, 3)
+    lcd.write_string('Arrosage')
+    assert smbus.lcd.lines() == [' ' * 20, ' ' * 20, '   Arrosage' + ' ' * 9, ' ' * 20]
+    assert smbus.backlight
+    lcd.backlight_enabled = False
+    assert not smbus.backlight
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from RPLCD.charmap import Charmap, FRENCH_GLYPHS
+
+
+# Returns the frames of the menus that only display something
+def frames(watering):
+    screens = [watering.display_menu_home, watering.display_config_menu, watering.display_emergency]
+    # The first entry starts or stops the watering
+    screens += [watering.configMenu[i][0] for i in sorted(watering.configMenu) if i]
+    result = []
+    for screen in screens:
+        screen()
+        result.append(watering.frame)
+    return result
+
+
+def test_charmap(make_watering, in_loop):
+    watering = make_watering()
+    charmap = Charmap('A00', FRENCH_GLYPHS)
+    for lines in in_loop(watering, lambda: frames(watering)):
+        assert len(lines) == 4
+        for line in lines:
+            # Written with the ROM and the french glyphs, nothing replaced
+            if line:
+                assert b'?' not in charmap.encode(line.replace('?', ''))
+
+
+def test_emergency(make_watering, in_loop):
+    watering = make_watering()
+    in_loop(watering, watering.display_emergency)
+    assert [line and line.strip() for line in watering.frame] == ['Urgence activée !', None,
+                                                                  'Système désactivé', None]
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from RPLCD import CharLCD, I2CBus, SharedBus, LCDGroup, batched
+from RPLCD.fakes import FakeSMBus
+
+PINS_E = [16, 26, 29]
+
+
+def frame(lcd, lines):
+    with batched(lcd):
+        for row, line in enumerate(lines):
+            lcd.cursor_pos = (row, 0)
+            lcd.write_string(line)
+
+
+def shared_group(gpio, count=2):
+    controllers = [gpio.attach_lcd(pin_e=pin) for pin in PINS_E[:count]]
+    shared = SharedBus(pins_e=PINS_E[:count])
+    group = LCDGroup([CharLCD(bus=shared.port(i)) for i in range(count)])
+    return controllers, group
+
+
+def test_mirrored(gpio):
+    controllers, group = shared_group(gpio, 3)
+    lines = ['{:<20}'.format(c * 20) for c in 'ABCD']
+    frame(group, lines)
+    for controller in controllers:
+        assert controller.lines() == lines
+    assert group.content == [line.encode('latin-1') for line in lines]
+
+
+def test_one_pass(gpio):
+    controllers, group = shared_group(gpio)
+    strobes = []
+    output = gpio.output
+
+    def counting(channel, value):
+        if isinstance(channel, list) and value:
+            strobes.append(tuple(channel))
+        output(channel, value)
+    gpio.output = counting
+    try:
+        frame(group, ['Hello'])
+    finally:
+        gpio.output = output
+    # Every nibble is latched by both displays at once
+    assert strobes and all(pins == tuple(PINS_E[:2]) for pins in strobes)
+    assert [c.lines()[0][:5] for c in controllers] == ['Hello', 'Hello']
+
+
+def test_own_changes_only(gpio):
+    controllers, group = shared_group(gpio)
+    frame(group, ['Mode AUTO', 'Prochain arrosage'])
+    # The second display shows something else on its first row
+    frame(group.lcds[1], ['Vanne 2'])
+    data = [c.data for c in controllers]
+
+    frame(group, ['Mode MANU', 'Prochain arrosage'])
+    assert [c.lines()[0][:9] for c in controllers] == ['Mode MANU', 'Mode MANU']
+    assert [c.lines()[1][:17] for c in controllers] == ['Prochain arrosage'] * 2
+    # Only the cells that changed on each panel
+    assert controllers[0].data - data[0] == 4
+    assert controllers[1].data - data[1] == 9
+
+
+def test_other_bus(gpio):
+    controller = gpio.attach_lcd(pin_e=PINS_E[0])
+    smbus = FakeSMBus()
+    shared = SharedBus(pins_e=PINS_E[:1], pin_backlight=18)
+    group = LCDGroup([CharLCD(bus=shared.port(0)), CharLCD(bus=I2CBus(bus=smbus))])
+    frame(group, ['', 'Arrosage en cours'])
+    assert controller.lines()[1] == smbus.lcd.lines()[1] == '{:<20}'.format('Arrosage en cours')
+    group.backlight_enabled = False
+    assert not smbus.backlight
+
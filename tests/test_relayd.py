@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import time
+
+import pytest
+
+import relayd
+
+PIN = 36
+
+
+def test_local_relay(gpio):
+    relay = relayd.LocalRelay(PIN, gpio)
+    relay.set(True)
+    assert gpio.levels[PIN] == gpio.HIGH
+    assert relay.is_on()
+    latency, cut, down = relay.poll()
+    assert latency is not None and not cut and not down
+    relay.set(False)
+    assert not relay.is_on()
+
+
+def test_daemon_applies_commands(gpio, tmp_path, doorbell):
+    path = str(tmp_path / 'relay')
+    client = relayd.RelayClient(path, relayd.LocalRelay(PIN, gpio))
+    daemon = relayd.RelayDaemon(relayd.Block(path), PIN, gpio)
+    assert client.alive()
+
+    client.set(True, 60)
+    daemon.step()
+    assert gpio.levels[PIN] == gpio.HIGH
+    state = client.state()
+    assert state.on and state.acked == client.sent_id
+    assert state.deadline - state.on_since == (60 + client.margin) * 10 ** 9
+    latency, cut, down = client.poll()
+    assert latency is not None and not cut and not down
+
+    # Past its deadline, relayd cuts the water by itself, reported once
+    daemon.deadline = time.monotonic_ns()
+    daemon.step()
+    assert gpio.levels[PIN] == gpio.LOW
+    assert client.poll()[1:] == (True, False)
+    assert client.poll()[1:] == (False, False)
+
+
+def test_down_after_grace(gpio, tmp_path):
+    path = str(tmp_path / 'relay')
+    # relayd not started yet
+    assert not relayd.RelayClient(path, relayd.LocalRelay(PIN, gpio), grace=30).poll()[2]
+
+    client = relayd.RelayClient(path, relayd.LocalRelay(PIN, gpio), grace=0)
+    assert client.poll()[2]
+    # The command is left in the block and applied by the pin of the controller
+    client.set(True, 60)
+    assert gpio.levels[PIN] == gpio.HIGH
+    assert client.block.read(relayd.COMMAND_OFFSET, relayd.COMMAND)[1:3] == (client.sent_id, 1)
+
+
+def test_back_once_relayd_starts(gpio, tmp_path, doorbell):
+    path = str(tmp_path / 'relay')
+    client = relayd.RelayClient(path, relayd.LocalRelay(PIN, gpio), grace=0)
+    client.set(True, 60)
+    assert client.poll()[2]
+
+    # relayd picks up the command left while it was down
+    daemon = relayd.RelayDaemon(relayd.Block(path), PIN, gpio)
+    daemon.step()
+    assert not client.poll()[2]
+    assert client.state().acked == client.sent_id and client.is_on()
+
+    # Heartbeat too old
+    daemon.publish(time.monotonic_ns() - client.alive_ns)
+    assert client.poll()[2]
+
+
+def test_watering_while_relayd_down(make_watering, in_loop, gpio, tmp_path, doorbell):
+    path = str(tmp_path / 'relay')
+    watering = make_watering(RELAYD={'path': path, 'grace': 0})
+    watering.currentModeSelected = watering.modeList.index('MANU')
+
+    def down():
+        watering.tick()
+        watering.start_watering()
+    in_loop(watering, down)
+    # Not an emergency, no watering starts until relayd is back
+    assert watering.relayd_down and not watering.emergency_on
+    assert not watering.ongoingWatering
+    assert watering.status()['relaydDown']
+
+    daemon = relayd.RelayDaemon(relayd.Block(path), watering.pins.relay, gpio)
+
+    def back():
+        watering.tick()
+        watering.start_watering()
+        daemon.step()
+    in_loop(watering, back)
+    assert not watering.relayd_down and not watering.emergency_on
+    assert watering.ongoingWatering and watering.relay.state().on
+
+
+
+def test_block_crc(tmp_path):
+    block = relayd.Block(str(tmp_path / 'relay'))
+    # Never written
+    assert block.read(relayd.STATE_OFFSET, relayd.STATE) == (0,) * 10
+    seq = block.write(relayd.COMMAND_OFFSET, relayd.COMMAND, 0, 7, True, 60.0, 123)
+    assert block.read(relayd.COMMAND_OFFSET, relayd.COMMAND) == (seq, 7, 1, 60.0, 123)
+
+    # A store seen out of order (here the on field) does not match the CRC: never returned
+    block.mm[relayd.COMMAND_OFFSET + 8] = 0
+    with pytest.raises(RuntimeError):
+        block.read(relayd.COMMAND_OFFSET, relayd.COMMAND)
+    block.mm[relayd.COMMAND_OFFSET + 8] = 1
+    assert block.read(relayd.COMMAND_OFFSET, relayd.COMMAND)[2] == 1
+
+    # Nor is a write in progress
+    relayd.SEQ.pack_into(block.mm, relayd.COMMAND_OFFSET, seq + 1)
+    with pytest.raises(RuntimeError):
+        block.read(relayd.COMMAND_OFFSET, relayd.COMMAND)
+    block.write(relayd.COMMAND_OFFSET, relayd.COMMAND, seq, 8, False, 0, 456)
+    assert block.read(relayd.COMMAND_OFFSET, relayd.COMMAND)[1:] == (8, 0, 0.0, 456)
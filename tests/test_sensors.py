@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import numpy as np
+import pytest
+
+from sensors import FakeADC, MoistureSensor, StreamingFilter
+
+# A single spike then a step
+TRACE = [10, 10, 100, 10, 10, 20, 20, 20]
+# Median over 3 samples, the first one repeated before the trace: the spike is gone
+MEDIANS = [10, 10, 10, 10, 10, 10, 20, 20]
+# EMA with alpha = 0.5, starting at the first median
+FILTERED = [10, 10, 10, 10, 10, 10, 15, 17.5]
+
+
+def test_median_ema():
+    f = StreamingFilter(window=3, alpha=0.5)
+    assert list(f.update(TRACE)) == pytest.approx(FILTERED)
+
+
+def test_batches_match_one_shot():
+    f = StreamingFilter(window=3, alpha=0.5)
+    out = []
+    for i in range(0, len(TRACE), 3):
+        out.extend(f.update(TRACE[i:i + 3]))
+    assert out == pytest.approx(FILTERED)
+    assert len(f.update([])) == 0
+
+
+# Long enough to go through several EMA chunks, for a small and large alphas
+@pytest.mark.parametrize('alpha', [0.1, 0.95, 0.999])
+def test_matches_sample_by_sample(alpha):
+    trace = [(i * 37) % 1024 for i in range(1000)]
+    window = 5
+    expected = []
+    ema = None
+    for i in range(len(trace)):
+        samples = [trace[max(j, 0)] for j in range(i - window + 1, i + 1)]
+        median = sorted(samples)[window // 2]
+        ema = median if ema is None else (1 - alpha) * ema + alpha * median
+        expected.append(ema)
+    filtered = StreamingFilter(window, alpha).update(trace)
+    assert np.all(np.isfinite(filtered))
+    assert list(filtered) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('alpha', [0, 1, -0.1, 1.5])
+def test_invalid_alpha(alpha):
+    with pytest.raises(ValueError):
+        StreamingFilter(alpha=alpha)
+    with pytest.raises(ValueError):
+        MoistureSensor(FakeADC({0: [500]}), alpha=alpha)
+
+
+def test_moisture_from_fake_adc():
+    adc = FakeADC({0: [850, 850, 400, 850], 1: [400] * 4})
+    sensor = MoistureSensor(adc, channels=[0, 1], batch=4, window=3, alpha=0.5, threshold=40)
+    raw = [[adc.read(c) for _ in range(4)] for c in sensor.channels]
+    sensor.process(raw)
+    # 850 reads dry (0 %) and 400 wet (100 %), the single wet reading is filtered out
+    assert sensor.moisture == pytest.approx([0, 100])
+    assert sensor.average() == pytest.approx(50)
+    assert not sensor.is_dry()
+    assert list(sensor.buffers[0].last()) == pytest.approx([0, 0, 0, 0])
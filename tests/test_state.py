@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import json
+
+import param
+
+
+class StubLCD(object):
+    def __init__(self):
+        self.content = [b' ' * 20] * 4
+
+
+def saved():
+    with open(param.STATE_FILE) as f:
+        return json.load(f)
+
+
+def test_lcd_job_writes_the_loop_snapshot(make_watering, in_loop):
+    watering = make_watering()
+    watering.lcd = StubLCD()
+    watering.startTime = [6, 30]
+    in_loop(watering, watering.request_save)
+    watering.lcd_executor.submit(lambda: None).result()
+    assert saved()['startTime'] == [6, 30]
+
+    # Changed in the loop without a save yet: the LCD thread keeps writing the last snapshot
+    watering.add_start_time()
+    during = []
+
+    def job(text):
+        during.append(saved()['lcd']['clean'])
+        watering.lcd.content = [text.encode('latin-1')] + watering.lcd.content[1:]
+    watering.lcd_executor.submit(watering.run_lcd_job, job, ('{:<20}'.format('Menu'),)).result()
+    assert during == [False]
+    state = saved()
+    assert state['startTime'] == [6, 30]
+    assert state['lcd'] == {'clean': True, 'content': ['{:<20}'.format('Menu')] + [' ' * 20] * 3}
+
+
+def test_warm_restart(make_watering, in_loop):
+    watering = make_watering()
+    watering.lcd = StubLCD()
+    watering.durationOfWatering = 25
+    in_loop(watering, watering.request_save)
+    watering.lcd_executor.submit(lambda: None).result()
+
+    restarted = make_watering()
+    assert restarted.warm_start
+    assert restarted.durationOfWatering == 25
+    assert restarted.lcd_content == [b' ' * 20] * 4
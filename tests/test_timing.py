@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import threading
+import time
+
+from RPLCD.timing import PreciseDelay
+
+
+def test_wait():
+    delay = PreciseDelay()
+    delay.calibrate(samples=5)
+    for nanoseconds in (1000, 50000, 2000000):
+        start = time.perf_counter_ns()
+        delay.wait_ns(nanoseconds)
+        assert time.perf_counter_ns() - start >= nanoseconds
+    stats = delay.stats()
+    assert stats['calls'] == 3
+    assert 0 <= stats['late_mean_us'] <= stats['late_max_us']
+
+
+def test_stats_across_threads():
+    delay = PreciseDelay()
+    delay.sleep_overshoot_ns = 10 ** 9  # Busy-wait only
+    seen = []
+
+    def bus():
+        for _ in range(2000):
+            delay.wait_ns(0)
+
+    def metrics():
+        while any(t.is_alive() for t in threads):
+            stats = delay.stats()
+            seen.append(stats['late_mean_us'] <= stats['late_max_us'])
+    threads = [threading.Thread(target=bus) for _ in range(4)]
+    for t in threads:
+        t.start()
+    metrics()
+    for t in threads:
+        t.join()
+    assert delay.stats()['calls'] == 4 * 2000
+    assert all(seen)
+
+    delay.reset_stats()
+    assert delay.stats() == dict(delay.stats(), calls=0, late_mean_us=0.0, late_max_us=0.0)
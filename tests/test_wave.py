@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from RPLCD import CharLCD, WaveBus, batched
+from RPLCD.fakes import FakePigpio
+from RPLCD.lcd import (RS_DATA, RS_INSTRUCTION, LCD_CLEARDISPLAY, WAVE_SETTLE_US, WAVE_HOME_US,
+                       WAVE_MAX_PULSES, Pulse)
+
+RS, E, DATA = 22, 23, [9, 25, 11, 8]
+
+
+def four_bit_bus():
+    pi = FakePigpio()
+    pi.lcd.four_bit = True  # As left by the CharLCD init sequence
+    return pi, WaveBus(pi=pi)
+
+
+def test_data_byte_pulses():
+    pi, bus = four_bit_bus()
+    bus.send(0x41, RS_DATA)
+    data = sum(1 << pin for pin in DATA)
+    # RS and the nibble set up with E low, E high for 1us, then E low for the settle time
+    high = 1 << RS | 1 << DATA[2]  # 0x4
+    low = 1 << RS | 1 << DATA[0]  # 0x1
+    assert pi.waves_sent == 1
+    assert pi.pulses_sent == 6
+    assert pi.wave_time_us == 3 + 2 + WAVE_SETTLE_US
+    assert pi.lcd.data == 1 and pi.lcd.ddram[0] == 0x41
+
+    pulses = []
+    bus._encode(pulses, 0x41, RS_DATA)
+    assert pulses == [
+        Pulse(high, data & ~high | 1 << E, 1), Pulse(1 << E, 0, 1), Pulse(0, 1 << E, 1),
+        Pulse(low, data & ~low | 1 << E, 1), Pulse(1 << E, 0, 1), Pulse(0, 1 << E, WAVE_SETTLE_US),
+    ]
+
+
+def test_clear_waits_longer():
+    pi, bus = four_bit_bus()
+    bus.send(LCD_CLEARDISPLAY, RS_INSTRUCTION)
+    assert pi.wave_time_us == 3 + 2 + WAVE_HOME_US
+    assert pi.lcd.commands == 1
+
+
+def test_eight_bit_bus():
+    pins = [2, 3, 4, 5, 6, 7, 9, 10]
+    pi = FakePigpio(pins_data=pins)
+    pi.lcd.four_bit = False
+    bus = WaveBus(pi=pi, pins_data=pins)
+    bus.send_many([(c, RS_DATA) for c in bytearray(b'ok')])
+    assert pi.pulses_sent == 6
+    assert bytes(pi.lcd.ddram[:2]) == b'ok'
+
+
+def test_long_batches_split():
+    pi, bus = four_bit_bus()
+    text = bytearray(b'x' * 0x28)
+    bus.send_many([(c, RS_DATA) for c in text] * 10)
+    assert pi.pulses_sent == 6 * 400
+    assert pi.waves_sent == -(-6 * 400 // WAVE_MAX_PULSES)
+
+
+def test_repaint_in_one_wave():
+    pi = FakePigpio()
+    lcd = CharLCD(bus=WaveBus(pi=pi))
+    frame = ['{:<20}'.format(c * 20) for c in 'ABCD']
+    waves, wire = pi.waves_sent, pi.wave_time_us
+    with batched(lcd):
+        for row, line in enumerate(frame):
+            lcd.cursor_pos = (row, 0)
+            lcd.write_string(line)
+    assert pi.lcd.lines() == frame
+    assert pi.waves_sent == waves + 1
+    # 80 characters and at most 4 cursor moves, under 4ms on the wire
+    assert pi.wave_time_us - wire <= 84 * (5 + WAVE_SETTLE_US)
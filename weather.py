@@ -0,0 +1,142 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+##################################
+#  Weather                       #
+#                                #
+#  Forecast / evapotranspiration #
+#  files dropped in a directory  #
+##################################
+
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import csv
+import datetime
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ForecastCache(object):
+    """Watering factor per day, read from the JSON and CSV files of a directory.
+
+    Any external process can drop files there, nothing is fetched from the
+    network. Each record has a ``date`` (YYYY-MM-DD) and any of ``rain_mm``,
+    ``et0_mm`` (reference evapotranspiration) or ``factor``:
+
+    - JSON: a list of records, or an object mapping dates to records
+    - CSV: a header line then one record per line
+
+    The files are parsed once into a date => factor dict, and parsed again
+    only when a file is added, removed or modified. ``factor`` is a dict
+    lookup and ``due`` only lets the directory be looked at every
+    ``check_interval`` seconds, so both cost O(1) per tick. ``load`` does
+    the I/O and the parsing without changing the cache, so that it can run
+    in an executor, then ``apply`` swaps its result in.
+
+    """
+
+    def __init__(self, directory, skip_rain=5, reference_et0=4, min_factor=0.5, max_factor=1.5,
+                 check_interval=60):
+        """
+        Args:
+            directory: Where the files are dropped.
+            skip_rain: Rain (mm) from which the watering is skipped.
+            reference_et0: ET0 (mm/day) for which durationOfWatering is right.
+            min_factor, max_factor: Bounds of the factor when not skipping.
+            check_interval: Seconds between two looks at the directory.
+        """
+        self.directory = directory
+        self.skip_rain = skip_rain
+        self.reference_et0 = reference_et0
+        self.min_factor = min_factor
+        self.max_factor = max_factor
+        self.check_interval = check_interval
+
+        self.factors = {}  # datetime.date => factor
+        self._files = None  # {path: mtime} of the parsed files
+        self._checked_at = None
+
+    # Returns the factor to apply to the watering of the given date, 0 to skip it
+    def factor(self, date):
+        return self.factors.get(date, 1.0)
+
+    # Returns True at most once per check_interval, when the directory is to be looked at
+    def due(self, now=None):
+        now = time.monotonic() if now is None else now
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        return True
+
+    # Parses the files again if they changed since the last check
+    def refresh(self, now=None):
+        if not self.due(now):
+            return False
+        loaded = self.load()
+        if loaded is None:
+            return False
+        self.apply(loaded)
+        return True
+
+    # Returns (files, factors) for apply(), None when the files did not change
+    def load(self):
+        files = self.scan()
+        if files == self._files:
+            return None
+
+        factors = {}
+        # Newest files last, so they win on overlapping dates
+        for path in sorted(files, key=files.get):
+            try:
+                for record in self.read(path):
+                    date = datetime.datetime.strptime(record['date'], '%Y-%m-%d').date()
+                    factors[date] = self.compute_factor(record)
+            except (IOError, OSError, ValueError, KeyError, TypeError) as e:
+                logger.warning('Ignoring weather file %s: %s', path, e)
+        return files, factors
+
+    def apply(self, loaded):
+        self._files, self.factors = loaded
+        logger.info('Weather data loaded for %d days', len(self.factors))
+
+    # Returns {path: mtime} for the weather files of the directory
+    def scan(self):
+        files = {}
+        try:
+            for name in os.listdir(self.directory):
+                if name.endswith(('.json', '.csv')):
+                    path = os.path.join(self.directory, name)
+                    files[path] = os.stat(path).st_mtime
+        except OSError:
+            pass
+        return files
+
+    # Returns the records of a file
+    def read(self, path):
+        with open(path) as f:
+            if path.endswith('.csv'):
+                return list(csv.DictReader(f))
+
+            data = json.load(f)
+            if isinstance(data, dict):
+                return [dict(record, date=date) for date, record in data.items()]
+            return data
+
+    def compute_factor(self, record):
+        if record.get('factor') not in (None, ''):
+            return max(float(record['factor']), 0.0)
+
+        rain = float(record.get('rain_mm') or 0)
+        if rain >= self.skip_rain:
+            return 0.0
+
+        if record.get('et0_mm') not in (None, ''):
+            # Water what evaporates and the rain did not bring
+            factor = (float(record['et0_mm']) - rain) / self.reference_et0
+        else:
+            factor = 1 - rain / self.skip_rain
+        return min(max(factor, self.min_factor), self.max_factor)